@@ -1,9 +1,7 @@
-import datetime
 import logging
 import os
 from typing import Optional
 
-import bungio
 import discord
 from bungio.models import AuthData
 from discord.ext import commands, tasks
@@ -14,10 +12,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ORM import engine, Base
 from ORM.schemes.CogConfig import CogConfig
 from ORM.schemes.Token import Token, TokenType
+from utils.bungie_scheduler import background_requests
 from utils.bungio_client import CustomClient
 from utils.error_handlers import on_command_error, on_application_command_error
+from utils.image_fetcher import image_fetcher
 from utils.logger import create_logger
-from utils.tokens import get_encode_key, encode_key, sym_encrypt, sym_decrypt
+from utils.manifest_mirror import manifest_mirror
+from utils.token_manager import TokenManager, defer_token_save
+from utils.tokens import get_derived_key, sym_encrypt
 
 load_dotenv(override=True)
 
@@ -38,36 +40,13 @@ class ElderLyBot(commands.Bot):
         self.main_guild_id = os.getenv('DISCORD_GUILD_ID', None)
         self.db_engine = engine
         self.bungio_client = self.BungioClient(self.db_engine)
-        self.auth_data = {}
+        self.token_manager = TokenManager(self.db_engine)
 
         self.tree.on_error = on_application_command_error
         self.on_command_error = on_command_error
 
     async def get_valid_auth(self, bungie_id):
-        if bungie_id in self.auth_data:
-            return self.auth_data[bungie_id]
-        async with AsyncSession(self.db_engine) as session:
-            token = await session.scalars(select(Token).where(Token.bungie_id == bungie_id))
-            try:
-                token = list(token)[0]
-            except IndexError:
-                return None
-        encode_key_value = await get_encode_key(token.bungie_id)
-        key = encode_key(key_value=encode_key_value)
-        refresh_token = sym_decrypt(token.token, key)
-        # Работает
-        ad = AuthData(refresh_token=refresh_token,
-                      refresh_token_expiry=bungio.utils.get_now_with_tz(),
-                      membership_type=254,
-                      membership_id=token.bungie_id,
-                      token='',
-                      token_expiry=bungio.utils.get_now_with_tz() - datetime.timedelta(minutes=10),
-                      bungie_name=None
-                      )
-
-        await ad.refresh()
-        self.auth_data[ad.membership_id] = ad
-        return ad
+        return await self.token_manager.get_valid_auth(bungie_id)
 
     class BungioClient(CustomClient):
         def __init__(self, db_engine, *args, **kwargs):
@@ -76,8 +55,9 @@ class ElderLyBot(commands.Bot):
 
         async def on_token_update(self, before: Optional[AuthData], after: AuthData) -> None:
             await super().on_token_update(before=before, after=after)
-            encode_key_value = await get_encode_key(after.membership_id)
-            key = encode_key(key_value=encode_key_value)
+            if defer_token_save.get():
+                return
+            key = await get_derived_key(after.membership_id)
             refresh_token = sym_encrypt(after.refresh_token, key)
             token = Token(bungie_id=int(after.membership_id),
                           token=refresh_token,
@@ -123,7 +103,8 @@ class ElderLyBot(commands.Bot):
         logger.info('Ready!')
         logger.info(f'Logged in as ----> {self.user}')
         logger.info(f'ID: {self.user.id}')
-        self.clear_old_auth.start()
+        self.refresh_auth.start()
+        self.check_manifest.start()
         logger.info('Tasks started!')
 
     async def setup_hook(self) -> None:
@@ -141,11 +122,26 @@ class ElderLyBot(commands.Bot):
         #     self.tree.copy_global_to(guild=guild)
         #     await self.tree.sync(guild=guild)
 
-    @tasks.loop(minutes=10)
-    async def clear_old_auth(self):
-        new_auth_data = {}
-        for bungie_id in self.auth_data:
-            t: AuthData = self.auth_data[bungie_id]
-            if t.token_expiry > bungio.utils.get_now_with_tz():
-                new_auth_data[bungie_id] = t
-        self.auth_data = new_auth_data
+    async def close(self) -> None:
+        await image_fetcher.close()
+        await super().close()
+
+    @tasks.loop(hours=1)
+    async def check_manifest(self):
+        # Обновление локальной копии манифеста в фоне, чтения определений не ждут сеть
+        try:
+            with background_requests():
+                updated = await manifest_mirror.check_version(self.bungio_client)
+            if updated:
+                await self.bungio_client.on_manifest_update()
+        except Exception as e:
+            logger.exception(e)
+
+    @tasks.loop(minutes=1)
+    async def refresh_auth(self):
+        # Токены активных аккаунтов обновляются заранее, команды не ждут обновления
+        try:
+            with background_requests():
+                await self.token_manager.refresh_expiring()
+        except Exception as e:
+            logger.exception(e)
@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import create_async_engine
 from .schemes.User import *
 from .schemes.Token import *
 from .schemes.Clan import *
+from .schemes.ClanRoster import *
 from .schemes.CogConfig import *
 from .schemes.Meeting import *
 from .schemes.Voice import *
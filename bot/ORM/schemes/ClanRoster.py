@@ -0,0 +1,16 @@
+from sqlalchemy import Column
+from sqlalchemy.dialects.postgresql import BIGINT, INTEGER, TEXT, TIMESTAMP, JSONB
+
+from ORM.Base import Base
+
+
+class ClanRoster(Base):
+    __tablename__ = "clans_rosters"
+
+    clan_id = Column(BIGINT, primary_key=True, autoincrement=False)
+    # Сырые данные GroupMember в формате Bungie API
+    members = Column(JSONB, nullable=False, server_default='[]')
+    members_count = Column(INTEGER, nullable=False, server_default='0')
+    fingerprint = Column(TEXT, nullable=True)
+    fetched_at = Column(TIMESTAMP, nullable=False, server_default='now()')
+    changed_at = Column(TIMESTAMP, nullable=False, server_default='now()')
@@ -263,6 +263,18 @@ class RolesTree(Base):
         return result
 
 
+class RolesSyncCheckpoint(Base):
+    __tablename__ = 'roles_sync_checkpoints'
+
+    job_name = Column(TEXT, primary_key=True)
+    # Последний discord_id, для которого проверка завершена (пользователи обходятся по возрастанию discord_id)
+    last_discord_id = Column(BIGINT, nullable=True, default=None)
+    processed = Column(INTEGER, nullable=False, server_default='0')
+    started_at = Column(TIMESTAMP, nullable=False, server_default=now())
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=now())
+    finished_at = Column(TIMESTAMP, nullable=True, default=None)
+
+
 async def get_all_nodes(engine):
     async with AsyncSession(engine, expire_on_commit=False) as session:
         nodes = list(await session.scalars(select(RolesTree)))
@@ -41,6 +41,7 @@ class Voice(Base):
                           index=True)
     author_id = Column(BIGINT, nullable=True)
     created_at = Column(TIMESTAMP, nullable=False, server_default=now())
+    delete_at = Column(TIMESTAMP, nullable=True)
 
     category = relationship(
         'VoiceCategory',
@@ -0,0 +1,62 @@
+"""
+Бенчмарк подсчета неактива в ClanTableStats на синтетических составах кланов.
+
+Запуск из каталога bot: python -m benchmarks.clan_table_stats
+"""
+import datetime
+import random
+import timeit
+from types import SimpleNamespace
+
+from bungio.models import RuntimeGroupMemberType
+
+from utils.clan_stats_utils import ClanTableStats
+
+CLANS = 100
+MEMBERS = 100
+REPEAT = 5
+
+
+def create_rosters(clans=CLANS, members=MEMBERS):
+    now = int(datetime.datetime.now().timestamp())
+    member_types = [RuntimeGroupMemberType.MEMBER] * 8 + [RuntimeGroupMemberType.ADMIN]
+    rosters = []
+    for _ in range(clans):
+        roster = [SimpleNamespace(last_online_status_change=now - random.randint(0, 60 * 24 * 60 * 60),
+                                  member_type=random.choice(member_types))
+                  for _ in range(members - 1)]
+        roster.append(SimpleNamespace(last_online_status_change=now,
+                                      member_type=RuntimeGroupMemberType.FOUNDER))
+        rosters.append(roster)
+    return rosters
+
+
+def legacy_stats(members_list, timestamp: datetime.datetime):
+    # Прежняя реализация: четыре пересчета интервала на каждого участника
+    result = [0, 0, 0, 0]
+    timestamp = int(timestamp.timestamp())
+    for member in members_list:
+        for i, threshold in enumerate(ClanTableStats.INACTIVE_THRESHOLDS.values()):
+            if abs(timestamp - int(member.last_online_status_change)) > threshold:
+                result[i] += 1
+    return result
+
+
+def main():
+    rosters = create_rosters()
+    timestamp = datetime.datetime.now()
+
+    for roster in rosters:
+        assert list(ClanTableStats(roster, timestamp).inactive.values()) == legacy_stats(roster, timestamp)
+
+    legacy = min(timeit.repeat(lambda: [legacy_stats(roster, timestamp) for roster in rosters],
+                               number=1, repeat=REPEAT))
+    vectorized = min(timeit.repeat(lambda: [ClanTableStats(roster, timestamp) for roster in rosters],
+                                   number=1, repeat=REPEAT))
+    print(f'{CLANS} кланов x {MEMBERS} участников')
+    print(f'Прежний цикл: {legacy * 1000:.2f} мс')
+    print(f'NumPy:        {vectorized * 1000:.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
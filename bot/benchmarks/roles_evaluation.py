@@ -0,0 +1,98 @@
+"""
+Бенчмарк проверки требований к ролям на синтетических группах и профилях.
+Сравнивается прежняя схема (копирование групп и повтор проходов до стабилизации ролей)
+и скомпилированный план с одним проходом.
+
+Запуск из каталога bot: python -m benchmarks.roles_evaluation
+"""
+import random
+import timeit
+from copy import deepcopy
+from types import SimpleNamespace
+
+from ORM.schemes.Roles import RoleRequirementGroup, RequirementTriumphScore, RequirementMetricScore, \
+    RequirementHistoricalStat, RequirementRole, RequirementStatement, HistoricalStatsGroup, \
+    RequirementObjectivesValues
+from utils.Roles.plan import RequirementsPlan, ProfileData, get_group_requirements, EVALUATORS
+
+GROUPS = 40
+USERS = 200
+REPEAT = 5
+
+
+def create_groups(count=GROUPS):
+    groups = {}
+    for group_id in range(1, count + 1):
+        group = RoleRequirementGroup(group_id=group_id, role_id=1000 + group_id, sort_key=group_id)
+        group.requirements_TriumphScore.append(
+            RequirementTriumphScore(statement=RequirementStatement.MORE_OR_EQUAL, value=random.randint(0, 50000)))
+        group.requirements_MetricScore.append(
+            RequirementMetricScore(metric_hash=random.randint(1, 20), statement=RequirementStatement.MORE,
+                                   value=random.randint(0, 500)))
+        group.requirements_HistoricalStat.append(
+            RequirementHistoricalStat(historical_stat_group=HistoricalStatsGroup.ALL_PVE,
+                                      historical_stat_name='activitiesCleared',
+                                      statement=RequirementStatement.MORE_OR_EQUAL, value=random.randint(0, 3000)))
+        group.requirements_ObjectivesValues.append(
+            RequirementObjectivesValues(objective_hash=random.randint(1, 20), statement=RequirementStatement.MORE,
+                                        value=random.randint(0, 500)))
+        # Цепочки ролей: часть групп требует роль одной из предыдущих групп
+        if group_id > 1 and random.random() < 0.5:
+            group.requirements_Role.append(RequirementRole(role_id=1000 + random.randint(1, group_id - 1)))
+        groups[group_id] = group
+    # Порядок словаря как у выборки из базы: зависимые группы могут стоять раньше требуемых
+    return dict(reversed(list(groups.items())))
+
+
+def create_profile():
+    metrics = SimpleNamespace(data=SimpleNamespace(metrics={
+        metric_hash: SimpleNamespace(objective_progress=SimpleNamespace(
+            objective_hash=metric_hash, progress=random.randint(0, 1000), complete=False, completion_value=1000))
+        for metric_hash in range(1, 21)}))
+    records = SimpleNamespace(data=SimpleNamespace(active_score=random.randint(0, 60000), records={
+        1: SimpleNamespace(objectives=[], interval_objectives=[])}))
+    stats = {'allPvE': SimpleNamespace(all_time={
+        'activitiesCleared': SimpleNamespace(basic=SimpleNamespace(value=random.randint(0, 5000)))})}
+    return metrics, records, stats
+
+
+def legacy_evaluate(plan: RequirementsPlan, roles_requirements, metrics, records, stats):
+    # Прежняя схема: копия каждой группы на каждом проходе, пока набор ролей меняется
+    user_roles = set()
+    while True:
+        roles_before = set(user_roles)
+        results = []
+        profile = ProfileData(metrics, records, stats, plan.index_objectives(metrics, records), user_roles)
+        for group in roles_requirements.values():
+            group = deepcopy(group)
+            completed = all(EVALUATORS[type(requirement)](plan, requirement, profile).completed
+                            for requirement in get_group_requirements(group))
+            if completed:
+                user_roles.add(group.role_id)
+            else:
+                user_roles.discard(group.role_id)
+            results.append(completed)
+        if user_roles == roles_before:
+            return results
+
+
+def main():
+    roles_requirements = create_groups()
+    plan = RequirementsPlan(roles_requirements, {})
+    profiles = [create_profile() for _ in range(USERS)]
+
+    for metrics, records, stats in profiles:
+        compiled = [result.completed for result in plan.evaluate(metrics, records, stats, [])]
+        assert compiled == legacy_evaluate(plan, roles_requirements, metrics, records, stats)
+
+    legacy = min(timeit.repeat(lambda: [legacy_evaluate(plan, roles_requirements, *profile) for profile in profiles],
+                               number=1, repeat=REPEAT))
+    compiled = min(timeit.repeat(lambda: [plan.evaluate(*profile, []) for profile in profiles],
+                                 number=1, repeat=REPEAT))
+    print(f'{GROUPS} групп требований x {USERS} пользователей')
+    print(f'Прежняя схема: {legacy / USERS * 1000:.3f} мс на пользователя')
+    print(f'План:          {compiled / USERS * 1000:.3f} мс на пользователя')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,11 +9,13 @@ from discord import app_commands, Permissions, Interaction, SelectOption
 from discord.ext.commands import Context
 
 from utils.ClanAdmin.share import InviteButton
+from utils.bungie_scheduler import background_requests
+from utils.profile_cache import profile_cache
 from utils.CustomCog import CustomCog
 from utils.db_utils import get_full_clans_ids
 from utils.logger import create_logger
 
-from utils.tokens import encode_key, get_encode_key, sym_encrypt
+from utils.tokens import get_derived_key, sym_encrypt
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -54,8 +56,7 @@ async def insert_user_in_main_table(db_engine, discord_id: int, bungie_id: int):
 
 
 async def insert_extended_data(db_engine, discord_id: int, bungie_data, extended=True):
-    encode_key_value = await get_encode_key(bungie_data['membership_id'])
-    key = encode_key(key_value=encode_key_value)
+    key = await get_derived_key(bungie_data['membership_id'])
     refresh_token = sym_encrypt(bungie_data['refresh_token'], key)
     token = Token(bungie_id=int(bungie_data['membership_id']),
                   discord_id=discord_id,
@@ -161,7 +162,8 @@ class AuthCog(CustomCog):
             'bot_requests_channel_id': 1128208145324453945,
             'rules_channel_id': 1128208145324453942,
             'reg_channel_id': 1128208145324453941,
-            'guardian_role_id': 1128208142124191773
+            'guardian_role_id': 1128208142124191773,
+            'refresh_tokens_concurrency': 10,
         }
 
     async def cog_load(self):
@@ -187,6 +189,9 @@ class AuthCog(CustomCog):
                                            int(message_json['discord']),
                                            message_json['bungie'],
                                            message_json['admin'])
+            # После регистрации данные аккаунта загружаются заново
+            profile_cache.invalidate(message_json['bungie']['membership_id'])
+            self.bot.token_manager.invalidate(message_json['bungie']['membership_id'])
             await self.process_registration(int(message_json['discord']),
                                             message_json['bungie'])
 
@@ -325,12 +330,12 @@ class AuthCog(CustomCog):
     @tasks.loop(hours=1.0)
     async def update_refresh_tokens(self):
         await self.bot.wait_until_ready()
-        async with AsyncSession(self.bot.db_engine) as session:
-            expire_date = datetime.datetime.now() + datetime.timedelta(weeks=1)
-            query = select(Token.bungie_id).where(Token.token_expire <= expire_date)
-            expire_tokens = list(await session.scalars(query))
-        for bungie_id in expire_tokens:
-            await self.bot.get_valid_auth(self.bot.db_engine, bungie_id)
+        try:
+            with background_requests():
+                await self.bot.token_manager.refresh_stored_tokens(
+                    concurrency=self.config.get('refresh_tokens_concurrency', 10))
+        except Exception as e:
+            logger.exception(e)
 
     @commands.hybrid_command(name='main', description='Выбрать основной аккаунт, если их привязано более одного')
     @app_commands.default_permissions(administrator=True)
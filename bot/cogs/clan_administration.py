@@ -31,6 +31,7 @@ from ORM.schemes.Token import Token
 from ORM.schemes.User import User
 from utils.CustomCog import CustomCog
 from utils.clan_stats_utils import get_clan_members
+from utils.roster_cache import invalidate_clan_members
 from ORM.schemes.Clan import Clan
 from utils.db_utils import parse_time, get_full_clans
 from utils.users_utils import get_clan_list_by_bungie_id, \
@@ -421,7 +422,7 @@ class ClanAdministration(CustomCog):
                                                 user=ctx.author,
                                                 minimal_seconds=time)
         clan_id, auth = await self.check_permissions(clan, ctx.author, 'cls_inac')
-        inactive_list = await get_inactives(clan_id=clan_id, inactive_time=time)
+        inactive_list = await get_inactives(clan_id=clan_id, inactive_time=time, db_engine=self.bot.db_engine)
         clan: GroupResponse = await DestinyClan(group_id=clan_id).get_group()
         pages = create_inactives_result_pages(time=time, result=inactive_list, clan=clan)
         if pages:
@@ -437,6 +438,7 @@ class ClanAdministration(CustomCog):
             await view.wait()
             if view.confirmed:
                 cleared_members = await clear_inactives(inactive_list=view.extra_data, auth_data=auth)
+                await invalidate_clan_members(clan_id, db_engine=self.bot.db_engine)
                 error = 0
                 for res in cleared_members:
                     if isinstance(cleared_members[res][1], BungieException):
@@ -469,7 +471,7 @@ class ClanAdministration(CustomCog):
                                                 minimal_seconds=time)
         clan_id, auth = await self.check_permissions(clan, ctx.author, 'cls_discord')
 
-        clan_members = await get_clan_members(clan_id=clan_id)
+        clan_members = await get_clan_members(clan_id=clan_id, db_engine=self.bot.db_engine)
         clan: GroupResponse = await DestinyClan(group_id=clan_id).get_group()
         bungie_id_list = [member.bungie_net_user_info.membership_id
                           for member in clan_members if member.bungie_net_user_info]
@@ -508,6 +510,7 @@ class ClanAdministration(CustomCog):
         await view.wait()
         if view.confirmed:
             cleared_members = await clear_discord(inactive_list=view.extra_data, auth_data=auth)
+            await invalidate_clan_members(clan_id, db_engine=self.bot.db_engine)
             error = 0
             for res in cleared_members:
                 if isinstance(cleared_members[res][1], BungieException):
@@ -12,6 +12,7 @@ from utils.logger import create_logger
 from ORM.schemes.Clan import Clan
 from utils.clan_stats_utils import create_stats_table, update_stats_in_google_sheets
 from utils.db_utils import get_full_clans
+from utils.bungie_scheduler import set_background_priority, bungie_scheduler
 
 logger = create_logger(__name__)
 
@@ -96,6 +97,7 @@ class ClanCog(commands.Cog):
     async def auto_update(self):
         logger.debug('auto_update')
         await self.bot.wait_until_ready()
+        set_background_priority()
         logger.info('Начало обновления статистики')
         try:
             table = await create_stats_table(self.bot.db_engine, await self.bot.fetch_guild(main_guild_id))
@@ -108,6 +110,16 @@ class ClanCog(commands.Cog):
         self.auto_update.restart()
         await interaction.response.send_message('Задача обновления статистики перезапущена')
 
+    @stats_group.command(name='bungie', description='Показывает состояние очереди запросов к Bungie')
+    async def stats_bungie_command(self, interaction: Interaction):
+        stats = bungie_scheduler.get_stats()
+        stats_table = [['Приоритет', 'В очереди', 'Запросов', 'Среднее ожидание', 'Макс. ожидание']]
+        for priority, wait in stats['wait'].items():
+            stats_table.append([priority, stats['queue_depth'][priority], wait['requests'],
+                                f"{wait['avg_wait']:.2f}", f"{wait['max_wait']:.2f}"])
+        await interaction.response.send_message(f"Активных запросов: {stats['active']}\n"
+                                                "```" + tabulate(stats_table) + "```")
+
 
 async def setup(bot):
     await bot.add_cog(ClanCog(bot))
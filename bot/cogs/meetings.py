@@ -1,7 +1,5 @@
-import asyncio
 import datetime
 import os
-from asyncio import sleep
 from typing import Union, List
 
 import discord
@@ -9,13 +7,14 @@ from discord import app_commands, Permissions, Interaction, RawMessageDeleteEven
 from discord.app_commands import Choice
 from discord.ext import commands, tasks
 from dotenv import load_dotenv
-from sqlalchemy import update, select, and_
+from sqlalchemy import update, select, and_, case, cast
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from ORM import MeetingChannel
 from ORM.schemes.Meeting import Meeting, MeetingStatus
 from utils.CustomCog import CustomCog
+from utils.deadline_scheduler import DeadlineScheduler
 from utils.Meetings.Embeds import init_channel_embed, create_embed
 from utils.Meetings.Views.CreateMeetingView import CreateMeetingView
 from utils.Meetings.Views.MeetingView import MeetingView, delete_meeting
@@ -41,8 +40,16 @@ class MeetingsCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.expire_scheduler = DeadlineScheduler(self.process_expired_meetings, name='meetings')
         self.check_expire_meetings.start()
 
+    async def cog_load(self) -> None:
+        self.expire_scheduler.start()
+
+    async def cog_unload(self) -> None:
+        self.check_expire_meetings.cancel()
+        self.expire_scheduler.stop()
+
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload: RawMessageDeleteEvent):
         # Меняет статус сбора на удаленный
@@ -58,48 +65,53 @@ class MeetingsCog(commands.Cog):
     @tasks.loop(minutes=check_expire_meetings_interval)
     async def check_expire_meetings(self):
         await self.bot.wait_until_ready()
+        # Сроки берутся с запасом в два интервала, чтобы сбор не пропал между проверками
+        horizon = datetime.datetime.now() + datetime.timedelta(minutes=2 * check_expire_meetings_interval)
+        async with AsyncSession(self.bot.db_engine) as session:
+            query = select(Meeting.meeting_id, Meeting.actual_until). \
+                where(and_(Meeting.actual_until <= horizon,
+                           Meeting.status.in_([MeetingStatus.ACTIVE, MeetingStatus.COMPLETED])))
+            expiring = (await session.execute(query)).all()
+        for meeting_id, actual_until in expiring:
+            if self.expire_scheduler.deadlines.get(meeting_id) != actual_until:
+                self.expire_scheduler.schedule(meeting_id, actual_until)
+
+    async def process_expired_meetings(self, meeting_ids: List[int]):
         async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
-            query = select(Meeting).options(
-                selectinload(Meeting.meeting_channel)
-            ).where(and_(Meeting.actual_until <= datetime.datetime.now() +
-                         datetime.timedelta(minutes=check_expire_meetings_interval),
-                         Meeting.status.in_([MeetingStatus.ACTIVE, MeetingStatus.COMPLETED])))
+            # Статус меняется только у сборов, которые еще не обработаны и не продлены
+            query = update(Meeting). \
+                where(and_(Meeting.meeting_id.in_(meeting_ids),
+                           Meeting.actual_until <= datetime.datetime.now(),
+                           Meeting.status.in_([MeetingStatus.ACTIVE, MeetingStatus.COMPLETED]))). \
+                values(status=case((Meeting.status == MeetingStatus.ACTIVE,
+                                    cast(MeetingStatus.DELETED_BY_OVERDUE, Meeting.status.type)),
+                                   else_=cast(MeetingStatus.DELETED_BY_COMPLETED, Meeting.status.type))). \
+                returning(Meeting.meeting_id). \
+                execution_options(synchronize_session=False)
+            expired_ids = list((await session.execute(query)).scalars())
+            await session.commit()
+            if not expired_ids:
+                return
+            query = select(Meeting).options(selectinload(Meeting.meeting_channel)). \
+                where(Meeting.meeting_id.in_(expired_ids))
             expired_meetings = list((await session.execute(query)).unique().scalars())
-        asyncio.create_task(self.process_expired_meetings(expired_meetings=expired_meetings))
-
-    async def process_expired_meetings(self, expired_meetings: List[Meeting]):
-        while True:
-            for meeting in expired_meetings:
-                if meeting.actual_until <= datetime.datetime.now():
-                    async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
-                        if meeting.status == MeetingStatus.ACTIVE:
-                            meeting.status = MeetingStatus.DELETED_BY_OVERDUE
-                        if meeting.status == MeetingStatus.COMPLETED:
-                            meeting.status = MeetingStatus.DELETED_BY_COMPLETED
-                        logger.info(f"Changed status {meeting.meeting_id}: {meeting.status}")
-                        await session.merge(meeting)
-                        await session.commit()
-                else:
-                    continue
-                try:
-                    await delete_meeting(self.bot, meeting)
-                except:
-                    pass
-                try:
-                    log_channel_id = self.bot.config.get('meetings_logs_channel', None)
-                    if log_channel_id:
-                        log_channel = await self.bot.get_guild(main_guild_id).fetch_channel(log_channel_id)
-                        if log_channel:
-                            embed = create_embed(meeting)
-                            await log_channel.send('Удаление сбора', embed=embed)
-                except:
-                    pass
-            await sleep(1)
-            if all([True if meeting.status in [MeetingStatus.DELETED_BY_COMPLETED,
-                                               MeetingStatus.DELETED_BY_OVERDUE,
-                                               MeetingStatus.DELETED_BY_OTHER_USER] else False
-                    for meeting in expired_meetings]):
-                break
+
+        log_channel_id = self.bot.config.get('meetings_logs_channel', None)
+        log_channel = self.bot.get_channel(log_channel_id) if log_channel_id else None
+        for meeting in expired_meetings:
+            logger.info(f"Changed status {meeting.meeting_id}: {meeting.status}")
+            try:
+                await delete_meeting(self.bot, meeting)
+            except:
+                pass
+            try:
+                if log_channel:
+                    embed = create_embed(meeting)
+                    await log_channel.send('Удаление сбора', embed=embed)
+            except:
+                pass
+        logger.info(f'Обработано истекших сборов: {len(expired_meetings)}, '
+                    f'планировщик: {self.expire_scheduler.get_stats()}')
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -1,6 +1,6 @@
 import datetime
-import io
 import os
+import time
 
 import discord
 from discord import app_commands, Permissions, Interaction
@@ -11,9 +11,10 @@ from utils.CustomCog import CustomCog
 from dotenv import load_dotenv
 
 from utils.Resets.lost_sectors import create_lost_sector_image
-from utils.Resets.resets_utils import LostSectorDrop, LostSector, get_current_rotation_day
-from utils.Resets.weekly import create_weekly_picture
+from utils.Resets.resets_utils import LostSector, get_current_rotation_day, lost_sectors_cache
+from utils.Resets.weekly import create_weekly_picture, create_weekly_static_layer
 from utils.get_last_reset import get_last_reset, get_last_reset_day
+from utils.image_encoder import encode_image
 from utils.logger import create_logger
 
 load_dotenv(override=True)
@@ -22,6 +23,9 @@ main_guild_id = int(os.getenv('DISCORD_GUILD_ID'))
 
 logger = create_logger(__name__)
 
+# Изображения ресетов содержат картинки из игры - палитра их портит, поэтому только сжатие без потерь
+resets_image_formats = ['webp']
+
 
 class ResetsCog(CustomCog):
     """Работает с игровыми ресетами."""
@@ -34,6 +38,8 @@ class ResetsCog(CustomCog):
             'chest': None,
             'head': None
         }
+        # Заранее отрисованные части ресетов: {'daily'/'weekly': (время ресета, PNG)}
+        self.prerendered: dict[str, tuple[datetime.datetime, bytes]] = {}
 
     async def init_config(self):
         self.config = {
@@ -49,6 +55,8 @@ class ResetsCog(CustomCog):
             'last_daily_post': 1691255100,
             'last_daily_message': None,
 
+            'prerender_before_reset_minutes': 60,
+
             'lost_sector_items': {
                 'legs': [1624882687,
                          511888814,
@@ -114,12 +122,11 @@ class ResetsCog(CustomCog):
             try:
                 channel = await self.bot.get_guild(main_guild_id).fetch_channel(self.config['resets_channel'])
                 auth = await self.bot.get_valid_auth(self.config['bungie_id_for_resets'])
-                image = await create_weekly_picture(client=self.bot.bungio_client, auth=auth)
-                with io.BytesIO() as image_binary:
-                    image.save(image_binary, 'PNG')
-                    image_binary.seek(0)
-                    new_weekly: discord.Message = await channel.send(file=discord.File(fp=image_binary,
-                                                                                       filename='weekly.png'))
+                image = await create_weekly_picture(client=self.bot.bungio_client, auth=auth,
+                                                    static_layer=self.pop_prerendered('weekly', get_last_reset()))
+                image = await encode_image(image, 'weekly',
+                                           formats=self.config.get('image_formats', resets_image_formats))
+                new_weekly: discord.Message = await channel.send(files=image.to_discord_files())
                 if self.config['last_weekly_message']:
                     try:
                         weekly_message: discord.Message = await channel.fetch_message(self.config['last_weekly_message'])
@@ -137,12 +144,12 @@ class ResetsCog(CustomCog):
         if self.config['resets_channel']:
             try:
                 channel = await self.bot.get_guild(main_guild_id).fetch_channel(self.config['resets_channel'])
-                image = await self.get_lost_sector_image()
-                with io.BytesIO() as image_binary:
-                    image.save(image_binary, 'PNG')
-                    image_binary.seek(0)
-                    sectors: discord.Message = await channel.send(file=discord.File(fp=image_binary,
-                                                                                    filename='image.png'))
+                image = self.pop_prerendered('daily', get_last_reset_day())
+                if image is None:
+                    image = await self.get_lost_sector_image()
+                image = await encode_image(image, 'lost_sectors',
+                                           formats=self.config.get('image_formats', resets_image_formats))
+                sectors: discord.Message = await channel.send(files=image.to_discord_files())
                 if self.config['last_daily_message']:
                     try:
                         sectors_message: discord.Message = await channel.fetch_message(self.config['last_daily_message'])
@@ -159,6 +166,7 @@ class ResetsCog(CustomCog):
     async def on_ready(self):
         await self.init_sectors_drop()
         self.check_resets.start()
+        self.prerender_resets.start()
 
     @tasks.loop(minutes=1)
     async def check_resets(self):
@@ -174,48 +182,69 @@ class ResetsCog(CustomCog):
         if current_last_reset - current_message_last_reset >= datetime.timedelta(days=1):
             await self.send_daily()
 
+    def pop_prerendered(self, name: str, reset: datetime.datetime) -> bytes | None:
+        # Заготовка подходит, только если была отрисована именно для этого ресета
+        prerendered = self.prerendered.pop(name, None)
+        if prerendered is None or prerendered[0] != reset:
+            return None
+        logger.info(f'Используется заранее отрисованный ресет {name} ({reset})')
+        return prerendered[1]
+
+    @tasks.loop(minutes=5)
+    async def prerender_resets(self):
+        now = datetime.datetime.now()
+        before_reset = datetime.timedelta(minutes=self.config.get('prerender_before_reset_minutes', 60))
+        next_resets = (('daily', get_last_reset_day() + datetime.timedelta(days=1)),
+                       ('weekly', get_last_reset() + datetime.timedelta(days=7)))
+        for name, next_reset in next_resets:
+            if next_reset - now > before_reset or self.prerendered.get(name, (None,))[0] == next_reset:
+                continue
+            # Ротации считаются на момент ресета (с запасом в минуту)
+            delta = int(next_reset.timestamp() - time.time()) + 60
+            try:
+                started_at = time.monotonic()
+                if name == 'daily':
+                    image = await self.get_lost_sector_image(delta=delta)
+                else:
+                    image = await create_weekly_static_layer(client=self.bot.bungio_client, delta=delta)
+                self.prerendered[name] = (next_reset, image)
+                logger.info(f'Ресет {name} ({next_reset}) отрисован заранее '
+                            f'за {time.monotonic() - started_at:.2f} сек.')
+            except Exception as e:
+                logger.exception(e)
+
     async def on_config_update(self):
         await self.load_config()
         await self.init_sectors_drop()
+        self.prerendered.clear()
 
     async def init_sectors_drop(self):
-        legs = LostSectorDrop(client=self.bot.bungio_client,
-                              name='Экзотическая броня для ног',
-                              icon_path='utils/assets/lost_sectors/armor/legs.png',
-                              items=self.config.get('lost_sector_items', {}).get('legs', [])
-                              )
-        await legs.init()
-        self.drop['legs'] = legs
-        hands = LostSectorDrop(client=self.bot.bungio_client,
-                               name='Экзотическая рукавицы',
-                               icon_path='utils/assets/lost_sectors/armor/hands.png',
-                               items=self.config.get('lost_sector_items', {}).get('hands', [])
-                               )
-        await hands.init()
-        self.drop['hands'] = hands
-        chest = LostSectorDrop(client=self.bot.bungio_client,
-                               name='Экзотический нагрудник',
-                               icon_path='utils/assets/lost_sectors/armor/chest.png',
-                               items=self.config.get('lost_sector_items', {}).get('chest', [])
-                               )
-        await chest.init()
-        self.drop['chest'] = chest
-        head = LostSectorDrop(client=self.bot.bungio_client,
-                              name='Экзотический шлем',
-                              icon_path='utils/assets/lost_sectors/armor/head.png',
-                              items=self.config.get('lost_sector_items', {}).get('head', [])
-                              )
-        await head.init()
-        self.drop['head'] = head
-
-    async def get_lost_sector_image(self):
+        lost_sectors_cache.validate(self.bot.bungio_client, self.config.get('lost_sector_rotation', {}))
+        drop_params = {
+            'legs': ('Экзотическая броня для ног', 'utils/assets/lost_sectors/armor/legs.png'),
+            'hands': ('Экзотическая рукавицы', 'utils/assets/lost_sectors/armor/hands.png'),
+            'chest': ('Экзотический нагрудник', 'utils/assets/lost_sectors/armor/chest.png'),
+            'head': ('Экзотический шлем', 'utils/assets/lost_sectors/armor/head.png'),
+        }
+        for drop_type, (name, icon_path) in drop_params.items():
+            self.drop[drop_type] = await lost_sectors_cache.get_drop(
+                client=self.bot.bungio_client,
+                name=name,
+                icon_path=icon_path,
+                items=self.config.get('lost_sector_items', {}).get(drop_type, []))
+
+    async def get_lost_sector_image(self, delta=0):
+        # Определения секторов берутся из кеша, пока не изменились манифест или ротация
+        lost_sectors_cache.validate(self.bot.bungio_client, self.config.get('lost_sector_rotation', {}))
+        if not all(self.drop.values()):
+            await self.init_sectors_drop()
         lost_sectors_to_render = {}
-        # На 4 дня (сегодня + 3 дня вперед)
+        # На 4 дня (сегодня + 3 дня вперед), delta - смещение в секундах для отрисовки следующего дня заранее
         for i in range(4):
             sector_rotation = get_current_rotation_day(count=len(self.config.get('lost_sector_rotation', [])),
-                                                       delta=i * 86400)
+                                                       delta=delta + i * 86400)
             sector_drop = get_current_rotation_day(count=len(self.config.get('lost_sector_drop_rotation', [])),
-                                                   delta=i * 86400)
+                                                   delta=delta + i * 86400)
             sector_drop_obj = self.drop[self.config.get('lost_sector_drop_rotation')[str(sector_drop)]]
             lost_sectors_to_render[i] = LostSector(client=self.bot.bungio_client,
                                                    activity_hash=
@@ -225,8 +254,9 @@ class ResetsCog(CustomCog):
                                                    )
             await lost_sectors_to_render[i].init()
         image = await create_lost_sector_image(client=self.bot.bungio_client,
-                                               date=datetime.datetime.now(),
+                                               date=datetime.datetime.now() + datetime.timedelta(seconds=delta),
                                                lost_sectors=lost_sectors_to_render)
+        logger.debug(f'Кеш секторов: {lost_sectors_cache.get_stats()}')
         return image
 
     resets_group = app_commands.Group(name="resets",
@@ -22,21 +22,22 @@
 
 
 """
-import io
+import asyncio
+import datetime
+import hashlib
 import logging
 import os
 import time
-from copy import copy, deepcopy
-from typing import Union, List
+from typing import Union, List, Dict
 
 import bungio.models.base
 import discord
-from PIL import Image
 from bungio.error import BungieException
 from bungio.models import DestinyMetricDefinition, DestinyRecordDefinition, DestinyHistoricalStatsDefinition, \
     DestinyObjectiveDefinition
 from discord import app_commands, Interaction, Permissions, WebhookMessage
-from discord.ext import commands
+from discord.ext import commands, tasks
+from cachetools import TTLCache
 from discord.webhook.async_ import MISSING
 from dotenv import load_dotenv
 from sqlalchemy import select, delete, or_, update
@@ -49,14 +50,26 @@ from ORM.schemes.Roles import RoleRequirementGroup, RequirementHistoricalStat, R
     RequirementObjectivesCompleted, get_all_nodes, RolesTree, RequirementObjectivesValues
 from utils.CustomCog import CustomCog
 from utils.Roles.roles import get_roles_requirements, render_new_requirements_group, render_requirements_group, \
-    render_requirements_group_image, \
-    validate_requirements, RoleSelectorView
+    render_requirements_group_image, RoleSelectorView, warm_requirements_definitions, get_result_roles, \
+    get_requirements_group_data, render_requirements_groups_image
+from utils.Roles.plan import RequirementsPlan, GroupResult, compile_requirements_plan
+from utils.Roles.sync import sync_roles, get_last_finished_at
+from utils.bungie_scheduler import measure_responses
+from utils.image_encoder import EncodedImage, encode_image
 from utils.logger import create_logger
-from utils.users_utils import get_user_stats, get_main_bungie_id_by_discord_id
+from utils.manifest_cache import definitions_cache
+from utils.users_utils import get_user_stats, get_main_bungie_id_by_discord_id, USER_STATS_COMPONENTS, \
+    USER_STATS_GROUPS
 
 load_dotenv(override=True)
 logger = create_logger(__name__)
 main_guild_id = int(os.getenv('DISCORD_GUILD_ID'))
+roles_sync_interval_hours = 6
+# Сколько /game roles вычисляется одновременно, остальные ждут в очереди
+game_roles_concurrency = 4
+game_roles_cache_ttl = 600
+# Черный фон и белый текст хорошо сжимаются без потерь; слишком длинный список режется на части
+roles_image_formats = ['webp', 'tiles']
 
 
 def create_reaction_roles_embed(roles_list):
@@ -68,14 +81,33 @@ def create_reaction_roles_embed(roles_list):
     return emb
 
 
+class GameRolesResult:
+    __slots__ = ('fingerprint', 'image', 'result_roles_list')
+
+    def __init__(self, fingerprint: str, image: EncodedImage | None, result_roles_list: List[int]):
+        self.fingerprint = fingerprint
+        self.image = image
+        self.result_roles_list = result_roles_list
+
+
 class RolesCog(CustomCog):
     """Тестовый модуль"""
 
     def __init__(self, bot):
         super().__init__(bot)
         self.roles_requirements = {}
+        self.requirements_plan = RequirementsPlan({}, {})
         self.roles_trees = {}
         self.roles_list = []
+        # Версия требований - результаты /game roles, посчитанные для старой версии, не используются
+        self.requirements_version = 0
+        self.game_roles_results = TTLCache(maxsize=1024, ttl=game_roles_cache_ttl)
+        self._game_roles_pending: Dict[int, asyncio.Future] = {}
+        self.game_roles_semaphore = asyncio.Semaphore(game_roles_concurrency)
+        self._roles_data_pending: asyncio.Future | None = None
+        # Ручной запуск проверки не пропускается из-за недавно завершенной
+        self.roles_sync_forced = False
+        self.auto_sync_roles.start()
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -93,8 +125,7 @@ class RolesCog(CustomCog):
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await self.update_roles_requirements()
-        await self.update_roles_trees()
+        await asyncio.shield(self.update_roles_data())
         while True:
             roles_list = []
             for role_id in self.config['reaction_roles']:
@@ -116,14 +147,69 @@ class RolesCog(CustomCog):
         await self.update_roles_trees()
         return role
 
+    def update_roles_data(self) -> asyncio.Future:
+        # on_ready и автопроверка ролей ждут одну загрузку требований и деревьев ролей
+        if self._roles_data_pending is None or self._roles_data_pending.done():
+            self._roles_data_pending = asyncio.ensure_future(self._update_roles_data())
+        return self._roles_data_pending
+
+    async def _update_roles_data(self):
+        await self.update_roles_requirements()
+        await self.update_roles_trees()
+
     async def update_roles_trees(self):
         self.roles_trees = {node.role_id: node for node in await get_all_nodes(self.bot.db_engine)}
 
     async def update_roles_requirements(self):
-        self.roles_requirements = await get_roles_requirements(self.bot.db_engine)
+        roles_requirements = await get_roles_requirements(self.bot.db_engine)
+        try:
+            await warm_requirements_definitions(roles_requirements, client=self.bot.bungio_client)
+        except Exception as e:
+            logger.exception(e)
+        try:
+            requirements_plan = await compile_requirements_plan(roles_requirements, client=self.bot.bungio_client)
+        except Exception as e:
+            # Без определений целей план все равно проверяет требования, только без их оформления из манифеста
+            logger.exception(e)
+            requirements_plan = RequirementsPlan(roles_requirements, {})
+        self.roles_requirements, self.requirements_plan = roles_requirements, requirements_plan
+        self.requirements_version += 1
+        self.game_roles_results.clear()
+
+    @tasks.loop(hours=roles_sync_interval_hours)
+    async def auto_sync_roles(self):
+        await self.bot.wait_until_ready()
+        if not self.config.get('roles_sync_enabled', True):
+            return
+        forced, self.roles_sync_forced = self.roles_sync_forced, False
+        if self.auto_sync_roles.current_loop == 0 and not forced:
+            # После перезапуска бота не повторяем проверку, если предыдущая завершилась недавно
+            finished_at = await get_last_finished_at(self.bot.db_engine)
+            if finished_at and datetime.datetime.now() - finished_at < datetime.timedelta(
+                    hours=roles_sync_interval_hours):
+                logger.info(f'Проверка ролей пропущена: предыдущая завершена {finished_at}')
+                return
+        if not self.roles_requirements or not self.roles_trees:
+            await asyncio.shield(self.update_roles_data())
+        if not self.roles_requirements:
+            return
+        logger.info('Начало проверки ролей зарегистрированных пользователей')
+        try:
+            await sync_roles(self.bot.db_engine,
+                             client=self.bot.bungio_client,
+                             guild=self.bot.get_guild(main_guild_id),
+                             plan=self.requirements_plan,
+                             roles_trees=self.roles_trees,
+                             workers=self.config.get('roles_sync_workers', 5),
+                             grant=self.config.get('roles_sync_grant', False))
+        except Exception as e:
+            logger.exception(e)
 
     async def init_config(self):
         self.config = {
+            'roles_sync_enabled': True,
+            'roles_sync_workers': 5,
+            'roles_sync_grant': False,
             'roles_deny_unrole': [],
             'reaction_roles_channel_id': None,
             'reaction_roles_message_id': None,
@@ -279,6 +365,12 @@ class RolesCog(CustomCog):
             await session.commit()
             await interaction.response.send_message('Требование к роли удалено!')
 
+    @roles_management_group.command(name='sync', description='Перезапускает проверку ролей всех пользователей')
+    async def roles_sync_command(self, interaction: Interaction):
+        self.roles_sync_forced = True
+        self.auto_sync_roles.restart()
+        await interaction.response.send_message('Проверка ролей перезапущена')
+
     @roles_management_group.command(name='list', description='Список требований к ролям')
     @app_commands.describe(group_id='Идентификатор группы требований')
     async def show_requirements(self, interaction: Interaction, group_id: Union[int, None],
@@ -286,32 +378,17 @@ class RolesCog(CustomCog):
         await interaction.response.defer()
         await self.update_roles_requirements()
         if not group_id and not role:
-            new_image_x = []
-            new_image_y = 0
-            roles_images = []
+            groups_data = []
             for group_id in self.roles_requirements:
                 group: RoleRequirementGroup = self.roles_requirements[group_id]
-                image = await render_requirements_group_image(group,
-                                                              client=self.bot.bungio_client,
-                                                              guild=interaction.guild,
-                                                              need_id=True)
-                if not image:
-                    continue
-                roles_images.append(image)
-                new_image_x.append(image.size[0])
-                new_image_y += image.size[1]
-                new_image_y += 100
-            result_image = Image.new('RGBA', (max(new_image_x), new_image_y), (0, 0, 0, 255))
-            x, y = 0, 0
-            for image in roles_images:
-                result_image.paste(image, (x, y), mask=image)
-                y += image.size[1]
-                y += 100
-
-            with io.BytesIO() as image_binary:
-                result_image.save(image_binary, 'PNG')
-                image_binary.seek(0)
-                await interaction.followup.send(file=discord.File(fp=image_binary, filename='image.png'))
+                groups_data.append(await get_requirements_group_data(group,
+                                                                     client=self.bot.bungio_client,
+                                                                     guild=interaction.guild,
+                                                                     need_id=True))
+            result_image = await render_requirements_groups_image(groups_data)
+            if result_image:
+                result_image = await self.encode_image(result_image, 'requirements')
+                await interaction.followup.send(files=result_image.to_discord_files())
 
             return await interaction.followup.send(f'Список идентификаторов требований: '
                                                    f'{self.roles_requirements.keys()}')
@@ -322,10 +399,8 @@ class RolesCog(CustomCog):
                                                                  need_id=True)
             if not result_image:
                 return await interaction.followup.send('Эта группа требований не содержит трабований!')
-            with io.BytesIO() as image_binary:
-                result_image.save(image_binary, 'PNG')
-                image_binary.seek(0)
-                return await interaction.followup.send(file=discord.File(fp=image_binary, filename='image.png'))
+            result_image = await self.encode_image(result_image, 'requirements')
+            return await interaction.followup.send(files=result_image.to_discord_files())
         if role:
             result = []
             for req in self.roles_requirements:
@@ -430,11 +505,10 @@ class RolesCog(CustomCog):
                                               custom_text: Union[str, None]):
         await interaction.response.defer()
 
-        metric_definition = await self.bot.bungio_client.manifest.fetch(DestinyMetricDefinition, metric_hash)
+        metric_definition = await definitions_cache.fetch(self.bot.bungio_client, DestinyMetricDefinition, metric_hash)
         if not metric_definition:
             return await interaction.followup.send('Метрика с таким хешем не найдена!')
         else:
-            await metric_definition.fetch_manifest_information()
             metric_definition: DestinyMetricDefinition
             await interaction.followup.send(f'Выбранная метрика: {metric_definition.display_properties.name}\n'
                                             f'{metric_definition.display_properties.description}')
@@ -463,11 +537,10 @@ class RolesCog(CustomCog):
                                          custom_text: Union[str, None]):
         await interaction.response.defer()
 
-        record_definition = await self.bot.bungio_client.manifest.fetch(DestinyRecordDefinition, record_hash)
+        record_definition = await definitions_cache.fetch(self.bot.bungio_client, DestinyRecordDefinition, record_hash)
         if not record_definition:
             return await interaction.followup.send('Метрика с таким хешем не найдена!')
         else:
-            await record_definition.fetch_manifest_information()
             record_definition: DestinyRecordDefinition
             await interaction.followup.send(f'Выбранный триумф: {record_definition.display_properties.name}\n'
                                             f'{record_definition.display_properties.description}')
@@ -499,7 +572,7 @@ class RolesCog(CustomCog):
                                            custom_text: Union[str, None]):
         await interaction.response.defer()
 
-        historical_stats_definition = await self.bot.bungio_client.api.get_historical_stats_definition()
+        historical_stats_definition = await definitions_cache.get_historical_stats_definition(self.bot.bungio_client)
         stat_definition: DestinyHistoricalStatsDefinition = \
             historical_stats_definition.get(historical_stat_name, None)
         if not stat_definition:
@@ -535,11 +608,11 @@ class RolesCog(CustomCog):
                                                      custom_text: Union[str, None]):
         await interaction.response.defer()
 
-        objective_definition = await self.bot.bungio_client.manifest.fetch(DestinyObjectiveDefinition, objective_hash)
+        objective_definition = await definitions_cache.fetch(self.bot.bungio_client,
+                                                             DestinyObjectiveDefinition, objective_hash)
         if not objective_definition:
             return await interaction.followup.send('Цель с таким хешем не найдена!')
         else:
-            await objective_definition.fetch_manifest_information()
             await interaction.followup.send(f'Выбранная цель: {objective_definition.progress_description}')
 
         async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
@@ -568,11 +641,11 @@ class RolesCog(CustomCog):
                                                   custom_text: Union[str, None]):
         await interaction.response.defer()
 
-        objective_definition = await self.bot.bungio_client.manifest.fetch(DestinyObjectiveDefinition, objective_hash)
+        objective_definition = await definitions_cache.fetch(self.bot.bungio_client,
+                                                             DestinyObjectiveDefinition, objective_hash)
         if not objective_definition:
             return await interaction.followup.send('Цель с таким хешем не найдена!')
         else:
-            await objective_definition.fetch_manifest_information()
             await interaction.followup.send(f'Выбранная цель: {objective_definition.progress_description}')
 
         async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
@@ -593,6 +666,70 @@ class RolesCog(CustomCog):
                                     default_permissions=Permissions(8),
                                     )
 
+    async def encode_image(self, png: bytes, name: str) -> EncodedImage:
+        return await encode_image(png, name, formats=self.config.get('image_formats', roles_image_formats))
+
+    def get_results_fingerprint(self, groups_results: List[GroupResult]) -> str:
+        # Картинка и роли зависят только от результатов проверки требований - по ним и сравниваем
+        data = [(group_result.group.group_id, group_result.completed,
+                 [(type(requirement).__name__, requirement.requirement_id, result.completed, result.current,
+                   result.require)
+                  for requirement, result in group_result.requirements.items()])
+                for group_result in groups_results]
+        return hashlib.sha1(repr((self.requirements_version, data)).encode()).hexdigest()
+
+    async def compute_game_roles(self, member: discord.Member, bungie_id) -> GameRolesResult:
+        waited_at = time.monotonic()
+        async with self.game_roles_semaphore:
+            wait = time.monotonic() - waited_at
+            if wait > 1:
+                logger.debug(f'/game roles {member}: ожидание в очереди {wait:.2f} сек.')
+            plan = self.requirements_plan
+            with measure_responses() as responses:
+                metrics, records, stats = await get_user_stats(bungie_id, client=self.bot.bungio_client,
+                                                               components=plan.components,
+                                                               stat_groups=plan.stat_groups)
+            stat_groups = USER_STATS_GROUPS if plan.stat_groups is None else plan.stat_groups
+            logger.info(f'/game roles {member}: компоненты '
+                        f'{len(plan.components)} из {len(USER_STATS_COMPONENTS)}, группы статистики '
+                        f'{len(stat_groups)} из {len(USER_STATS_GROUPS)}; загружено {responses}')
+            groups_results = plan.evaluate(metrics=metrics,
+                                           records=records,
+                                           stats=stats,
+                                           user_roles=[r.id for r in member.roles])
+            fingerprint = self.get_results_fingerprint(groups_results)
+            cached: GameRolesResult | None = self.game_roles_results.get(member.id)
+            if cached and cached.fingerprint == fingerprint:
+                logger.debug(f'/game roles {member}: результат не изменился, картинка взята из кеша')
+                return cached
+
+            roles_for_user = []
+            groups_data = []
+            for group_result in groups_results:
+                if group_result.completed:
+                    roles_for_user.append(group_result.group.role_id)
+                groups_data.append(await get_requirements_group_data(group_result.group,
+                                                                     client=self.bot.bungio_client,
+                                                                     guild=member.guild,
+                                                                     result=group_result))
+            result_image = await render_requirements_groups_image(groups_data)
+            result_image = await self.encode_image(result_image, 'roles') if result_image else None
+            result_roles_list, _ = get_result_roles(roles_for_user, self.roles_trees)
+            result = GameRolesResult(fingerprint, result_image, result_roles_list)
+            self.game_roles_results[member.id] = result
+            return result
+
+    async def get_game_roles(self, member: discord.Member, bungie_id) -> GameRolesResult:
+        # Повторные вызовы пользователя, пока идет проверка, ждут ее результат
+        if member.id not in self._game_roles_pending:
+            self._game_roles_pending[member.id] = asyncio.ensure_future(self.compute_game_roles(member, bungie_id))
+        future = self._game_roles_pending[member.id]
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._game_roles_pending.pop(member.id, None)
+
     @game_group.command(name='roles')
     async def game_roles_command(self, interaction: Interaction):
         await interaction.response.defer()
@@ -600,7 +737,7 @@ class RolesCog(CustomCog):
             bungie_id = await get_main_bungie_id_by_discord_id(db_engine=self.bot.db_engine,
                                                                discord_id=interaction.user.id)
             if self.roles_requirements:
-                metrics, records, stats = await get_user_stats(bungie_id, client=self.bot.bungio_client)
+                game_roles = await self.get_game_roles(interaction.user, bungie_id)
             else:
                 return await interaction.followup.send('Нет ролей для выдачи!')
         except BungieException as e:
@@ -612,72 +749,7 @@ class RolesCog(CustomCog):
             embed = discord.Embed(title=name_field, colour=discord.Colour.green())
             embed.description = desc_text
             return await interaction.followup.send(embed=embed)
-        user_roles = [r.id for r in interaction.user.roles]
-
-        while True:
-            validated_groups = []
-            user_roles = list(set(user_roles))
-            user_roles_before_loop = copy(user_roles)
-            for group in self.roles_requirements:
-                validated, validated_group = await validate_requirements(metrics=metrics,
-                                                                         records=records,
-                                                                         stats=stats,
-                                                                         requirement_group=deepcopy(
-                                                                             self.roles_requirements[group]),
-                                                                         user_roles_list=user_roles,
-                                                                         client=self.bot.bungio_client)
-                validated_groups.append(validated_group)
-                if validated:
-                    user_roles.append(validated_group.role_id)
-                else:
-                    try:
-                        user_roles.remove(validated_group.role_id)
-                    except Exception as e:
-                        logger.exception(e)
-                        pass
-            if set(user_roles) == set(user_roles_before_loop):
-                break
-
-        new_image_x = []
-        new_image_y = 0
-        roles_for_user = []
-        roles_for_clear = []
-        roles_images = []
-        validated_groups.sort(key=lambda r_group: getattr(r_group, 'sort_key', 0))
-        for group in validated_groups:
-            group: RoleRequirementGroup
-            if getattr(group, 'completed', False):
-                roles_for_user.append(group.role_id)
-            else:
-                roles_for_clear.append(group.role_id)
-            image = await render_requirements_group_image(group,
-                                                          client=self.bot.bungio_client,
-                                                          guild=interaction.guild)
-            if not image:
-                continue
-            roles_images.append(image)
-            new_image_x.append(image.size[0])
-            new_image_y += image.size[1]
-            new_image_y += 100
-        result_image = Image.new('RGBA', (max(new_image_x), new_image_y), (0, 0, 0, 255))
-        x, y = 0, 0
-        for image in roles_images:
-            result_image.paste(image, (x, y), mask=image)
-            y += image.size[1]
-            y += 100
-
-        result_roles_list = []
-        upgrade_roles = []
-        for role_id in roles_for_user:
-            if role_id in self.roles_trees:
-                current_role_id = role_id
-                while self.roles_trees[current_role_id].parent and \
-                        self.roles_trees[current_role_id].parent.role_id in roles_for_user:
-                    upgrade_roles.append(current_role_id)
-                    current_role_id = self.roles_trees[current_role_id].parent.role_id
-                result_roles_list.append(current_role_id)
-            else:
-                result_roles_list.append(role_id)
+        result_image, result_roles_list = game_roles.image, game_roles.result_roles_list
 
         for group_id in self.roles_requirements:
             role_id = self.roles_requirements[group_id].role_id
@@ -699,12 +771,8 @@ class RolesCog(CustomCog):
                                     roles_ids_for_user=list(set(result_roles_list)))
         else:
             view = MISSING
-        with io.BytesIO() as image_binary:
-            result_image.save(image_binary, 'PNG')
-            image_binary.seek(0)
-            result: WebhookMessage = await interaction.followup.send(
-                file=discord.File(fp=image_binary, filename='image.png'),
-                view=view)
+        result: WebhookMessage = await interaction.followup.send(
+            files=result_image.to_discord_files() if result_image else MISSING, view=view)
         if view is not MISSING:
             await view.wait()
             for item in view.children:
@@ -1,4 +1,3 @@
-import asyncio
 import datetime
 import logging
 import os
@@ -11,7 +10,7 @@ from discord import app_commands, Interaction, Permissions, ChannelType
 from discord.abc import GuildChannel
 from discord.app_commands import Choice
 from discord.ext import commands, tasks
-from sqlalchemy import select, delete, and_, update
+from sqlalchemy import select, delete, and_, update, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from tabulate import tabulate
@@ -19,6 +18,7 @@ from tabulate import tabulate
 from ORM.schemes.Meeting import Meeting
 from ORM.schemes.Voice import VoiceCategory, Voice, VoiceChannelType
 from utils.CustomCog import CustomCog
+from utils.deadline_scheduler import DeadlineScheduler
 from utils.logger import create_logger
 from ORM.schemes.Clan import Clan
 
@@ -42,14 +42,85 @@ async def return_user(member: discord.Member, before=None, reason=None, message_
                 pass
 
 
+class VoicesIndex:
+    """
+    Категории и отслеживаемые голосовые каналы в памяти, а также время последнего созданного канала
+    каждого пользователя. Загружается при старте и обновляется при каждой записи в БД
+    """
+
+    def __init__(self):
+        self.categories: dict[int, VoiceCategory] = {}
+        self.voices: dict[int, Voice] = {}
+        self.last_created: dict[int, datetime.datetime] = {}
+
+    async def load(self, db_engine, cooldown: int):
+        cooldown_start = datetime.datetime.now() - datetime.timedelta(seconds=cooldown)
+        async with AsyncSession(db_engine, expire_on_commit=False) as session:
+            categories = list(await session.scalars(select(VoiceCategory)))
+            voices = list(await session.scalars(select(Voice).
+                                                where(Voice.channel_type != VoiceChannelType.DELETED)))
+            last_created = (await session.execute(select(Voice.author_id, func.max(Voice.created_at)).
+                                                  where(and_(Voice.author_id.is_not(None),
+                                                             Voice.created_at >= cooldown_start)).
+                                                  group_by(Voice.author_id))).all()
+        self.categories = {category.category_id: category for category in categories}
+        self.voices = {voice.channel_id: voice for voice in voices}
+        self.last_created = {author_id: created_at for author_id, created_at in last_created}
+        logger.info(f'Загружено категорий голосовых каналов: {len(self.categories)}, '
+                    f'каналов: {len(self.voices)}')
+
+    def add_category(self, category: VoiceCategory):
+        self.categories[category.category_id] = category
+
+    def add_voice(self, voice: Voice):
+        self.voices[voice.channel_id] = voice
+
+    def remove_voice(self, channel_id: int) -> Voice | None:
+        return self.voices.pop(channel_id, None)
+
+    def get_creator_category(self, channel_id: int) -> VoiceCategory | None:
+        voice = self.voices.get(channel_id)
+        if voice is None or voice.channel_type != VoiceChannelType.CREATOR:
+            return None
+        return self.categories.get(voice.category_id)
+
+    def is_temporary(self, channel_id: int) -> bool:
+        voice = self.voices.get(channel_id)
+        return voice is not None and voice.channel_type == VoiceChannelType.TEMPORARY
+
+    def check_cooldown(self, member_id: int, cooldown: int) -> bool:
+        """Возвращает True, если пользователь создавал канал менее cooldown секунд назад"""
+        last_created = self.last_created.get(member_id)
+        if last_created is None:
+            return False
+        if datetime.datetime.now() - last_created <= datetime.timedelta(seconds=cooldown):
+            return True
+        self.last_created.pop(member_id, None)
+        return False
+
+    def set_created(self, member_id: int):
+        self.last_created[member_id] = datetime.datetime.now()
+
+
 class Voices(CustomCog):
     """Модуль для управления голосовыми каналами"""
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.delete_voices_tasks = {
+        self.index = VoicesIndex()
+        self.delete_scheduler = DeadlineScheduler(self.delete_voices, name='voices')
 
-        }
+    async def cog_load(self) -> None:
+        await self.load_config()
+        await self.index.load(self.bot.db_engine, self.config.get('create_voice_cooldown', 0))
+        self.delete_scheduler.start()
+
+    async def cog_unload(self) -> None:
+        self.delete_scheduler.stop()
+
+    async def on_config_update(self):
+        await self.load_config()
+        await self.index.load(self.bot.db_engine, self.config.get('create_voice_cooldown', 0))
 
     async def init_config(self):
         self.config = {
@@ -92,26 +163,103 @@ class Voices(CustomCog):
             user_limit=voice_category.user_limit,
             bitrate=guild.bitrate_limit,
             overwrites=overwrites)
+        voice = Voice(channel_id=new_voice.id,
+                      category_id=voice_category.category_id,
+                      channel_type=VoiceChannelType.TEMPORARY,
+                      author_id=member.id)
         async with AsyncSession(self.bot.db_engine) as session:
-            voice = Voice(channel_id=new_voice.id,
-                          category_id=voice_category.category_id,
-                          author_id=member.id)
             await session.merge(voice)
             await session.commit()
+        self.index.add_voice(voice)
         await member.move_to(new_voice)
 
-    async def delete_voice_over_time(self, voice: discord.VoiceChannel):
-        await asyncio.sleep(self.config.get('delete_delay', 0))
-        if not voice.members:
-            await voice.delete()
-            self.delete_voices_tasks.pop(voice.id, None)
+    async def set_delete_at(self, channel_ids: List[int], delete_at: datetime.datetime | None):
+        if not channel_ids:
+            return
+        for channel_id in channel_ids:
+            voice = self.index.voices.get(channel_id)
+            if voice is not None:
+                voice.delete_at = delete_at
+        async with AsyncSession(self.bot.db_engine) as session:
+            await session.execute(update(Voice).where(Voice.channel_id.in_(channel_ids)).values(delete_at=delete_at))
+            await session.commit()
+
+    async def schedule_delete(self, channel_id: int, delete_at: datetime.datetime | None = None):
+        if delete_at is None:
+            delete_at = datetime.datetime.now() + datetime.timedelta(seconds=self.config.get('delete_delay', 0))
+            await self.set_delete_at([channel_id], delete_at)
+        self.delete_scheduler.schedule(channel_id, delete_at)
+
+    async def cancel_delete(self, channel_id: int):
+        if self.delete_scheduler.cancel(channel_id):
+            await self.set_delete_at([channel_id], None)
+
+    async def delete_voices(self, channel_ids: List[int]):
+        kept = []
+        for channel_id in channel_ids:
+            channel = self.bot.get_channel(channel_id)
+            if channel is None:
+                continue
+            if channel.members:
+                kept.append(channel_id)
+                continue
+            try:
+                await channel.delete()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                logger.warning(f'Не удалось удалить канал {channel}: {e}')
+                kept.append(channel_id)
+        # Удаленные каналы помечаются в on_guild_channel_delete
+        await self.set_delete_at(kept, None)
+        logger.debug(f'Удалено голосовых каналов: {len(channel_ids) - len(kept)}, '
+                     f'очередь: {self.delete_scheduler.get_stats()}')
+
+    async def reconcile_voices(self, guild: discord.Guild):
+        """Сверяет временные каналы из БД с сервером после перезапуска"""
+        now = datetime.datetime.now()
+        delay = datetime.timedelta(seconds=self.config.get('delete_delay', 0))
+        missing, occupied, new_delete = [], [], []
+        for voice in list(self.index.voices.values()):
+            if voice.channel_type != VoiceChannelType.TEMPORARY:
+                continue
+            channel = guild.get_channel(voice.channel_id)
+            if channel is None:
+                missing.append(voice.channel_id)
+            elif channel.members:
+                self.delete_scheduler.cancel(voice.channel_id)
+                if voice.delete_at is not None:
+                    occupied.append(voice.channel_id)
+            elif voice.channel_id not in self.delete_scheduler:
+                if voice.delete_at is None:
+                    new_delete.append(voice.channel_id)
+                else:
+                    self.delete_scheduler.schedule(voice.channel_id, voice.delete_at)
+        if missing:
+            for channel_id in missing:
+                self.index.remove_voice(channel_id)
+            async with AsyncSession(self.bot.db_engine) as session:
+                await session.execute(update(Voice).where(Voice.channel_id.in_(missing)).
+                                      values(channel_type=VoiceChannelType.DELETED, delete_at=None))
+                await session.commit()
+        await self.set_delete_at(occupied, None)
+        await self.set_delete_at(new_delete, now + delay)
+        for channel_id in new_delete:
+            self.delete_scheduler.schedule(channel_id, now + delay)
+        logger.info(f'Сверка голосовых каналов: удалены вне бота {len(missing)}, заняты {len(occupied)}, '
+                    f'поставлены в очередь на удаление {len(new_delete)}, всего в очереди '
+                    f'{len(self.delete_scheduler)}')
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: GuildChannel):
         if channel.type != ChannelType.voice:
             return
+        self.delete_scheduler.cancel(channel.id)
+        if self.index.remove_voice(channel.id) is None:
+            return
         async with AsyncSession(self.bot.db_engine) as session:
-            query = update(Voice).where(Voice.channel_id == channel.id).values(channel_type=VoiceChannelType.DELETED)
+            query = update(Voice).where(Voice.channel_id == channel.id). \
+                values(channel_type=VoiceChannelType.DELETED, delete_at=None)
             await session.execute(query)
             await session.commit()
 
@@ -120,13 +268,12 @@ class Voices(CustomCog):
         if member.bot:
             return
 
-        # Если канал находится в очереди на удаление - задача отменяется и удаляется
+        # Если канал находится в очереди на удаление - удаление отменяется
         if getattr(getattr(after, 'channel', None), 'id', None):
-            if after.channel.id in self.delete_voices_tasks:
+            if after.channel.id in self.delete_scheduler:
                 logger.debug(
                     f'{member} зашел в канал {after.channel}, который готовится к удалению. Удаление отменено!')
-                self.delete_voices_tasks[after.channel.id].cancel()
-                self.delete_voices_tasks.pop(after.channel.id, None)
+                await self.cancel_delete(after.channel.id)
 
         after_category_id = getattr(getattr(getattr(after, 'channel', None), 'category', None), 'id', None)
 
@@ -138,64 +285,42 @@ class Voices(CustomCog):
                                   message_text='В данной категории запрещено играть в Destiny 2!\n'
                                                'Используйте тематические каналы!')
 
-        if after_category_id:
-            async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
-                select_category_query = select(VoiceCategory). \
-                    where(VoiceCategory.category_id == after_category_id)
-                category = await session.scalar(select_category_query)
-                if category:
-                    select_creators_query = select(Voice). \
-                        where(and_(Voice.channel_type == VoiceChannelType.CREATOR,
-                                   Voice.category_id == category.category_id))
-                    creators = list(await session.scalars(select_creators_query))
-                    if after.channel.id in [creator.channel_id for creator in creators]:
-                        select_last_created_user_channel = select(Voice). \
-                            where(Voice.author_id == member.id). \
-                            order_by(Voice.created_at.desc()). \
-                            limit(1)
-                        last_created_voice: Voice | None = await session.scalar(select_last_created_user_channel)
-                        if last_created_voice and \
-                                datetime.datetime.now() - last_created_voice.created_at <= \
-                                datetime.timedelta(seconds=self.config.get('create_voice_cooldown', 0)):
-                            logger.info(f"Кулдаун создания голосового канала для {member}")
-                            await return_user(member=member,
-                                              before=before,
-                                              reason='Кулдаун создания голосовых каналов!',
-                                              message_text=f'Создавать голосовые каналы можно не чаще чем раз в '
-                                                           f'{self.config.get("create_voice_cooldown", 0)} секунд!')
-                        else:
-                            session.expunge_all()
-                            await session.rollback()
-                            await session.close()
-                            await self.create_voice(member=member, voice_category=category)
+        if after_category_id in self.index.categories:
+            category = self.index.get_creator_category(after.channel.id)
+            if category:
+                cooldown = self.config.get('create_voice_cooldown', 0)
+                if self.index.check_cooldown(member.id, cooldown):
+                    logger.info(f"Кулдаун создания голосового канала для {member}")
+                    await return_user(member=member,
+                                      before=before,
+                                      reason='Кулдаун создания голосовых каналов!',
+                                      message_text=f'Создавать голосовые каналы можно не чаще чем раз в '
+                                                   f'{cooldown} секунд!')
+                else:
+                    # Отмечается до создания - повторное событие во время создания попадет под кулдаун
+                    self.index.set_created(member.id)
+                    await self.create_voice(member=member, voice_category=category)
 
         if before.channel:
             if not before.channel.members:
                 await self.check_and_delete_if_require(before.channel)
 
     async def check_and_delete_if_require(self, channel: discord.VoiceChannel):
-        async with AsyncSession(self.bot.db_engine, expire_on_commit=False) as session:
-            select_category_query = select(Voice). \
-                where(Voice.channel_id == channel.id)
-            voice: Voice | None = await session.scalar(select_category_query)
-        if voice and voice.channel_type == VoiceChannelType.TEMPORARY:
+        if channel.id in self.delete_scheduler:
+            return True
+        if self.index.is_temporary(channel.id):
             logger.debug(f'Канал {channel} пуст. Создана задача на удаление.')
-            task = asyncio.create_task(self.delete_voice_over_time(channel))
-            self.delete_voices_tasks[channel.id] = task
+            await self.schedule_delete(channel.id)
             return True
         else:
             return False
 
     @commands.Cog.listener()
     async def on_ready(self):
-        pass
-        # guild: discord.Guild = await self.bot.fetch_guild(main_guild_id)
-        # all_channels = {channel.id: channel for channel in await guild.fetch_channels()}
         # Удаление пустых каналов после перезагрузки
-        # for channel in all_channels:
-        #     if all_channels[channel].type == ChannelType.voice:
-        #         if not all_channels[channel].members:
-        #             await self.check_and_delete_if_require(all_channels[channel])
+        guild = self.bot.get_guild(main_guild_id)
+        if guild is not None:
+            await self.reconcile_voices(guild)
 
     voices_group = app_commands.Group(name="voice",
                                       description="Команды управления голосовыми каналами",
@@ -260,18 +385,22 @@ class Voices(CustomCog):
             category_id=new_category.category_id
         )
 
+        permanent_voices = []
+        if not delete_current_voices:
+            permanent_voices = [Voice(channel_id=channel.id,
+                                      channel_type=VoiceChannelType.PERMANENT,
+                                      category_id=voices_category.id)
+                                for channel in voices_category.voice_channels]
+
         async with AsyncSession(self.bot.db_engine) as session:
             await session.merge(new_category)
-            if not delete_current_voices:
-                for channel in voices_category.voice_channels:
-                    voice = Voice(
-                        channel_id=channel.id,
-                        channel_type=VoiceChannelType.PERMANENT,
-                        category_id=voices_category.id
-                    )
-                    await session.merge(voice)
+            for voice in permanent_voices:
+                await session.merge(voice)
             await session.merge(new_voice)
             await session.commit()
+        self.index.add_category(new_category)
+        for voice in permanent_voices + [new_voice]:
+            self.index.add_voice(voice)
         await interaction.response.send_message('Новая категория создана!')
 
 
@@ -7,8 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from ORM.schemes.User import User, TransactionStatus, BalanceTransaction
 from utils.Balance.balance import transform_float_to_decimal
-from utils.clan_stats_utils import get_all_members_of_all_clans, get_registered_members_discord_ids, \
-    get_discord_members, get_tokens_for_clan_members, ClanTableSalaryStats
+from utils.clan_stats_utils import get_all_members_of_all_clans, get_discord_members, ClanTableSalaryStats, \
+    get_registrations_for_clans
 from utils.logger import create_logger
 
 logger = create_logger(__name__)
@@ -18,15 +18,14 @@ async def get_stats_for_salary(db_engine, guild: discord.Guild) -> Dict[int, Cla
     logger.info('Начало обновления статистики')
     timestamp = datetime.datetime.now()
     all_members_in_clans = await get_all_members_of_all_clans(db_engine)
+    all_registrations = await get_registrations_for_clans(db_engine, all_members_in_clans)
     all_stats = {}
     for clan in all_members_in_clans:
-        registered_admins = await get_tokens_for_clan_members(db_engine, all_members_in_clans[clan])
-        all_registered_users = await get_registered_members_discord_ids(db_engine, all_members_in_clans[clan])
-        discord_guild_members = await get_discord_members(guild, all_registered_users)
+        discord_guild_members = await get_discord_members(guild, all_registrations[clan].discord_ids)
         clan_table_stats = ClanTableSalaryStats(members_list=all_members_in_clans[clan],
                                                 timestamp=timestamp,
                                                 total_discord_members=discord_guild_members,
-                                                admins_tokens=registered_admins)
+                                                admins_tokens=all_registrations[clan].tokens)
         all_stats[clan] = clan_table_stats
     return all_stats
 
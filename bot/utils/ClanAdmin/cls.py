@@ -9,12 +9,7 @@ from bungio.models import DestinyClan, GroupMemberApplication, GroupApplicationR
     GroupMember, GroupMemberLeaveResult
 from itertools import islice
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from ORM.schemes.Token import Token
-from ORM.schemes.User import User
-from utils.clan_stats_utils import get_clan_members
+from utils.clan_stats_utils import get_clan_members, get_registrations_by_bungie_ids
 
 ON_PAGE = 10
 
@@ -65,8 +60,8 @@ def create_cls_inv_result_pages(result, clan: GroupResponse, on_page=ON_PAGE):
     return rendered_pages
 
 
-async def get_inactives(clan_id, inactive_time: datetime.timedelta) -> List[GroupMember]:
-    members: List[GroupMember] = await get_clan_members(clan_id)
+async def get_inactives(clan_id, inactive_time: datetime.timedelta, db_engine=None) -> List[GroupMember]:
+    members: List[GroupMember] = await get_clan_members(clan_id, db_engine=db_engine)
     inactive_list = []
     for member in members:
         if member.is_online:
@@ -159,13 +154,9 @@ class UnitedMember:
 
 
 async def check_discord_members(bungie_id_list: List[int], guild: discord.Guild, db_engine):
-    async with AsyncSession(db_engine) as session:
-        query = select(User.discord_id, User.bungie_id).where(User.bungie_id.in_(bungie_id_list))
-        users = await session.execute(query)
-        query = select(Token.discord_id, Token.bungie_id).where(Token.bungie_id.in_(bungie_id_list))
-        tokens = await session.execute(query)
-        registered = list(users) + list(tokens)
-    registered = list(set(registered))
+    users, tokens = await get_registrations_by_bungie_ids(db_engine, bungie_id_list)
+    registered = {(discord_id, bungie_id) for bungie_id, discord_id in users.items()}
+    registered |= {(token.discord_id, bungie_id) for bungie_id, token in tokens.items()}
     result = {}
     for reg in registered:
         print(reg)
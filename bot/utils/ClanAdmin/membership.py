@@ -12,7 +12,7 @@ async def search_user_by_bungie_id_in_clan(bungie_id, clan_id):
     memberships = await DestinyUser(membership_id=bungie_id, membership_type=254). \
         get_membership_data_by_id()
     memberships = memberships.destiny_memberships
-    clan_members = await get_clan_members(clan_id=clan_id)
+    clan_members = await get_clan_members(clan_id=clan_id, force=True)
     user_memberships = [membership.membership_id for membership in memberships]
     result = []
     for member in clan_members:
@@ -23,7 +23,7 @@ async def search_user_by_bungie_id_in_clan(bungie_id, clan_id):
 
 async def search_user_by_bungie_tag_in_clan(bungie_tag, clan_id, client):
     memberships = await search_destiny_players_by_full_tag(client=client, bungie_tag=bungie_tag)
-    clan_members = await get_clan_members(clan_id=clan_id)
+    clan_members = await get_clan_members(clan_id=clan_id, force=True)
     user_memberships = [membership.membership_id for membership in memberships]
     result = []
     for member in clan_members:
@@ -324,9 +324,7 @@ async def render_meeting(bot, meeting: Meeting):
 
 
 async def delete_meeting(bot, meeting: Meeting):
-    if meeting.planned:
-        channel = await bot.get_guild(main_guild_id).fetch_channel(meeting.meeting_channel.planned_channel_id)
-    else:
-        channel = await bot.get_guild(main_guild_id).fetch_channel(meeting.meeting_channel.channel_id)
-    message = await channel.fetch_message(meeting.meeting_id)
-    await message.delete()
+    channel_id = meeting.meeting_channel.planned_channel_id if meeting.planned else meeting.meeting_channel.channel_id
+    # Канал берется из кеша, сообщение удаляется без предварительной загрузки
+    channel = bot.get_channel(channel_id) or await bot.get_guild(main_guild_id).fetch_channel(channel_id)
+    await channel.get_partial_message(meeting.meeting_id).delete()
@@ -4,13 +4,14 @@ import time
 
 import discord
 from bungio.error import BungIOException
-from bungio.models import DestinyUser, DestinyComponentType, DestinyMetricComponent
+from bungio.models import DestinyComponentType, DestinyMetricComponent
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
 from ORM.schemes.Meeting import MeetingMember, MeetingChannel, MemberStatus, Meeting, MeetingStatus
 from utils.logger import create_logger
+from utils.profile_cache import profile_cache
 from utils.users_utils import get_main_bungie_id_by_discord_id, get_bungie_name_by_bungie_id, get_main_destiny_profile
 
 logger = create_logger(__name__)
@@ -51,24 +52,12 @@ async def create_meeting_member(db_engine, meeting: Meeting, discord_member: dis
     if bungie_id:
         try:
             bungie_name = await get_bungie_name_by_bungie_id(membership_id=bungie_id, membership_type=254)
-            member_main_profile = None
-            member_profiles = await \
-                DestinyUser(membership_id=bungie_id, membership_type=254).get_membership_data_by_id()
-            if member_profiles.primary_membership_id:
-                for profile in member_profiles.destiny_memberships:
-                    if member_profiles.primary_membership_id == profile.membership_id:
-                        member_main_profile = profile
-            elif len(member_profiles.destiny_memberships) == 1:
-                member_main_profile = member_profiles.destiny_memberships[0]
-            elif len(member_profiles.destiny_memberships) > 1:
-                for profile in member_profiles.destiny_memberships:
-                    if profile.membership_type == 3:
-                        member_main_profile = profile
+            member_main_profile = await get_main_destiny_profile(bungie_id=bungie_id)
             if member_main_profile:
                 main_membership_id, main_membership_type = \
                     member_main_profile.membership_id, member_main_profile.membership_type.value
             if metric_hashes and member_main_profile:
-                member_metrics = await member_main_profile.get_profile(components=[DestinyComponentType.METRICS])
+                member_metrics = await profile_cache.get_profile(member_main_profile, [DestinyComponentType.METRICS])
                 if member_metrics:
                     for metric_hash in metric_hashes:
                         metric: DestinyMetricComponent | None = member_metrics.metrics.data.metrics.get(metric_hash, None)
@@ -141,24 +130,12 @@ async def update_meeting_member(db_engine,
     if bungie_id:
         try:
             bungie_name = await get_bungie_name_by_bungie_id(membership_id=bungie_id, membership_type=254)
-            member_main_profile = None
-            member_profiles = await \
-                DestinyUser(membership_id=bungie_id, membership_type=254).get_membership_data_by_id()
-            if member_profiles.primary_membership_id:
-                for profile in member_profiles.destiny_memberships:
-                    if member_profiles.primary_membership_id == profile.membership_id:
-                        member_main_profile = profile
-            elif len(member_profiles.destiny_memberships) == 1:
-                member_main_profile = member_profiles.destiny_memberships[0]
-            elif len(member_profiles.destiny_memberships) > 1:
-                for profile in member_profiles.destiny_memberships:
-                    if profile.membership_type == 3:
-                        member_main_profile = profile
+            member_main_profile = await get_main_destiny_profile(bungie_id=bungie_id)
             if member_main_profile:
                 main_membership_id, main_membership_type = \
                     member_main_profile.membership_id, member_main_profile.membership_type.value
             if meeting.meeting_channel.metric_hash and member_main_profile:
-                member_metrics = await member_main_profile.get_profile(components=[DestinyComponentType.METRICS])
+                member_metrics = await profile_cache.get_profile(member_main_profile, [DestinyComponentType.METRICS])
                 for metric_hash in meeting.meeting_channel.metric_hash:
                     metric: DestinyMetricComponent | None = member_metrics.metrics.data.metrics.get(metric_hash, None)
                     if metric:
@@ -0,0 +1,533 @@
+"""
+Отрисовка изображений ресетов.
+Функции модуля не обращаются к сети и боту - получают уже подготовленные данные (строки и байты изображений),
+поэтому выполняются в пуле процессов (utils.rendering.render_png)
+"""
+import datetime
+import io
+import re
+import textwrap
+from typing import List
+
+from PIL import Image, ImageDraw
+from PIL.Image import Resampling
+
+from utils.asset_registry import get_asset, get_font
+
+
+def load_image(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def fill_box_with_image(box: Image.Image, image: Image.Image) -> Image.Image:
+    # Вписывает часть изображения активности в скругленную рамку
+    box_for_crop = (100, 400, box.size[0] + 100, box.size[1] + 400)
+    cropped_image = image.crop(box_for_crop)
+    ellipsed_image = box.copy()
+    ellipsed_image.paste(cropped_image, mask=box)
+    cropped_ellipsed_image = ellipsed_image.crop((150, 0, *ellipsed_image.size))
+    box.paste(cropped_ellipsed_image, (150, 0), mask=cropped_ellipsed_image)
+    return box
+
+
+# Недельный ресет
+
+def draw_left_info_box(data: dict):
+    background = Image.new('RGBA', (760, 1000), (0, 0, 0, 0))
+    font_bold = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 41)
+    font_normal = get_font('fonts/Montserrat/Montserrat-Medium.ttf', 35)
+    draw = ImageDraw.Draw(background)
+    x, y = 0, 0
+    for title, names in (('Стихийное горение', data['burns']),
+                         ('Бонус активностей', data['bonuses']),
+                         ('Горнило', data['crucible'])):
+        draw.text((x, y), title, font=font_bold)
+        y += 40
+        for name in names:
+            if name:
+                draw.text((x, y), f"{name}", font=font_normal, fill='#888888')
+            y += 35
+        y += 50
+
+    draw.text((x, y), 'Город грез', font=font_bold)
+    y += 40
+    draw.text((x, y), f"{data['curse']}", font=font_normal, fill='#888888')
+    y += 35
+    draw.text((x, y), f"Высшее испытание:", font=font_normal, fill='#888888')
+    y += 35
+    draw.multiline_text((x, y), f"{textwrap.fill(data['challenge'], 25)}", font=font_normal, fill='#888888')
+    return background
+
+
+def draw_activity_box(data: dict, box_name: str):
+    background = Image.new('RGBA', (977, 570))
+    box = get_asset(f'resets/{box_name}.png')
+    box = fill_box_with_image(box, load_image(data['image']))
+    background.paste(box, (90, 146), mask=box)
+    draw = ImageDraw.Draw(background)
+    font = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 48)
+    draw.text((90, 65), f"{data['name']}", font=font)
+    return background
+
+
+def draw_raid_box(data: dict):
+    return draw_activity_box(data, 'raid')
+
+
+def draw_dungeon_box(data: dict):
+    return draw_activity_box(data, 'dungeon')
+
+
+def draw_nightfall_box(data: dict):
+    background = Image.new('RGBA', (977, 570))
+    nightfall_box = get_asset('resets/nightfall.png')
+    nightfall_box = fill_box_with_image(nightfall_box, load_image(data['image']))
+
+    x, y = 715, 100
+    for shield in data['shields']:
+        shield_image = Image.new('RGBA', (600, 600))
+        draw = ImageDraw.Draw(shield_image)
+        draw.ellipse((0, 0, 600, 600), fill='white')
+        shield_image = shield_image.resize((60, 60), Resampling.LANCZOS)
+
+        shield_icon = load_image(shield).convert("RGBA")
+        shield_icon = shield_icon.resize((36, 36), Resampling.LANCZOS)
+        shield_image.paste(shield_icon, (12, 12), mask=shield_icon)
+        nightfall_box.paste(shield_image, (x, y), mask=shield_image)
+        x -= 75
+
+    x, y = 715, 175
+    for champion in data['champions']:
+        champion_image = load_image(champion).convert("RGBA")
+        champion_image = champion_image.resize((60, 60), Resampling.LANCZOS)
+        nightfall_box.paste(champion_image, (x, y), mask=champion_image)
+        x -= 75
+
+    x, y = 160, 0
+    burn_x, burn_y = x, y
+    draw = ImageDraw.Draw(nightfall_box)
+    font = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 30)
+    for burn_name in data['burns']:
+        draw.text((burn_x + 2, burn_y + 2), burn_name, font=font, fill='#000000')
+        draw.text((burn_x, burn_y), burn_name, font=font, fill='#ffffff')
+        burn_y += 40
+
+    burn_x, burn_y = x, 175
+    for weapon in data['weapons']:
+        weapon_mod_image = load_image(weapon).convert("RGBA")
+        weapon_mod_image = weapon_mod_image.resize((60, 60), Resampling.LANCZOS)
+        nightfall_box.paste(weapon_mod_image, (burn_x, burn_y), mask=weapon_mod_image)
+        burn_x += 75
+
+    background.paste(nightfall_box, (90, 146), mask=nightfall_box)
+    draw = ImageDraw.Draw(background)
+    font = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 48)
+    draw.text((90, 65), f"{data['title']}", font=font)
+    return background
+
+
+def draw_title_box(title: str):
+    background = Image.new('RGBA', (977, 570))
+    draw = ImageDraw.Draw(background)
+    font = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 48)
+    draw.text((90, 65), f"{title}", font=font)
+    return background
+
+
+def draw_dares_box(dares_rotation: List[str]):
+    return draw_title_box(f"{dares_rotation[0]} > {dares_rotation[1]} > {dares_rotation[2]}")
+
+
+def draw_nightmares_box(nightmares: List[tuple]):
+    nightmares_box = Image.new('RGBA', (2160, 720))
+    x, y = 0, 0
+    for nightmare in nightmares:
+        image = load_image(nightmare[3])
+        image = image.crop((280, 0, 1000, 720))
+        nightmares_box.paste(image, (x, y))
+        x += 720
+
+    background = get_asset('resets/raid.png')
+    background_size = background.size
+    background = background.resize(nightmares_box.size)
+    background.paste(nightmares_box, mask=background)
+    nightmares_box = background.resize(background_size)
+
+    background = Image.new('RGBA', (977, 570))
+    background.paste(nightmares_box, (90, 146), mask=nightmares_box)
+    draw = ImageDraw.Draw(background)
+    font_bold = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 36)
+    font_medium = get_font('fonts/Montserrat/Montserrat-Medium.ttf', 28)
+    x, y = 90, 400
+    for nightmare in nightmares:
+        draw.text((x, y), f"{nightmare[0]}", font=font_bold)
+        y += 40
+        draw.text((x, y), f"{nightmare[1]}", font=font_medium, fill='#888888')
+        y += 25
+        draw.text((x, y), f"{nightmare[2]}", font=font_medium, fill='#888888')
+        y -= 65
+        x += 265
+    return background
+
+
+def draw_ada_1_resource(item: dict):
+    im = Image.new('RGBA', (980, 250), color=(0, 0, 0, 0))
+
+    image = load_image(item['icon']).convert('RGBA')
+    mod_background = Image.new('RGBA', (96, 96), color='#252525')
+    mod_background.paste(image, mask=image)
+    image = mod_background
+    draw = ImageDraw.Draw(im)
+    temp_image = Image.new('RGB', (100, 100), color='#d2d2d2')
+    temp_image.paste(image, (2, 2))
+    maxsize = (96, 96)
+    temp_image.thumbnail(maxsize, Resampling.LANCZOS)
+
+    mod_name = item['name']
+    mod_type = item['type']
+    if textwrap.fill(mod_name, 60).count('\n') > 1:
+        mod_name_len = len(mod_name)
+        while textwrap.fill(mod_name, 60).count('\n') > 1:
+            mod_name_len -= 1
+            mod_name = mod_name[:mod_name_len]
+        mod_name = mod_name[:len(mod_name) - 3]
+        mod_name += '...'
+
+    if len(mod_type) >= 30:
+        mod_type = mod_type[:27]
+        mod_type += '...'
+
+    mod_font_name = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 48)
+    mod_font_type = get_font('fonts/Montserrat/Montserrat-Medium.ttf', 38)
+    x, y = 116, 10
+    draw.text((x, y), textwrap.fill(mod_name, 60), font=mod_font_name)
+    mod_name_bbox = mod_font_name.getbbox(mod_name)
+    y += (textwrap.fill(mod_name, 60).count('\n') + 1) * (mod_name_bbox[3] - mod_name_bbox[1])
+    draw.text((x, y), mod_type, font=mod_font_type)
+    im.paste(temp_image, (10, 10))
+    return im
+
+
+def draw_ada_1_box(ada_1_items: List[dict]):
+    ada_1_picture = Image.new('RGBA', (1100, 1000), (0, 0, 0, 0))
+    x, y = 2, 2
+    for item in ada_1_items:
+        item_image = draw_ada_1_resource(item)
+        ada_1_picture.paste(item_image, (x, y), mask=item_image)
+        y += 120 + 4
+    return ada_1_picture
+
+
+def draw_vendor_resource(icon: bytes):
+    im = Image.new('RGBA', (96, 96), color=(0, 0, 0, 0))
+    temp_image = Image.new('RGBA', (100, 100), color='#dddddd')
+    temp_image.paste(load_image(icon), (2, 2))
+    maxsize = (87, 87)
+    temp_image.thumbnail(maxsize, Resampling.LANCZOS)
+    im.paste(temp_image)
+    return im
+
+
+def draw_eververse_box(eververse_icons: List[List[bytes]]):
+    eververse_picture = Image.new('RGBA', (1100, 300), (0, 0, 0, 0))
+    x, y = 2, 2
+    for category in eververse_icons:
+        for icon in category:
+            item_image = draw_vendor_resource(icon)
+            eververse_picture.paste(item_image, (x, y), mask=item_image)
+            x += 87 + 4
+        x = 2
+        y += 87 + 4
+    return eververse_picture
+
+
+def draw_one_raid_box(raid: dict):
+    all_challenges = raid['all_challenges']
+    current_challenge = raid['current_challenge']
+    background = Image.new('RGBA', (975, 300), (0, 0, 0, 0))
+    encounter_box = Image.new('RGBA', (42, 42), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(encounter_box)
+    draw.rectangle((0, 0, 41, 41), outline='#999999', width=4)
+
+    challenge_box = encounter_box.copy()
+    draw = ImageDraw.Draw(challenge_box)
+    draw.rectangle((7, 7, 34, 34), fill='#f0ff00')
+
+    raid_icon = load_image(raid['icon']).convert('RGBA')
+    raid_icon_size = (96, 96)
+    raid_icon = raid_icon.resize(raid_icon_size, Resampling.LANCZOS)
+
+    background.paste(raid_icon, (0, 0), mask=raid_icon)
+    x, y = 96 + 15, 0
+    for challenge in raid['challenges']:
+        if challenge == current_challenge or all_challenges:
+            background.paste(challenge_box, (x, y), mask=challenge_box)
+        else:
+            background.paste(encounter_box, (x, y), mask=encounter_box)
+        x += 42 + 6
+
+    raid_name_font = get_font('fonts/Montserrat/Montserrat-Bold.ttf', 60)
+    raid_desc_font = get_font('fonts/Montserrat/Montserrat-Medium.ttf', 30)
+    x, y = 96 + 10, 42
+    draw = ImageDraw.Draw(background)
+    draw.text((x, y), raid['name'], font=raid_name_font)
+
+    x, y = 96 + 15, 128
+    draw.line((x, y, x + 880, y), fill='#424242', width=5)
+    draw.line((x, y + 56, x + 880, y + 56), fill='#424242', width=5)
+    if all_challenges:
+        draw.text((x, y + 7), 'Недельная ротация', font=raid_desc_font, fill='#6ca0dc')
+    else:
+        draw.text((x, y + 7), raid['challenges'][current_challenge][0], font=raid_desc_font, fill='#6ca0dc')
+
+    x, y = x, 190
+    if all_challenges:
+        draw.text((x, y), 'Доступны все испытания рейда', font=raid_desc_font, fill='#88898a')
+    else:
+        draw.multiline_text((x, y), textwrap.fill(raid['challenges'][current_challenge][1], 45),
+                            font=raid_desc_font, fill='#88898a')
+    return background
+
+
+def draw_all_raids_box(raids: List[dict]):
+    raids_interval = 380
+    background = Image.new('RGBA', (975, len(raids) * (300 + raids_interval)), (0, 0, 0, 0))
+    x, y = 0, 0
+    for raid in raids:
+        raid_box = draw_one_raid_box(raid)
+        background.paste(raid_box, (x, y), mask=raid_box)
+        y += raids_interval
+    return background
+
+
+def draw_weekly_static_layer(data: dict):
+    # Блоки, зависящие только от недельных ротаций - могут быть отрисованы до ресета
+    background = get_asset('resets/weekly_reset.png')
+    boxes = [
+        ((1075, 190), draw_raid_box(data['raid'])),
+        ((1075, 860), draw_dungeon_box(data['dungeon'])),
+        ((1075, 1540), draw_title_box(data['comp'])),
+        ((2125, 860), draw_dares_box(data['dares'])),
+        ((1075, 2160), draw_nightmares_box(data['nightmares'])),
+        ((3175, 180), draw_all_raids_box(data['raids'])),
+    ]
+    for position, box in boxes:
+        background.paste(box, position, mask=box)
+    return background
+
+
+def draw_weekly_vendor_layer(background: Image.Image, data: dict):
+    # Блоки, зависящие от вех и вендоров - доступны только после ресета
+    boxes = [
+        ((50, 1660), draw_left_info_box(data['left_info'])),
+        ((2125, 190), draw_nightfall_box(data['nightfall'])),
+        ((2125, 1580), draw_ada_1_box(data['ada_1'])),
+        ((2125, 2310), draw_eververse_box(data['eververse'])),
+    ]
+    for position, box in boxes:
+        background.paste(box, position, mask=box)
+    return background
+
+
+def draw_weekly_picture(data: dict):
+    return draw_weekly_vendor_layer(draw_weekly_static_layer(data), data)
+
+
+def draw_weekly_picture_with_static_layer(static_layer: bytes, data: dict):
+    return draw_weekly_vendor_layer(load_image(static_layer), data)
+
+
+# Сектора
+
+def draw_sector_modifier_with_description_box(modifier: dict):
+    name_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    description_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    icons_size = 60
+    font_colour = '#FDFEFE'
+
+    modifier_name = modifier['name']
+    modifier_name: str = modifier_name.replace('Сверхзаряженная ', '').replace('Сверхзаряженный ', '')
+    modifier_name = modifier_name.capitalize()
+    name_box = name_font.getbbox(modifier_name)
+    modifier_desc = modifier['description']
+    vars_in_desc = re.findall(r'{var:\d*}', modifier_desc)
+    for var in vars_in_desc:
+        var_value = 25
+        modifier_desc = modifier_desc.replace(var, str(var_value))
+
+    modifier_icon = load_image(modifier['icon'])
+
+    modifier_desc = modifier_desc + '.'
+    modifier_desc = modifier_desc.replace('\n\n\n', '\n\n').replace('\n\n', '\n').replace('\n', '.')
+    modifier_desc = modifier_desc.replace('....', '...').replace('...', '..').replace('..', '.')
+    modifier_desc = modifier_desc.replace('. ', '.')
+    modifier_desc = modifier_desc.replace('.', '.\n')
+    string_len = 28
+
+    name_h = name_box[3] - name_box[1]
+
+    description_h = 0
+    for row in modifier_desc.split('\n'):
+        wrap_row = textwrap.fill(row, string_len)
+        wrap_row_box = description_font.getbbox(wrap_row)
+        description_h += (wrap_row_box[3] - wrap_row_box[1]) * (wrap_row.count('\n') + 1) + 10
+
+    background_h = max(icons_size, description_h + name_h + 10)
+    background_w = 650
+
+    background = Image.new('RGBA', (background_w, background_h), (0, 0, 0, 0))
+    background.paste(modifier_icon, (0, 0), mask=modifier_icon)
+    draw = ImageDraw.Draw(background)
+    draw.text((modifier_icon.width + 10, 0), modifier_name, font=name_font, fill=font_colour)
+    x, y = modifier_icon.width + 10, name_h + 10
+    for row in modifier_desc.split('\n'):
+        wrap_row = textwrap.fill(row, string_len)
+        wrap_row_box = description_font.getbbox(wrap_row)
+        draw.multiline_text((x, y), wrap_row,
+                            font=description_font,
+                            fill=font_colour)
+        y += (wrap_row_box[3] - wrap_row_box[1]) * (wrap_row.count('\n') + 1) + 10
+    return background
+
+
+def draw_sector_modifier_without_description_box(modifier: dict):
+    name_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    icons_size = 60
+    font_colour = '#FDFEFE'
+
+    modifier_name = modifier['name']
+    name_box = name_font.getbbox(modifier_name)
+
+    modifier_icon = load_image(modifier['icon']).resize((icons_size, icons_size))
+
+    name_h = name_box[3] - name_box[1]
+    background_h = max(icons_size, name_h)
+    background_w = 650
+
+    background = Image.new('RGBA', (background_w, background_h), (0, 0, 0, 0))
+    background.paste(modifier_icon, (0, 0), mask=modifier_icon)
+    draw = ImageDraw.Draw(background)
+    modifier_name_box = name_font.getbbox(modifier_name)
+    draw.text((modifier_icon.width + 10, (background.height // 2 - modifier_name_box[3] // 2)),
+              modifier_name,
+              font=name_font,
+              fill=font_colour)
+    return background
+
+
+def draw_lost_sector_big_box_description(modifiers: dict):
+    background = get_asset('lost_sectors/sector_big_box_description_mask.png')
+
+    draw = ImageDraw.Draw(background)
+    category_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    font_colour = '#FDFEFE'
+    x, y = 30, 20
+
+    categories = (('ВОИТЕЛИ:', modifiers['champions'], draw_sector_modifier_without_description_box),
+                  ('МОЩЬ:', modifiers['surge'], draw_sector_modifier_with_description_box),
+                  ('ОРУЖИЕ:', modifiers['overcharged'], draw_sector_modifier_with_description_box))
+    for category_name, category_modifiers, draw_modifier in categories:
+        draw.text((x, y), category_name, font=category_font, fill=font_colour)
+        box = category_font.getbbox(category_name)
+        y += box[3] + 20
+        for mod in category_modifiers:
+            mod_box = draw_modifier(mod)
+            background.paste(mod_box, (x, y), mask=mod_box)
+            y += mod_box.height + 15
+        y += 25
+    return background
+
+
+def draw_lost_sector_big_box(sector: dict):
+    sector_pgcr_image = load_image(sector['image']).convert('RGBA')
+    sector_pgcr_image.putalpha(255)
+
+    # Обраборка изображения под маску
+    sector_big_box_mask = get_asset('lost_sectors/sector_big_box_mask.png')
+    sector_pgcr_image = sector_pgcr_image.resize(sector_big_box_mask.size)
+    sector_pgcr_image = sector_pgcr_image.crop((0, 0, *sector_big_box_mask.size))
+    background = Image.new('RGBA', sector_pgcr_image.size, (0, 0, 0, 0))
+    background.paste(sector_pgcr_image, (0, 0), mask=sector_big_box_mask)
+
+    font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 60)
+    font_colour = '#FDFEFE'
+    draw = ImageDraw.Draw(background)
+
+    draw.text((815, 60), sector['location'].upper(), font=font, fill=font_colour)
+    draw.text((815, 120), sector['name'], font=font, fill=font_colour)
+
+    sector_descrition_box = draw_lost_sector_big_box_description(sector['modifiers'])
+    background.paste(sector_descrition_box, (50, 50), mask=sector_descrition_box)
+    return background
+
+
+def draw_drop_box(icons: List[bytes]):
+    chunk_size = 10
+    rows = [icons[i:i + chunk_size] for i in range(0, len(icons), chunk_size)]
+    item_size = 107
+    x, y = 10, 10
+    box_size = (x + chunk_size * (item_size + 15), y + len(rows) * (item_size + 15))
+    background = Image.new('RGBA', box_size, (0, 0, 0, 0))
+    for row in rows:
+        for icon in row:
+            item_image = load_image(icon).convert('RGBA').resize((item_size, item_size))
+            background.paste(item_image, (x, y), mask=item_image)
+            x += item_size + 15
+        x -= len(row) * (item_size + 15)
+        y += item_size + 15
+    return background
+
+
+def draw_small_sector_box(sector: dict, date: datetime.datetime):
+    icon_size = 107
+    pgcr_image = load_image(sector['image']).convert('RGBA').resize((900, 500))
+
+    small_sector_mask = get_asset('lost_sectors/small_sector_mask.png')
+    shadow = Image.new('RGBA', pgcr_image.size, (0, 0, 0, 75))
+    pgcr_image.paste(shadow, (0, 0), mask=shadow)
+    pgcr_image.putalpha(255)
+    pgcr_image = pgcr_image.crop((0, 0, *small_sector_mask.size))
+    background = Image.new('RGBA', pgcr_image.size, (255, 255, 255, 0))
+    background.paste(pgcr_image, (0, 0), mask=small_sector_mask)
+
+    font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    date_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 30)
+    date_string = date.strftime('%d.%m')
+
+    draw = ImageDraw.Draw(background)
+    draw.text((50, 45), date_string, font=date_font, fill='#FDFEFE')
+
+    draw.text((50, 100), sector['location'].upper(), font=font, fill='#FDFEFE')
+    draw.text((50, 135), sector['name'], font=font, fill='#FDFEFE')
+
+    drop_icon = get_asset(sector['drop_icon'], 'RGBA').resize((icon_size, icon_size))
+    drop_mask = get_asset('lost_sectors/drop_mask.png').resize((icon_size, icon_size))
+    drop_image = Image.new('RGBA', drop_icon.size, (0, 0, 0, 0))
+    drop_image.paste(drop_icon, (0, 0), mask=drop_mask)
+    drop_image = drop_image.resize((icon_size, icon_size))
+
+    background.paste(drop_image, (50, 345), mask=drop_image)
+    return background
+
+
+def draw_lost_sector_image(data: dict):
+    date = data['date']
+    background = get_asset('lost_sectors/background.png')
+    draw = ImageDraw.Draw(background)
+
+    date_font = get_font('fonts/Montserrat/Montserrat-Black.ttf', 160)
+    date_string = date.strftime('%d.%m')
+    draw.text((315, 45), date_string, font=date_font, fill='#FDFEFE')
+
+    drop_box = draw_drop_box(data['drop_items'])
+    background.paste(drop_box, (870, 230), mask=drop_box)
+
+    current_sector_box = draw_lost_sector_big_box(data['sector'])
+    background.paste(current_sector_box, (50, 550), mask=current_sector_box)
+
+    x, y = 50, 1610
+    for i, sector in enumerate(data['next_sectors']):
+        small_sector_box = draw_small_sector_box(sector, date + datetime.timedelta(days=i + 1))
+        background.paste(small_sector_box, (x, y), mask=small_sector_box)
+        x += small_sector_box.width + 50
+    return background
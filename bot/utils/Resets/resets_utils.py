@@ -1,13 +1,19 @@
-import asyncio
+import os
 import time
 from typing import List
-from urllib.request import urlopen
 
 from PIL import Image
 from bungio.models import DestinyInventoryItemDefinition, DestinyActivityDefinition, \
-    DestinyActivityModifierReferenceDefinition, DestinyActivityModifierDefinition
+    DestinyActivityModifierReferenceDefinition, DestinyActivityModifierDefinition, AuthData, GroupUserInfoCard, \
+    DestinyComponentType, DestinyProfileResponse, DestinyCharacterComponent
 
+from utils.asset_registry import get_asset
 from utils.bungio_client import CustomClient
+from utils.image_fetcher import image_fetcher
+from utils.logger import create_logger
+from utils.users_utils import get_main_destiny_profile
+
+logger = create_logger(__name__)
 
 
 class LostSectorModifiers:
@@ -22,13 +28,7 @@ class LostSectorModifiers:
         return f"{self._sector}> Champions: {self.champions}; Surge: {self.surge}; Overcharged: {self.overcharged}"
 
     async def init(self):
-        champions_dict = {
-            '[Дестабилизация]': await self._client.manifest.fetch(DestinyActivityModifierDefinition, str(1201462052)),
-            '[Оглушение]': await self._client.manifest.fetch(DestinyActivityModifierDefinition, str(4218937993)),
-            '[Пробивание щитов]': await self._client.manifest.fetch(DestinyActivityModifierDefinition, str(1974619026)),
-        }
-        for k in champions_dict:
-            await champions_dict[k].fetch_manifest_information()
+        champions_dict = await lost_sectors_cache.get_champions(self._client)
 
         await self._sector.fetch_manifest_information()
         for modifier in self._sector.modifiers:
@@ -54,12 +54,14 @@ class LostSectorDrop:
     def __init__(self, client, name, icon_path, items):
         self._client = client
         self.name = name
-        self.icon = icon_path
+        # Абсолютный путь - иконка открывается в процессах отрисовки через реестр ресурсов
+        self.icon_path = os.path.abspath(icon_path)
+        self.icon = None
         self._items_hashes = items
         self.items = None
 
     async def init(self):
-        self.icon = Image.open(self.icon).convert('RGBA')
+        self.icon = get_asset(self.icon_path, 'RGBA')
         self.items = [await self._client.manifest.fetch(DestinyInventoryItemDefinition, item)
                       for item in self._items_hashes]
         for item in self.items:
@@ -74,8 +76,99 @@ class LostSector:
         self.drop = drop
 
     async def init(self):
-        self.activity = await self._client.manifest.fetch(DestinyActivityDefinition, self._activity_hash)
-        await self.activity.fetch_manifest_information()
+        self.activity = await lost_sectors_cache.get_activity(self._client, self._activity_hash)
+
+
+class LostSectorsCache:
+    """
+    Инициализированные определения секторов, классификация их модификаторов и наборы дропа.
+    Сбрасывается только при обновлении манифеста или изменении ротации секторов
+    """
+
+    def __init__(self):
+        self.activities: dict[int, DestinyActivityDefinition] = {}
+        self.modifiers: dict[int, LostSectorModifiers] = {}
+        self.drops: dict[tuple, LostSectorDrop] = {}
+        self.champions: dict[str, DestinyActivityModifierDefinition] | None = None
+        self.key = None
+        self.hits = 0
+        self.misses = 0
+
+    def validate(self, client, rotation: dict):
+        key = (getattr(client, 'manifest_generation', 0),
+               tuple(sorted((str(day), int(activity_hash)) for day, activity_hash in rotation.items())))
+        if key != self.key:
+            if self.key is not None:
+                logger.info('Манифест или ротация секторов изменились, кеш секторов сброшен')
+            self.clear()
+            self.key = key
+
+    async def get_champions(self, client) -> dict[str, DestinyActivityModifierDefinition]:
+        if self.champions is None:
+            self.misses += 1
+            champions = {
+                '[Дестабилизация]': await client.manifest.fetch(DestinyActivityModifierDefinition, str(1201462052)),
+                '[Оглушение]': await client.manifest.fetch(DestinyActivityModifierDefinition, str(4218937993)),
+                '[Пробивание щитов]': await client.manifest.fetch(DestinyActivityModifierDefinition, str(1974619026)),
+            }
+            for k in champions:
+                await champions[k].fetch_manifest_information()
+            self.champions = champions
+        else:
+            self.hits += 1
+        return self.champions
+
+    async def get_activity(self, client, activity_hash) -> DestinyActivityDefinition:
+        activity = self.activities.get(int(activity_hash))
+        if activity is None:
+            self.misses += 1
+            activity = await client.manifest.fetch(DestinyActivityDefinition, activity_hash)
+            await activity.fetch_manifest_information()
+            self.activities[int(activity_hash)] = activity
+        else:
+            self.hits += 1
+        return activity
+
+    async def get_modifiers(self, client, sector: DestinyActivityDefinition) -> LostSectorModifiers:
+        sector_modifiers = self.modifiers.get(sector.hash)
+        if sector_modifiers is None:
+            self.misses += 1
+            sector_modifiers = LostSectorModifiers(client, sector)
+            await sector_modifiers.init()
+            self.modifiers[sector.hash] = sector_modifiers
+        else:
+            self.hits += 1
+        return sector_modifiers
+
+    async def get_drop(self, client, name, icon_path, items) -> LostSectorDrop:
+        key = (name, icon_path, tuple(items))
+        drop = self.drops.get(key)
+        if drop is None:
+            self.misses += 1
+            drop = LostSectorDrop(client=client, name=name, icon_path=icon_path, items=items)
+            await drop.init()
+            self.drops[key] = drop
+        else:
+            self.hits += 1
+        return drop
+
+    def get_stats(self) -> dict:
+        return {
+            'activities': len(self.activities),
+            'modifiers': len(self.modifiers),
+            'drops': len(self.drops),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def clear(self):
+        self.activities.clear()
+        self.modifiers.clear()
+        self.drops.clear()
+        self.champions = None
+
+
+lost_sectors_cache = LostSectorsCache()
 
 
 def get_current_rotation_day(count, delta=0):
@@ -84,9 +177,18 @@ def get_current_rotation_day(count, delta=0):
     return (abs(current_time - 1600794000) // day) % count
 
 
+async def fetch_image(link) -> bytes:
+    return await image_fetcher.fetch(link)
+
+
 async def open_image(link) -> Image:
-    if link[0] == '/':
-        link = f'https://www.bungie.net{link}'
-    image_raw = await asyncio.get_event_loop().run_in_executor(None, urlopen, link)
-    image = await asyncio.get_event_loop().run_in_executor(None, Image.open, image_raw)
-    return image
+    return await image_fetcher.open(link)
+
+
+async def get_characters(auth: AuthData) -> dict[int, DestinyCharacterComponent]:
+    member_main_profile: GroupUserInfoCard = await get_main_destiny_profile(bungie_id=auth.membership_id,
+                                                                            membership_type=auth.membership_type)
+    character_list: DestinyProfileResponse = await (member_main_profile.
+                                                    get_profile(components=[DestinyComponentType.CHARACTERS],
+                                                                auth=auth))
+    return character_list.characters.data
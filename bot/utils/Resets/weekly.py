@@ -1,16 +1,15 @@
-import os
-import textwrap
+import asyncio
 import time
 
-from PIL import Image, ImageFont, ImageDraw
-from PIL.Image import Resampling
 from bungio.models import AuthData, DestinyPublicMilestone, DestinyActivityModifierDefinition, DestinyActivityDefinition
 
-from utils.Resets.ada1 import get_ada_1, create_ada_1_box
-from utils.Resets.eververse import get_eververse, render_eververse
-from utils.Resets.resets_utils import open_image
+from utils.Resets.ada1 import get_ada_1, get_ada_1_box_data, get_ada_1_definition
+from utils.Resets.drawing import draw_weekly_picture, draw_weekly_static_layer, draw_weekly_picture_with_static_layer
+from utils.Resets.eververse import get_eververse, get_eververse_box_data, get_eververse_definition
+from utils.Resets.resets_utils import fetch_image, get_characters
 from utils.bungio_client import CustomClient
 from utils.logger import create_logger
+from utils.rendering import render_png
 
 logger = create_logger('resets')
 
@@ -104,13 +103,13 @@ raids = {
 }
 
 
-def get_current_rotation(count_rotations):
+def get_current_rotation(count_rotations, delta=0):
     week = 604800
-    current_time = int(time.time())
+    current_time = int(time.time()) + delta
     return (abs(current_time - 1600794000) // week) % count_rotations
 
 
-def get_current_raid_rotation():
+def get_current_raid_rotation(delta=0):
     rotations = {
         2: 2497200493,  # 'garden_of_salvation',
         3: 910380154,  # 'deep_stone_crypt',
@@ -119,118 +118,137 @@ def get_current_raid_rotation():
         0: 1374392663,  # 'kings_fall',
         1: 1661734046,  # 'last_wish',
     }
-    return rotations[get_current_rotation(len(rotations))]
+    return rotations[get_current_rotation(len(rotations), delta)]
 
 
-async def create_weekly_picture(client: CustomClient, auth: AuthData):
+async def create_weekly_picture(client: CustomClient, auth: AuthData, static_layer: bytes | None = None) -> bytes:
+    """
+    static_layer - заранее отрисованный слой из create_weekly_static_layer,
+    в этом случае загружаются и дорисовываются только данные вендоров и вех
+    """
     logger.info('Формирую недельный ресет')
+    timings = {}
+    if static_layer is not None:
+        data = await timed_stage(timings, 'fetch', get_weekly_vendor_data(client=client, auth=auth, timings=timings))
+        image = await timed_stage(timings, 'render',
+                                  render_png(draw_weekly_picture_with_static_layer, static_layer, data))
+    else:
+        vendor_data, static_data = await timed_stage(timings, 'fetch', asyncio.gather(
+            get_weekly_vendor_data(client=client, auth=auth, timings=timings),
+            get_weekly_static_data(client=client, timings=timings)))
+        image = await timed_stage(timings, 'render', render_png(draw_weekly_picture, {**vendor_data, **static_data}))
+    log_timings('Недельный ресет сформирован!', timings)
+    return image
+
+
+async def create_weekly_static_layer(client: CustomClient, delta=0) -> bytes:
+    """Слой недельного ресета, зависящий только от ротаций; delta - смещение в секундах (для следующего ресета)"""
+    logger.info('Формирую слой ротаций недельного ресета')
+    timings = {}
+    data = await timed_stage(timings, 'fetch', get_weekly_static_data(client=client, delta=delta, timings=timings))
+    image = await timed_stage(timings, 'render', render_png(draw_weekly_static_layer, data))
+    log_timings('Слой ротаций недельного ресета сформирован!', timings)
+    return image
+
+
+async def timed_stage(timings: dict, name: str, awaitable):
+    started_at = time.monotonic()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = time.monotonic() - started_at
+
+
+def log_timings(message: str, timings: dict):
+    logger.info(f"{message} Этапы: {', '.join(f'{name} {value:.2f} сек.' for name, value in timings.items())}")
+
+
+async def get_weekly_vendor_data(client: CustomClient, auth: AuthData, timings: dict | None = None) -> dict:
+    """
+    Граф загрузки: вехи, персонажи и определения вендоров запрашиваются одновременно,
+    каждый блок ждет только свои зависимости. Время этапов записывается в timings
+    """
+    timings = {} if timings is None else timings
+    characters = asyncio.ensure_future(timed_stage(timings, 'characters', get_characters(auth)))
+    ada_1_definition = asyncio.ensure_future(timed_stage(timings, 'ada_1_definition', get_ada_1_definition(client)))
+    eververse_definition = asyncio.ensure_future(timed_stage(timings, 'eververse_definition',
+                                                             get_eververse_definition(client)))
+
+    async def milestones_stage():
+        milestones: dict[str, DestinyPublicMilestone] = await timed_stage(
+            timings, 'milestones', client.api.get_public_milestones(auth=auth))
+        return await asyncio.gather(
+            timed_stage(timings, 'left_info', get_left_info_data(client=client, milestones=milestones)),
+            timed_stage(timings, 'nightfall', get_nightfall_box_data(client=client, milestones=milestones)))
+
+    async def ada_1_stage():
+        character_list, definition = await asyncio.gather(asyncio.shield(characters), ada_1_definition)
+        ada_1 = await timed_stage(timings, 'ada_1', get_ada_1(client=client, auth=auth, character_list=character_list,
+                                                              ada_1_definition=definition))
+        return await timed_stage(timings, 'ada_1_box', get_ada_1_box_data(ada_1_items=ada_1, client=client))
+
+    async def eververse_stage():
+        character_list, definition = await asyncio.gather(asyncio.shield(characters), eververse_definition)
+        eververse = await timed_stage(timings, 'eververse',
+                                      get_eververse(client=client, auth=auth, character_list=character_list,
+                                                    tess_everis_definition=definition))
+        return await timed_stage(timings, 'eververse_box', get_eververse_box_data(eververse_items=eververse))
+
+    try:
+        (left_info, nightfall), ada_1, eververse = await asyncio.gather(milestones_stage(), ada_1_stage(),
+                                                                        eververse_stage())
+    finally:
+        for future in (characters, ada_1_definition, eververse_definition):
+            future.cancel()
+    return {
+        'left_info': left_info,
+        'nightfall': nightfall,
+        'ada_1': ada_1,
+        'eververse': eververse,
+    }
 
-    milestones: dict[str, DestinyPublicMilestone] = await client.api.get_public_milestones(auth=auth)
-
-    background = Image.open(f'{os.path.dirname(__file__)}/../assets/resets/weekly_reset.png')
-    x, y = 50, 1660
-    left_info_box = await create_left_info_box(client=client, milestones=milestones)
-    background.paste(left_info_box, (x, y), mask=left_info_box)
-
-    x, y = 1075, 190
-    raid_box = await create_raid_box(client=client)
-    background.paste(raid_box, (x, y), mask=raid_box)
-
-    x, y = 1075, 860
-    dungeon_box = await create_dungeon_box(client=client)
-    background.paste(dungeon_box, (x, y), mask=dungeon_box)
-
-    x, y = 2125, 190
-    nightfall_box = await create_nightfall_box(client=client,
-                                               milestones=milestones)  # get_nightfall_box_with_weapon(milestones)
-    background.paste(nightfall_box, (x, y), mask=nightfall_box)
-
-    x, y = 1075, 1540
-    witch_queen_box = await get_current_comp_box(client=client)
-    background.paste(witch_queen_box, (x, y), mask=witch_queen_box)
-
-    x, y = 2125, 860
-    dares_box = get_dares_box()
-    background.paste(dares_box, (x, y), mask=dares_box)
-
-    x, y = 1075, 2160
-    nightmares_box = await create_nightmares_box()
-    background.paste(nightmares_box, (x, y), mask=nightmares_box)
-
-    x, y = 2125, 1530
-    # season_box = create_season_box()
-    ada_1 = await get_ada_1(client=client, auth=auth)
-    ada_1_box = await create_ada_1_box(ada_1_items=ada_1, client=client)
-    background.paste(ada_1_box, (x, y + 50), mask=ada_1_box)
-
-    x, y = 2125, 2310
-    eververse = await get_eververse(client=client, auth=auth)
-    eververse_box = await render_eververse(client=client, eververse_items=eververse)
-    background.paste(eververse_box, (x, y), mask=eververse_box)
-
-    x, y = 3175, 180
-    raids_box = await create_all_raids_box()
-    background.paste(raids_box, (x, y), mask=raids_box)
-    logger.info('Недельный ресет сформирован!')
-    return background
-
-
-async def create_left_info_box(client: CustomClient, milestones: dict[str, DestinyPublicMilestone]):
-    background = Image.new('RGBA', (760, 1000), (0, 0, 0, 0))
-    font_bold = ImageFont.truetype(f'{os.path.dirname(__file__)}/../'
-                                   f'assets/fonts/Montserrat/Montserrat-Bold.ttf', size=41)
-    font_normal = ImageFont.truetype(f'{os.path.dirname(__file__)}/../'
-                                     f'assets/fonts/Montserrat/Montserrat-Medium.ttf', size=35)
-    draw = ImageDraw.Draw(background)
-    x, y = 0, 0
-    weekly_burn = get_current_singe(milestones)
-    draw.text((x, y), 'Стихийное горение', font=font_bold)
-    y += 40
-    for burn in weekly_burn:
-        burn_desc = await client.manifest.fetch(DestinyActivityModifierDefinition, burn)
-        if burn_desc:
-            await burn_desc.fetch_manifest_information()
-            burn_desc: DestinyActivityModifierDefinition
-        if burn_desc:
-            draw.text((x, y), f"{burn_desc.display_properties.name}", font=font_normal, fill='#888888')
-        y += 35
-    y += 50
-    draw.text((x, y), 'Бонус активностей', font=font_bold)
-    y += 40
-    weekly_bonus = get_current_double_modifiers(milestones)
-    for modifier in weekly_bonus:
-        modifier_desc = await client.manifest.fetch(DestinyActivityModifierDefinition, modifier)
-        if modifier_desc:
-            await modifier_desc.fetch_manifest_information()
-            modifier_desc: DestinyActivityModifierDefinition
-        if modifier_desc:
-            draw.text((x, y), f"{modifier_desc.display_properties.name}", font=font_normal, fill='#888888')
-        y += 35
-    y += 50
-
-    draw.text((x, y), 'Горнило', font=font_bold)
-    y += 40
-    crusible = get_current_crucible_mode(milestones)
-    for activity in crusible:
-        activity_desc = await client.manifest.fetch(DestinyActivityDefinition, activity.activity_hash)
-        if activity_desc:
-            await activity_desc.fetch_manifest_information()
-            activity_desc: DestinyActivityDefinition
-        draw.text((x, y), f"{activity_desc.display_properties.name}", font=font_normal, fill='#888888')
-        y += 35
-    y += 50
-
-    draw.text((x, y), 'Город грез', font=font_bold)
-    y += 40
-    curse = get_current_curse()
-    challenge = get_current_ascendant_challenge()
-    draw.text((x, y), f"{curse}", font=font_normal, fill='#888888')
-    y += 35
-    draw.text((x, y), f"Высшее испытание:", font=font_normal, fill='#888888')
-    y += 35
-    draw.multiline_text((x, y), f"{textwrap.fill(challenge, 25)}", font=font_normal, fill='#888888')
-    y += 50
-    return background
+
+async def get_weekly_static_data(client: CustomClient, delta=0, timings: dict | None = None) -> dict:
+    timings = {} if timings is None else timings
+    raid, dungeon, comp, nightmares, raids = await asyncio.gather(
+        timed_stage(timings, 'raid', get_raid_box_data(client=client, delta=delta)),
+        timed_stage(timings, 'dungeon', get_dungeon_box_data(client=client, delta=delta)),
+        timed_stage(timings, 'comp', get_comp_box_data(client=client, delta=delta)),
+        timed_stage(timings, 'nightmares', get_nightmares_data(delta)),
+        timed_stage(timings, 'raids', get_all_raids_data(delta)))
+    return {
+        'raid': raid,
+        'dungeon': dungeon,
+        'comp': comp,
+        'dares': get_current_dares_of_eternity(delta),
+        'nightmares': nightmares,
+        'raids': raids,
+    }
+
+
+async def get_definition_name(client: CustomClient, definition_class, definition_hash):
+    definition = await client.manifest.fetch(definition_class, definition_hash)
+    if not definition:
+        return None
+    await definition.fetch_manifest_information()
+    return definition.display_properties.name
+
+
+async def get_left_info_data(client: CustomClient, milestones: dict[str, DestinyPublicMilestone]) -> dict:
+    burns, bonuses, crucible = await asyncio.gather(
+        asyncio.gather(*[get_definition_name(client, DestinyActivityModifierDefinition, burn)
+                         for burn in get_current_singe(milestones)]),
+        asyncio.gather(*[get_definition_name(client, DestinyActivityModifierDefinition, modifier)
+                         for modifier in get_current_double_modifiers(milestones)]),
+        asyncio.gather(*[get_definition_name(client, DestinyActivityDefinition, activity.activity_hash)
+                         for activity in get_current_crucible_mode(milestones)]))
+    return {
+        'burns': list(burns),
+        'bonuses': list(bonuses),
+        'crucible': list(crucible),
+        'curse': get_current_curse(),
+        'challenge': get_current_ascendant_challenge(),
+    }
 
 
 def get_current_singe(milestones: dict[str, DestinyPublicMilestone]):
@@ -294,71 +312,29 @@ def get_current_ascendant_challenge():
     return rotations[get_current_rotation(6)]
 
 
-async def create_raid_box(client: CustomClient):
-    raid_desc = await client.manifest.fetch(DestinyActivityDefinition, str(get_current_raid_rotation()))
-    await raid_desc.fetch_manifest_information()
-    raid_desc: DestinyActivityDefinition
-    raid_image = await open_image(raid_desc.pgcr_image)
-
-    background = Image.new('RGBA', (977, 570))
-    raid_box = Image.open(f'{os.path.dirname(__file__)}/../assets/resets/raid.png')
-    box_for_crop_temp = (0, 0, *raid_box.size)
-    box_for_crop = []
-    for i, coord in enumerate(box_for_crop_temp):
-        if i % 2 == 0:
-            box_for_crop.append(coord + 100)
-        else:
-            box_for_crop.append(coord + 400)
-    cropped_image = raid_image.crop(box_for_crop)
-    ellipsed_raid_image = raid_box.copy()
-    ellipsed_raid_image.paste(cropped_image, mask=raid_box)
-    cropped_ellipsed_raid_image = ellipsed_raid_image.crop((150, 0, *ellipsed_raid_image.size))
-    raid_box.paste(cropped_ellipsed_raid_image, (150, 0), mask=cropped_ellipsed_raid_image)
-    background.paste(raid_box, (90, 146), mask=raid_box)
-    draw = ImageDraw.Draw(background)
-    font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                              f'fonts/Montserrat/Montserrat-Bold.ttf', size=48)
-    raid_name = (raid_desc.display_properties.name.lower().
-                 replace(': легенда', '').
-                 replace(': мастер', '').
-                 replace(': нормальный', '').title())
-    draw.text((90, 65), f"{raid_name}", font=font)
-    return background
-
-
-async def create_dungeon_box(client: CustomClient):
-    dungeon_desc = await client.manifest.fetch(DestinyActivityDefinition, str(get_current_dungeon_rotation()))
-    await dungeon_desc.fetch_manifest_information()
-    dungeon_desc: DestinyActivityDefinition
-    dungeon_image = await open_image(dungeon_desc.pgcr_image)
-
-    background = Image.new('RGBA', (977, 570))
-    dungeon_box = Image.open(f'{os.path.dirname(__file__)}/../assets/resets/dungeon.png')
-    box_for_crop_temp = (0, 0, *dungeon_box.size)
-    box_for_crop = []
-    for i, coord in enumerate(box_for_crop_temp):
-        if i % 2 == 0:
-            box_for_crop.append(coord + 100)
-        else:
-            box_for_crop.append(coord + 400)
-    cropped_image = dungeon_image.crop(box_for_crop)
-    ellipsed_dungeon_image = dungeon_box.copy()
-    ellipsed_dungeon_image.paste(cropped_image, mask=dungeon_box)
-    cropped_ellipsed_dungeon_image = ellipsed_dungeon_image.crop((150, 0, *ellipsed_dungeon_image.size))
-    dungeon_box.paste(cropped_ellipsed_dungeon_image, (150, 0), mask=cropped_ellipsed_dungeon_image)
-    background.paste(dungeon_box, (90, 146), mask=dungeon_box)
-    draw = ImageDraw.Draw(background)
-    font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                              f'fonts/Montserrat/Montserrat-Bold.ttf', size=48)
-    name = (dungeon_desc.display_properties.name.lower()
+def get_activity_name(activity: DestinyActivityDefinition):
+    return (activity.display_properties.name.lower()
             .replace(': легенда', '')
             .replace(': мастер', '')
             .replace(': нормальный', '').title())
-    draw.text((90, 65), f"{name}", font=font)
-    return background
 
 
-def get_current_dungeon_rotation():
+async def get_activity_box_data(client: CustomClient, activity_hash) -> dict:
+    activity_desc = await client.manifest.fetch(DestinyActivityDefinition, str(activity_hash))
+    await activity_desc.fetch_manifest_information()
+    activity_desc: DestinyActivityDefinition
+    return {'name': get_activity_name(activity_desc), 'image': await fetch_image(activity_desc.pgcr_image)}
+
+
+async def get_raid_box_data(client: CustomClient, delta=0) -> dict:
+    return await get_activity_box_data(client, get_current_raid_rotation(delta))
+
+
+async def get_dungeon_box_data(client: CustomClient, delta=0) -> dict:
+    return await get_activity_box_data(client, get_current_dungeon_rotation(delta))
+
+
+def get_current_dungeon_rotation(delta=0):
     rotations = {
         1: 1375089621,  # 'Яма ереси',
         2: 1077850348,  # 'Откровение',
@@ -366,94 +342,51 @@ def get_current_dungeon_rotation():
         4: 2823159265,  # 'Дуальность',
         0: 2032534090,  # 'Расколотый трон',
     }
-    return rotations[get_current_rotation(5)]
+    return rotations[get_current_rotation(5, delta)]
 
 
-async def create_nightfall_box(client: CustomClient, milestones: dict[str, DestinyPublicMilestone]):
-    background = Image.new('RGBA', (977, 570))
-    nightfall_box = Image.open(f'{os.path.dirname(__file__)}/../assets/resets/nightfall.png')
+nightfall_icons = {
+    'void': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_ceb2f6197dccf3958bb31cc783eb97a0.png',
+    'solar': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_2a1773e10968f2d088b97c22b22bba9e.png',
+    'arc': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_092d066688b879c807c3b460afdd61e6.png',
+    'barrier': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_07b9ba0194e85e46b258b04783e93d5d.png',
+    'unstoppable': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_825a438c85404efd6472ff9e97fc7251'
+                   '.png',
+    'overload': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_da558352b624d799cf50de14d7cb9565.png'
+}
+
+
+async def get_nightfall_box_data(client: CustomClient, milestones: dict[str, DestinyPublicMilestone]) -> dict:
     strike_nightfall, current_burn, current_weapons, current_shields, current_champions = \
         await get_current_nightfall(client=client, milestones=milestones)
 
-    icons = {
-        'void': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_ceb2f6197dccf3958bb31cc783eb97a0.png',
-        'solar': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_2a1773e10968f2d088b97c22b22bba9e.png',
-        'arc': '/common/destiny2_content/icons/DestinyDamageTypeDefinition_092d066688b879c807c3b460afdd61e6.png',
-        'barrier': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_07b9ba0194e85e46b258b04783e93d5d.png',
-        'unstoppable': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_825a438c85404efd6472ff9e97fc7251'
-                       '.png',
-        'overload': '/common/destiny2_content/icons/DestinyBreakerTypeDefinition_da558352b624d799cf50de14d7cb9565.png'
-    }
+    async def get_nightfall_desc():
+        nightfall_desc = await client.manifest.fetch(DestinyActivityDefinition, strike_nightfall)
+        await nightfall_desc.fetch_manifest_information()
+        nightfall_desc: DestinyActivityDefinition
+        return nightfall_desc.display_properties.description.title(), await fetch_image(nightfall_desc.pgcr_image)
 
-    nightfall_desc = await client.manifest.fetch(DestinyActivityDefinition, strike_nightfall)
-    await nightfall_desc.fetch_manifest_information()
-    nightfall_desc: DestinyActivityDefinition
-    nightfall_image = await open_image(nightfall_desc.pgcr_image)
-    box_for_crop_temp = (0, 0, *nightfall_box.size)
-    box_for_crop = []
-    for i, coord in enumerate(box_for_crop_temp):
-        if i % 2 == 0:
-            box_for_crop.append(coord + 100)
-        else:
-            box_for_crop.append(coord + 400)
-    cropped_image = nightfall_image.crop(box_for_crop)
-    ellipsed_nightfall_image = nightfall_box.copy()
-    ellipsed_nightfall_image.paste(cropped_image, mask=nightfall_box)
-    cropped_ellipsed_nightfall_image = ellipsed_nightfall_image.crop((150, 0, *ellipsed_nightfall_image.size))
-
-    nightfall_box.paste(cropped_ellipsed_nightfall_image, (150, 0), mask=cropped_ellipsed_nightfall_image)
-
-    x, y = 715, 100
-    for shield in current_shields:
-        shield_image = Image.new('RGBA', (600, 600))
-        draw = ImageDraw.Draw(shield_image)
-        draw.ellipse((0, 0, 600, 600), fill='white')
-        shield_image = shield_image.resize((60, 60), Resampling.LANCZOS)
-
-        shield_icon = (await open_image(icons[shield])).convert("RGBA")
-        shield_icon = shield_icon.resize((36, 36), Resampling.LANCZOS)
-        shield_image.paste(shield_icon, (12, 12), mask=shield_icon)
-        nightfall_box.paste(shield_image, (x, y), mask=shield_image)
-        x -= 75
-
-    x, y = 715, 175
-    for champion in current_champions:
-        champion_image = (await open_image(icons[champion])).convert("RGBA")
-        champion_image = champion_image.resize((60, 60), Resampling.LANCZOS)
-        nightfall_box.paste(champion_image, (x, y), mask=champion_image)
-        x -= 75
-
-    x, y = 160, 0
-    burn_x, burn_y = x, y
-    for burn in current_burn:
-        burn_def = await client.manifest.fetch(DestinyActivityModifierDefinition, burn)
-        await burn_def.fetch_manifest_information()
-        burn_def: DestinyActivityModifierDefinition
-        burn_name = burn_def.display_properties.name
-        draw = ImageDraw.Draw(nightfall_box)
-        font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                                  f'/fonts/Montserrat/Montserrat-Bold.ttf', size=30)
-        draw.text((burn_x + 2, burn_y + 2), burn_name, font=font, fill='#000000')
-        draw.text((burn_x, burn_y), burn_name, font=font, fill='#ffffff')
-        burn_y += 40
-
-    burn_x, burn_y = x, 175
-    for weapon in current_weapons:
+    async def get_weapon_icon(weapon):
         weapon_mod = await client.manifest.fetch(DestinyActivityModifierDefinition, weapon)
         await weapon_mod.fetch_manifest_information()
         weapon_mod: DestinyActivityModifierDefinition
-
-        weapon_mod_image = (await open_image(weapon_mod.display_properties.icon)).convert("RGBA")
-        weapon_mod_image = weapon_mod_image.resize((60, 60), Resampling.LANCZOS)
-        nightfall_box.paste(weapon_mod_image, (burn_x, burn_y), mask=weapon_mod_image)
-        burn_x += 75
-
-    background.paste(nightfall_box, (90, 146), mask=nightfall_box)
-    draw = ImageDraw.Draw(background)
-    font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                              f'/fonts/Montserrat/Montserrat-Bold.ttf', size=48)
-    draw.text((90, 65), f"{nightfall_desc.display_properties.description.title()}", font=font)
-    return background
+        return await fetch_image(weapon_mod.display_properties.icon)
+
+    (title, image), shields, champions, burns, weapons = await asyncio.gather(
+        get_nightfall_desc(),
+        asyncio.gather(*[fetch_image(nightfall_icons[shield]) for shield in current_shields]),
+        asyncio.gather(*[fetch_image(nightfall_icons[champion]) for champion in current_champions]),
+        asyncio.gather(*[get_definition_name(client, DestinyActivityModifierDefinition, burn)
+                         for burn in current_burn]),
+        asyncio.gather(*[get_weapon_icon(weapon) for weapon in current_weapons]))
+    return {
+        'title': title,
+        'image': image,
+        'shields': list(shields),
+        'champions': list(champions),
+        'burns': list(burns),
+        'weapons': list(weapons),
+    }
 
 
 async def get_current_nightfall(client: CustomClient, milestones: dict[str, DestinyPublicMilestone]):
@@ -462,20 +395,21 @@ async def get_current_nightfall(client: CustomClient, milestones: dict[str, Dest
                    1282934989, 1326581064]
     strike_nightfall = milestones[str(2029743966)].activities[-1]
     strike_nightfall_modifiers = strike_nightfall.modifier_hashes
-    current_burn = []
-    current_weapons = []
+    current_burn = [modif for modif in strike_nightfall_modifiers if modif in all_burns]
+    current_weapons = [modif for modif in strike_nightfall_modifiers if modif in all_weapons]
     current_shields = []
     current_champions = []
-    for modif in strike_nightfall_modifiers:
-        if modif in all_burns:
-            current_burn.append(modif)
-            continue
-        if modif in all_weapons:
-            current_weapons.append(modif)
-            continue
+
+    async def get_modifier_definition(modif) -> DestinyActivityModifierDefinition:
         modifier_definition = await client.manifest.fetch(DestinyActivityModifierDefinition, str(modif))
         await modifier_definition.fetch_manifest_information()
-        modifier_definition: DestinyActivityModifierDefinition
+        return modifier_definition
+
+    # Определения остальных модификаторов запрашиваются одновременно
+    modifiers_definitions = await asyncio.gather(*[get_modifier_definition(modif)
+                                                   for modif in strike_nightfall_modifiers
+                                                   if modif not in all_burns and modif not in all_weapons])
+    for modifier_definition in modifiers_definitions:
         if '[Пустота]' in modifier_definition.display_properties.description:
             current_shields.append('void')
         if '[Солнце]' in modifier_definition.display_properties.description:
@@ -494,21 +428,14 @@ async def get_current_nightfall(client: CustomClient, milestones: dict[str, Dest
         list(set(current_shields)), list(set(current_champions))
 
 
-async def get_current_comp_box(client: CustomClient):
-    mission_desc = await client.manifest.fetch(DestinyActivityDefinition, str(get_current_comp_mission()))
+async def get_comp_box_data(client: CustomClient, delta=0) -> str:
+    mission_desc = await client.manifest.fetch(DestinyActivityDefinition, str(get_current_comp_mission(delta)))
     await mission_desc.fetch_manifest_information()
     mission_desc: DestinyActivityDefinition
-
-    background = Image.new('RGBA', (977, 570))
-    draw = ImageDraw.Draw(background)
-    font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                              f'/fonts/Montserrat/Montserrat-Bold.ttf', size=48)
-    name = mission_desc.display_properties.name.lower().replace(': классика', '').title()
-    draw.text((90, 65), f"{name}", font=font)
-    return background
+    return mission_desc.display_properties.name.lower().replace(': классика', '').title()
 
 
-def get_current_comp_mission():
+def get_current_comp_mission(delta=0):
     missions = {
         7: 2101866276,
         0: 2879686618,
@@ -519,21 +446,10 @@ def get_current_comp_mission():
         5: 264882961,
         6: 1152906386,
     }
-    return missions[get_current_rotation(8)]
-
-
-def get_dares_box():
-    background = Image.new('RGBA', (977, 570))
-    dares_rotation = get_current_dares_of_eternity()
-    draw = ImageDraw.Draw(background)
-    font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                              f'/fonts/Montserrat/Montserrat-Bold.ttf', size=48)
-    name = f"{dares_rotation[0]} > {dares_rotation[1]} > {dares_rotation[2]}"
-    draw.text((90, 65), f"{name}", font=font)
-    return background
+    return missions[get_current_rotation(8, delta)]
 
 
-def get_current_dares_of_eternity():
+def get_current_dares_of_eternity(delta=0):
     dares = {
         2: ['Вексы', 'Кабал', 'Улей'],
         1: ['Улей', 'Падшие', 'Кабал'],
@@ -542,46 +458,16 @@ def get_current_dares_of_eternity():
         4: ['Улей', 'Вексы', 'Кабал'],
         3: ['Падшие', 'Улей', 'Вексы'],
     }
-    return dares[get_current_rotation(6)]
-
-
-async def create_nightmares_box():
-    nightmares = get_current_nightmares()
-    nightmares_box = Image.new('RGBA', (2160, 720))
-    x, y = 0, 0
-    for nightmare in nightmares:
-        image = await open_image(nightmare[3])
-        image = image.crop((280, 0, 1000, 720))
-        nightmares_box.paste(image, (x, y))
-        x += 720
-
-    background = Image.open(f'{os.path.dirname(__file__)}/../assets/resets/raid.png')
-    background_size = background.size
-    background = background.resize(nightmares_box.size)
-    background.paste(nightmares_box, mask=background)
-    nightmares_box = background.resize(background_size)
-
-    background = Image.new('RGBA', (977, 570))
-    background.paste(nightmares_box, (90, 146), mask=nightmares_box)
-    draw = ImageDraw.Draw(background)
-    font_bold = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                                   f'/fonts/Montserrat/Montserrat-Bold.ttf', size=36)
-    font_medium = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                                     f'/fonts/Montserrat/Montserrat-Medium.ttf', size=28)
-    x, y = 90, 400
-    for nightmare in nightmares:
-        draw.text((x, y), f"{nightmare[0]}", font=font_bold)
-        y += 40
-        draw.text((x, y), f"{nightmare[1]}", font=font_medium, fill='#888888')
-        y += 25
-        draw.text((x, y), f"{nightmare[2]}", font=font_medium, fill='#888888')
-        y -= 65
-        x += 265
-
-    return background
-
-
-def get_current_nightmares():
+    return dares[get_current_rotation(6, delta)]
+
+
+async def get_nightmares_data(delta=0):
+    nightmares = get_current_nightmares(delta)
+    images = await asyncio.gather(*[fetch_image(image) for name, boss, duration, image in nightmares])
+    return [(name, boss, duration, image) for (name, boss, duration, _), image in zip(nightmares, images)]
+
+
+def get_current_nightmares(delta=0):
     rotations = {
         0: [1342492675, 2450170731, 2639701103],
         1: [4098556693, 3205253945, 1188363426],
@@ -611,74 +497,19 @@ def get_current_nightmares():
                      '/img/destiny_content/pgcr/nightmare_hunt_servitude.jpg'],
     }
     result = []
-    hashes = rotations[get_current_rotation(8)]
+    hashes = rotations[get_current_rotation(8, delta)]
     for hash_id in hashes:
         result.append(nightmares_names[hash_id])
     return result
 
 
-async def create_all_raids_box():
-    raids_interval = 380
-    background = Image.new('RGBA', (975, len(raids) * (300 + raids_interval)), (0, 0, 0, 0))
-    current_raid = get_current_raid_rotation()
-    x, y = 0, 0
-    for raid in raids:
-        if raid == current_raid:
-            all_challenges = True
-        else:
-            all_challenges = False
-        raid_box = await create_one_raid_box(raids[raid], all_challenges)
-        background.paste(raid_box, (x, y), mask=raid_box)
-        y += raids_interval
-    return background
-
-
-async def create_one_raid_box(raid, all_challenges=False):
-    background = Image.new('RGBA', (975, 300), (0, 0, 0, 0))
-    encounter_box = Image.new('RGBA', (42, 42), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(encounter_box)
-    draw.rectangle((0, 0, 41, 41), outline='#999999', width=4)
-
-    challenge_box = encounter_box.copy()
-    draw = ImageDraw.Draw(challenge_box)
-    draw.rectangle((7, 7, 34, 34), fill='#f0ff00')
-
-    current_challenge = get_current_rotation(len(raid['challenges']))
-
-    raid_icon = (await open_image(raid['icon'])).convert('RGBA')
-    raid_icon_size = (96, 96)
-    raid_icon = raid_icon.resize(raid_icon_size, Resampling.LANCZOS)
-
-    background.paste(raid_icon, (0, 0), mask=raid_icon)
-    x, y = 96 + 15, 0
-    for challenge in raid['challenges']:
-        if challenge == current_challenge or all_challenges:
-            background.paste(challenge_box, (x, y), mask=challenge_box)
-        else:
-            background.paste(encounter_box, (x, y), mask=encounter_box)
-        x += 42 + 6
-
-    raid_name_font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                                        f'/fonts/Montserrat/Montserrat-Bold.ttf', size=60)
-    raid_desc_font = ImageFont.truetype(f'{os.path.dirname(__file__)}/../assets/'
-                                        f'/fonts/Montserrat/Montserrat-Medium.ttf', size=30)
-    x, y = 96 + 10, 42
-    draw = ImageDraw.Draw(background)
-    draw.text((x, y), raid['name'], font=raid_name_font)
-
-    x, y = 96 + 15, 128
-    draw.line((x, y, x + 880, y), fill='#424242', width=5)
-    draw.line((x, y + 56, x + 880, y + 56), fill='#424242', width=5)
-    if all_challenges:
-        draw.text((x, y + 7), 'Недельная ротация', font=raid_desc_font, fill='#6ca0dc')
-    else:
-        draw.text((x, y + 7), raid['challenges'][current_challenge][0], font=raid_desc_font, fill='#6ca0dc')
-
-    x, y = x, 190
-    if all_challenges:
-        draw.text((x, y), 'Доступны все испытания рейда', font=raid_desc_font, fill='#88898a')
-    else:
-        draw.multiline_text((x, y), textwrap.fill(raid['challenges'][current_challenge][1], 45),
-                            font=raid_desc_font, fill='#88898a')
-
-    return background
+async def get_all_raids_data(delta=0):
+    current_raid = get_current_raid_rotation(delta)
+    icons = await asyncio.gather(*[fetch_image(raid['icon']) for raid in raids.values()])
+    return [{
+        'name': raid['name'],
+        'icon': icon,
+        'challenges': raid['challenges'],
+        'current_challenge': get_current_rotation(len(raid['challenges']), delta),
+        'all_challenges': raid_hash == current_raid,
+    } for (raid_hash, raid), icon in zip(raids.items(), icons)]
@@ -0,0 +1,109 @@
+"""
+Отрисовка изображений требований к ролям.
+Функции получают только текст, поэтому выполняются в пуле процессов (utils.rendering.render_png)
+"""
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw
+from cachetools import LRUCache
+
+from utils.asset_registry import get_font
+
+text_colour = '#FFFFFF'
+title_font_name = 'fonts/Montserrat/Montserrat-Black.ttf'
+text_font_name = 'fonts/OpenSans/OpenSans-Light.ttf'
+font_size = 30
+
+
+class TextTilesCache:
+    """
+    Отрисованные строки текста (заголовки групп и тексты требований) в процессе отрисовки.
+    Текст требования меняется только вместе с требованием, поэтому ключом служит сам текст;
+    для каждого пользователя дорисовывается только строка с текущим значением
+    """
+
+    def __init__(self, maxsize: int = 2048):
+        self.tiles = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, font_name: str, size: int, background: tuple) -> Image.Image:
+        key = (text, font_name, size, background)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.hits += 1
+            return tile
+        self.misses += 1
+        font = get_font(font_name, size)
+        box = font.getbbox(text)
+        # Плитка покрывает все пиксели текста, нарисованного из (0, 0) - вставка без маски дает тот же результат
+        tile = Image.new('RGBA', (max(box[2], 1), max(box[3], 1)), background)
+        ImageDraw.Draw(tile).text((0, 0), text, font=font, fill=text_colour)
+        self.tiles[key] = tile
+        return tile
+
+    def get_stats(self) -> dict:
+        return {'tiles': len(self.tiles), 'hits': self.hits, 'misses': self.misses}
+
+
+text_tiles = TextTilesCache()
+
+
+def draw_requirement(requirement_text: str, current_text: str):
+    text_font = get_font(text_font_name, font_size)
+    background_x = []
+    background_y = 0
+    if current_text:
+        box = text_font.getbbox(current_text)
+        background_x.append(box[2] - box[0])
+        background_y += (box[3] - box[1]) * 1.5
+
+    requirement_text_box = text_font.getbbox(requirement_text)
+    background_x.append(requirement_text_box[2] - requirement_text_box[0])
+    background_y += (requirement_text_box[3] - requirement_text_box[1]) * 1.5
+
+    background = Image.new('RGBA', (max(background_x), int(background_y)))
+    draw = ImageDraw.Draw(background)
+    x, y = 0, 0
+
+    background.paste(text_tiles.get(requirement_text, text_font_name, font_size, (0, 0, 0, 0)), (x, y))
+    y += requirement_text_box[3] - requirement_text_box[1]
+
+    if current_text:
+        draw.text((x, y), current_text, font=text_font, fill=text_colour)
+    return background
+
+
+def draw_requirements_group(title: str, requirements: List[Tuple[str, str]]):
+    title_font = get_font(title_font_name, font_size)
+    requirements_images = [draw_requirement(requirement_text, current_text)
+                           for requirement_text, current_text in requirements]
+
+    role_box = title_font.getbbox(title)
+    background_x = [role_box[2] - role_box[0]] + [image.size[0] for image in requirements_images]
+    background_y = role_box[3] - role_box[1] + sum(image.size[1] for image in requirements_images)
+
+    background = Image.new('RGBA', (max(background_x), background_y), (0, 0, 0, 255))
+
+    x, y = 0, 0
+    background.paste(text_tiles.get(title, title_font_name, font_size, (0, 0, 0, 255)), (x, y))
+    y += role_box[3] - role_box[1]
+    for image in requirements_images:
+        background.paste(image, (x, y), mask=image)
+        y += image.size[1]
+    return background
+
+
+def draw_requirements_groups(groups: List[dict]):
+    """Группы требований одна под другой; groups - данные из get_requirements_group_data"""
+    if not groups:
+        return None
+    images = [draw_requirements_group(group['title'], group['requirements']) for group in groups]
+    result_image = Image.new('RGBA', (max(image.size[0] for image in images),
+                                      sum(image.size[1] + 100 for image in images)), (0, 0, 0, 255))
+    x, y = 0, 0
+    for image in images:
+        result_image.paste(image, (x, y), mask=image)
+        y += image.size[1]
+        y += 100
+    return result_image
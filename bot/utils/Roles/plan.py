@@ -0,0 +1,310 @@
+import heapq
+import operator
+from typing import Dict, List, Iterable
+
+from bungio.models import DestinyObjectiveDefinition, DestinyUnlockValueUIStyle, \
+    DestinyHistoricalStatsByPeriod, SingleComponentResponseOfDestinyMetricsComponent, \
+    SingleComponentResponseOfDestinyProfileRecordsComponent, DestinyComponentType, DestinyStatsGroupType
+
+from ORM.schemes.Roles import RoleRequirementGroup, RequirementTriumphScore, RequirementMetricScore, \
+    RequirementTriumphCompleted, RequirementHistoricalStat, RequirementRole, RequirementStatement, \
+    RequirementObjectivesCompleted, RequirementObjectivesValues
+from utils.logger import create_logger
+from utils.manifest_cache import definitions_cache
+
+logger = create_logger(__name__)
+
+STATEMENTS = {
+    RequirementStatement.LESS: operator.lt,
+    RequirementStatement.LESS_OR_EQUAL: operator.le,
+    RequirementStatement.MORE: operator.gt,
+    RequirementStatement.MORE_OR_EQUAL: operator.ge,
+    RequirementStatement.EQUAL: operator.eq,
+    RequirementStatement.NOT_EQUAL: operator.ne,
+}
+
+
+def compare(statement: RequirementStatement, value, required) -> bool:
+    check = STATEMENTS.get(statement)
+    if check is None or value is None:
+        return False
+    return check(value, required)
+
+
+class RequirementResult:
+    __slots__ = ('completed', 'current', 'require')
+
+    def __init__(self, completed: bool, current, require=None):
+        self.completed = completed
+        self.current = current
+        self.require = require
+
+
+class GroupResult:
+    __slots__ = ('group', 'completed', 'requirements')
+
+    def __init__(self, group: RoleRequirementGroup, completed: bool, requirements: Dict[object, RequirementResult]):
+        self.group = group
+        self.completed = completed
+        # Объект требования -> результат проверки
+        self.requirements = requirements
+
+
+class ObjectiveProgress:
+    __slots__ = ('progress', 'complete', 'completion_value')
+
+    def __init__(self, progress, complete, completion_value):
+        self.progress = progress
+        self.complete = complete
+        self.completion_value = completion_value
+
+
+class RequirementsPlan:
+    """
+    Группы требований, скомпилированные в порядок вычисления.
+    Группы, требующие другие роли, вычисляются после групп, выдающих эти роли, поэтому
+    для пользователя достаточно одного прохода без копирования групп.
+    """
+
+    def __init__(self, roles_requirements: Dict[int, RoleRequirementGroup],
+                 objective_definitions: Dict[int, DestinyObjectiveDefinition]):
+        self.groups: List[RoleRequirementGroup] = list(roles_requirements.values())
+        self.objective_definitions = objective_definitions
+        self.managed_roles = {group.role_id for group in self.groups}
+        self.objective_hashes = {requirement.objective_hash for group in self.groups
+                                 for requirement in group.requirements_ObjectivesCompleted +
+                                 group.requirements_ObjectivesValues}
+        # Хеш цели -> ('metric', metric_hash), ('record', record_hash) или None;
+        # заполняется при первой проверке профиля, дальше поиск по всем триумфам не нужен
+        self.objective_locations: Dict[int, tuple] = {}
+        self.order, self.cyclic_roles = self.build_order()
+        self.components = self.get_components()
+        # Группы исторической статистики; None - нужны все (уточняются в compile_requirements_plan)
+        self.stat_groups: List[DestinyStatsGroupType] | None = \
+            None if any(group.requirements_HistoricalStat for group in self.groups) else []
+        # Для каждой группы заранее выбирается функция проверки каждого требования
+        self.steps = [(group, [(EVALUATORS[type(requirement)], requirement)
+                               for requirement in get_group_requirements(group)])
+                      for group in self.order]
+
+    def build_order(self):
+        groups_by_role: Dict[int, List[int]] = {}
+        for i, group in enumerate(self.groups):
+            groups_by_role.setdefault(group.role_id, []).append(i)
+
+        dependents: Dict[int, List[int]] = {i: [] for i in range(len(self.groups))}
+        in_degree = [0] * len(self.groups)
+        for i, group in enumerate(self.groups):
+            for requirement in group.requirements_Role:
+                for j in groups_by_role.get(requirement.role_id, []):
+                    if j != i:
+                        dependents[j].append(i)
+                        in_degree[i] += 1
+
+        # Топологическая сортировка с сохранением порядка sort_key среди независимых групп
+        ready = [i for i, degree in enumerate(in_degree) if degree == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            i = heapq.heappop(ready)
+            order.append(i)
+            for j in dependents[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    heapq.heappush(ready, j)
+
+        cyclic_roles = set()
+        if len(order) != len(self.groups):
+            cyclic = [i for i in range(len(self.groups)) if i not in set(order)]
+            cyclic_roles = {self.groups[i].role_id for i in cyclic}
+            logger.warning(f'Найден цикл в требованиях к ролям: {cyclic_roles}. '
+                           f'Для этих групп используются текущие роли пользователя')
+            order += cyclic
+        return [self.groups[i] for i in order], cyclic_roles
+
+    def get_components(self) -> List[DestinyComponentType]:
+        """Компоненты профиля, которые нужны требованиям всех групп"""
+        components = set()
+        for group in self.groups:
+            if group.requirements_MetricScore:
+                components.add(DestinyComponentType.METRICS)
+            if group.requirements_TriumphScore or group.requirements_TriumphCompleted:
+                components.add(DestinyComponentType.RECORDS)
+            # Цели могут быть как в метриках, так и в триумфах
+            if group.requirements_ObjectivesCompleted or group.requirements_ObjectivesValues:
+                components.update((DestinyComponentType.METRICS, DestinyComponentType.RECORDS))
+        return sorted(components, key=lambda component: component.value)
+
+    def _scan_objectives(self, metrics, records, objective_hash):
+        # Как и раньше, побеждает последнее совпадение: триумф перекрывает метрику
+        location = None
+        for metric_hash, metric in metrics.data.metrics.items():
+            if metric.objective_progress.objective_hash == objective_hash:
+                location = 'metric', metric_hash
+        for record_hash, record in records.data.records.items():
+            for objective in (record.objectives or []) + (record.interval_objectives or []):
+                if objective.objective_hash == objective_hash:
+                    location = 'record', record_hash
+        return location
+
+    def _get_objective(self, metrics, records, objective_hash) -> ObjectiveProgress | None:
+        if objective_hash in self.objective_locations:
+            location = self.objective_locations[objective_hash]
+        else:
+            location = self._scan_objectives(metrics, records, objective_hash)
+            # Отсутствие цели запоминается только при заполненных метриках и триумфах
+            # (скрытый или частично полученный профиль ничего не доказывает)
+            if location or (metrics.data.metrics and records.data.records):
+                self.objective_locations[objective_hash] = location
+        if location is None:
+            return None
+
+        source, key = location
+        if source == 'metric':
+            metric = metrics.data.metrics.get(key)
+            if metric and metric.objective_progress.objective_hash == objective_hash:
+                progress = metric.objective_progress
+                return ObjectiveProgress(progress.progress, progress.complete, progress.completion_value)
+        else:
+            record = records.data.records.get(key)
+            if record:
+                for objective in (record.objectives or []) + (record.interval_objectives or []):
+                    if objective.objective_hash == objective_hash:
+                        return ObjectiveProgress(objective.progress, objective.complete, objective.completion_value)
+        return None
+
+    def index_objectives(self, metrics, records) -> Dict[int, ObjectiveProgress]:
+        objectives = {}
+        for objective_hash in self.objective_hashes:
+            objective = self._get_objective(metrics, records, objective_hash)
+            if objective:
+                objectives[objective_hash] = objective
+        return objectives
+
+    def evaluate(self,
+                 metrics: SingleComponentResponseOfDestinyMetricsComponent,
+                 records: SingleComponentResponseOfDestinyProfileRecordsComponent,
+                 stats: dict[str, DestinyHistoricalStatsByPeriod],
+                 user_roles: Iterable[int]) -> List[GroupResult]:
+        # Роли, выдаваемые группами, определяются заново; кроме ролей из циклов - для них берутся текущие
+        roles = set(user_roles) - (self.managed_roles - self.cyclic_roles)
+        profile = ProfileData(metrics, records, stats, self.index_objectives(metrics, records), roles)
+        results: Dict[int, GroupResult] = {}
+        for group, steps in self.steps:
+            requirements_results = {requirement: evaluator(self, requirement, profile)
+                                    for evaluator, requirement in steps}
+            completed = all(result.completed for result in requirements_results.values())
+            if completed:
+                roles.add(group.role_id)
+            results[group.group_id] = GroupResult(group, completed, requirements_results)
+        return [results[group.group_id] for group in self.groups]
+
+
+class ProfileData:
+    __slots__ = ('metrics', 'records', 'stats', 'objectives', 'roles')
+
+    def __init__(self, metrics, records, stats, objectives: Dict[int, ObjectiveProgress], roles: set):
+        self.metrics = metrics
+        self.records = records
+        self.stats = stats
+        self.objectives = objectives
+        self.roles = roles
+
+
+def evaluate_triumph_score(plan, requirement: RequirementTriumphScore, profile: ProfileData):
+    score = profile.records.data.active_score
+    return RequirementResult(compare(requirement.statement, score, requirement.value), score)
+
+
+def evaluate_metric_score(plan, requirement: RequirementMetricScore, profile: ProfileData):
+    metric = profile.metrics.data.metrics.get(requirement.metric_hash, None)
+    if metric is None:
+        return RequirementResult(False, None)
+    value = metric.objective_progress.progress
+    return RequirementResult(compare(requirement.statement, value, requirement.value), value)
+
+
+def evaluate_historical_stat(plan, requirement: RequirementHistoricalStat, profile: ProfileData):
+    try:
+        value = profile.stats[requirement.historical_stat_group.value]. \
+            all_time[requirement.historical_stat_name].basic.value
+    except (KeyError, AttributeError, TypeError):
+        return RequirementResult(False, None)
+    return RequirementResult(compare(requirement.statement, value, requirement.value), value)
+
+
+def evaluate_triumph_completed(plan, requirement: RequirementTriumphCompleted, profile: ProfileData):
+    record = profile.records.data.records.get(requirement.record_hash, None)
+    if record is None:
+        return RequirementResult(False, None)
+    completed = all(objective.complete for objective in record.objectives or []) and \
+        all(objective.complete for objective in record.interval_objectives or [])
+    return RequirementResult(completed == requirement.completed, completed)
+
+
+def evaluate_objective_completed(plan, requirement: RequirementObjectivesCompleted, profile: ProfileData):
+    definition = plan.objective_definitions.get(requirement.objective_hash)
+    objective = profile.objectives.get(requirement.objective_hash)
+    if objective:
+        completed = requirement.completed == objective.complete
+        value, completion_value = objective.progress, objective.completion_value
+    else:
+        completed, value = False, 0
+        completion_value = getattr(definition, 'completion_value', None)
+    if definition and definition.value_style == DestinyUnlockValueUIStyle.RAW_FLOAT:
+        value = value / 100
+        completion_value = completion_value / 100 if completion_value is not None else None
+    return RequirementResult(completed, value, completion_value)
+
+
+def evaluate_objective_values(plan, requirement: RequirementObjectivesValues, profile: ProfileData):
+    objective = profile.objectives.get(requirement.objective_hash)
+    value = objective.progress if objective else 0
+    return RequirementResult(compare(requirement.statement, value, requirement.value), value)
+
+
+def evaluate_role(plan, requirement: RequirementRole, profile: ProfileData):
+    completed = requirement.role_id in profile.roles
+    return RequirementResult(completed, completed)
+
+
+EVALUATORS = {
+    RequirementTriumphScore: evaluate_triumph_score,
+    RequirementMetricScore: evaluate_metric_score,
+    RequirementHistoricalStat: evaluate_historical_stat,
+    RequirementTriumphCompleted: evaluate_triumph_completed,
+    RequirementObjectivesCompleted: evaluate_objective_completed,
+    RequirementObjectivesValues: evaluate_objective_values,
+    RequirementRole: evaluate_role,
+}
+
+
+def get_group_requirements(group: RoleRequirementGroup) -> list:
+    return group.requirements_TriumphScore + group.requirements_MetricScore + \
+        group.requirements_HistoricalStat + group.requirements_TriumphCompleted + \
+        group.requirements_ObjectivesCompleted + group.requirements_ObjectivesValues + \
+        group.requirements_Role
+
+
+async def compile_requirements_plan(roles_requirements: Dict[int, RoleRequirementGroup], client) -> RequirementsPlan:
+    objective_definitions = {}
+    for group in roles_requirements.values():
+        for requirement in group.requirements_ObjectivesCompleted:
+            if requirement.objective_hash not in objective_definitions:
+                objective_definitions[requirement.objective_hash] = \
+                    await definitions_cache.fetch(client, DestinyObjectiveDefinition, requirement.objective_hash)
+    plan = RequirementsPlan(roles_requirements, objective_definitions)
+    stat_names = {requirement.historical_stat_name for group in roles_requirements.values()
+                  for requirement in group.requirements_HistoricalStat}
+    if stat_names:
+        try:
+            stats_definition = await definitions_cache.get_historical_stats_definition(client)
+        except Exception as e:
+            # Без определений статистики загружаются все группы (plan.stat_groups остается None)
+            logger.warning(f'Не удалось загрузить определения исторической статистики: {e}')
+            return plan
+        stat_groups = {getattr(stats_definition.get(name), 'group', None) for name in stat_names}
+        # Неизвестная статистика - загружаются все группы
+        if None not in stat_groups:
+            plan.stat_groups = sorted(stat_groups, key=lambda group: group.value)
+    return plan
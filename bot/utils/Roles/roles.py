@@ -1,25 +1,23 @@
-import os
 from typing import Union, List
 
 import bungio
 import discord
-from PIL import Image, ImageFont, ImageDraw
-from PIL.ImageFont import FreeTypeFont
 from bungio.models import DestinyMetricDefinition, DestinyRecordDefinition, DestinyHistoricalStatsDefinition, \
-    DestinyMetricComponent, DestinyRecordComponent, \
-    DestinyHistoricalStatsAccountResult, SingleComponentResponseOfDestinyMetricsComponent, \
-    SingleComponentResponseOfDestinyProfileRecordsComponent, DestinyHistoricalStatsValue, \
-    DestinyObjectiveDefinition, DestinyUnlockValueUIStyle, DestinyHistoricalStatsByPeriod
+    DestinyObjectiveDefinition
 from discord import Interaction, SelectOption, ButtonStyle
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
 from ORM.schemes.Roles import RoleRequirementGroup, RequirementTriumphScore, RequirementMetricScore, \
-    RequirementTriumphCompleted, RequirementHistoricalStat, RequirementRole, RequirementStatement, \
-    HistoricalStatsGroup, RequirementObjectivesCompleted, RequirementObjectivesValues
+    RequirementTriumphCompleted, RequirementHistoricalStat, RequirementRole, \
+    RequirementObjectivesCompleted, RequirementObjectivesValues
+from utils.Roles.drawing import draw_requirements_group, draw_requirements_groups
+from utils.Roles.plan import GroupResult, RequirementResult
 from utils.bungio_client import CustomClient
 from utils.logger import create_logger
+from utils.manifest_cache import definitions_cache
+from utils.rendering import render_png
 
 logger = create_logger(__name__)
 
@@ -153,8 +151,7 @@ async def render_requirements_group(requirement_group: RoleRequirementGroup, cli
     for req in requirement_group.requirements_MetricScore:
         req: RequirementMetricScore
         if client:
-            metric_definition = await client.manifest.fetch(DestinyMetricDefinition, req.metric_hash)
-            await metric_definition.fetch_manifest_information()
+            metric_definition = await definitions_cache.fetch(client, DestinyMetricDefinition, req.metric_hash)
             metric_definition: DestinyMetricDefinition
             metric_description = f"{metric_definition.display_properties.description}"
         else:
@@ -168,8 +165,7 @@ async def render_requirements_group(requirement_group: RoleRequirementGroup, cli
     for req in requirement_group.requirements_TriumphCompleted:
         req: RequirementTriumphCompleted
         if client:
-            record_definition = await client.manifest.fetch(DestinyRecordDefinition, req.record_hash)
-            await record_definition.fetch_manifest_information()
+            record_definition = await definitions_cache.fetch(client, DestinyRecordDefinition, req.record_hash)
             record_definition: DestinyRecordDefinition
             record_description = f"{record_definition.display_properties.description}"
         else:
@@ -179,7 +175,7 @@ async def render_requirements_group(requirement_group: RoleRequirementGroup, cli
         description += '\n'
 
     if requirement_group.requirements_HistoricalStat:
-        historical_stats_definition = await client.api.get_historical_stats_definition()
+        historical_stats_definition = await definitions_cache.get_historical_stats_definition(client)
         description += 'Требования к агрегированной статистике (REQUIREMENT_HISTORICAL_STAT)\n'
     else:
         historical_stats_definition = {}
@@ -201,8 +197,7 @@ async def render_requirements_group(requirement_group: RoleRequirementGroup, cli
     for req in requirement_group.requirements_ObjectivesCompleted:
         req: RequirementObjectivesCompleted
         if client:
-            objective_definition = await client.manifest.fetch(DestinyObjectiveDefinition, req.objective_hash)
-            await objective_definition.fetch_manifest_information()
+            objective_definition = await definitions_cache.fetch(client, DestinyObjectiveDefinition, req.objective_hash)
             objective_definition: DestinyObjectiveDefinition
             objective_description = f"{objective_definition.progress_description}"
         else:
@@ -221,25 +216,20 @@ async def render_requirements_group(requirement_group: RoleRequirementGroup, cli
     return embed
 
 
-async def render_requirements_group_image(requirement_group: RoleRequirementGroup, client: CustomClient | None,
-                                          guild: discord.Guild, need_id=False):
-    path = f'{os.path.dirname(__file__)}/../assets'
-    title_font = ImageFont.truetype(f'{path}/fonts/Montserrat/Montserrat-Black.ttf', size=30)
-    sub_title_font = ImageFont.truetype(f'{path}/fonts/OpenSans/OpenSans-Light.ttf', size=30)
-    text_font = ImageFont.truetype(f'{path}/fonts/OpenSans/OpenSans-Light.ttf', size=30)
-    text_colour = '#FFFFFF'
-    historical_stats_definition = await client.api.get_historical_stats_definition()
+async def get_requirements_group_data(requirement_group: RoleRequirementGroup, client: CustomClient | None,
+                                      guild: discord.Guild, need_id=False,
+                                      result: GroupResult | None = None) -> dict | None:
+    historical_stats_definition = await definitions_cache.get_historical_stats_definition(client)
 
     requirement_role = guild.get_role(requirement_group.role_id)
     if not requirement_role:
         requirement_role = requirement_group.role_id
     requirement_role = str(requirement_role)
-    if getattr(requirement_group, 'completed', None) is not None:
-        requirement_role = f"{requirement_group.completed} {requirement_role}"
+    if result is not None:
+        requirement_role = f"{result.completed} {requirement_role}"
     if need_id:
         requirement_role = f"ID: {requirement_group.group_id} (sort: {requirement_group.sort_key}) {requirement_role}"
 
-    requirements_images = {}
     all_requirements = requirement_group.requirements_ObjectivesCompleted + requirement_group.requirements_Role + \
                        requirement_group.requirements_MetricScore + requirement_group.requirements_TriumphScore + \
                        requirement_group.requirements_HistoricalStat + \
@@ -247,49 +237,32 @@ async def render_requirements_group_image(requirement_group: RoleRequirementGrou
                        requirement_group.requirements_ObjectivesValues
     if not all_requirements:
         return
+    requirements = []
     for requirement in all_requirements:
-        requirement_image = await render_requirement(requirement,
-                                                     client=client,
-                                                     text_font=text_font,
-                                                     text_colour=text_colour,
-                                                     guild=guild,
-                                                     historical_stats_definition=historical_stats_definition,
-                                                     need_id=need_id)
-        requirement_class_name = requirement.__class__.__name__
-        if requirement_class_name in requirements_images:
-            requirements_images[requirement_class_name][requirement.requirement_id] = requirement_image
-        else:
-            requirements_images[requirement_class_name] = {requirement.requirement_id: requirement_image}
-
-    background_x = []
-    background_y = 0
-    role_box = title_font.getbbox(requirement_role)
-    background_x.append(role_box[2] - role_box[0])
-    background_y += role_box[3] - role_box[1]
-    for requirement_class_name in requirements_images:
-        for requirement_id in requirements_images[requirement_class_name]:
-            req_im_size = requirements_images[requirement_class_name][requirement_id].size
-            background_x.append(req_im_size[0])
-            background_y += req_im_size[1]
+        requirements.append(await get_requirement_text(requirement,
+                                                       client=client,
+                                                       guild=guild,
+                                                       historical_stats_definition=historical_stats_definition,
+                                                       need_id=need_id,
+                                                       result=result.requirements.get(requirement) if result else None))
+    return {'title': requirement_role, 'requirements': requirements}
 
-    background = Image.new('RGBA', (max(background_x), background_y), (0, 0, 0, 255))
-    draw = ImageDraw.Draw(background)
 
-    x, y = 0, 0
-    draw.text((x, y), requirement_role, font=title_font, fill=text_colour)
-    y += role_box[3] - role_box[1]
+async def render_requirements_group_image(requirement_group: RoleRequirementGroup, client: CustomClient | None,
+                                          guild: discord.Guild, need_id=False,
+                                          result: GroupResult | None = None) -> bytes | None:
+    group_data = await get_requirements_group_data(requirement_group, client=client, guild=guild,
+                                                   need_id=need_id, result=result)
+    if not group_data:
+        return
+    return await render_png(draw_requirements_group, group_data['title'], group_data['requirements'])
 
-    for requirement_class_name in requirements_images:
-        for requirement_id in requirements_images[requirement_class_name]:
-            background.paste(requirements_images[requirement_class_name][requirement_id], (x, y),
-                             mask=requirements_images[requirement_class_name][requirement_id])
-            req_im_size = requirements_images[requirement_class_name][requirement_id].size
-            y += req_im_size[1]
 
-    return background
+async def render_requirements_groups_image(groups_data: List[dict | None]) -> bytes | None:
+    return await render_png(draw_requirements_groups, [group for group in groups_data if group])
 
 
-async def render_requirement(requirement: Union[
+async def get_requirement_text(requirement: Union[
     RequirementRole,
     RequirementTriumphScore,
     RequirementMetricScore,
@@ -297,16 +270,13 @@ async def render_requirement(requirement: Union[
     RequirementHistoricalStat,
     RequirementObjectivesCompleted,
     RequirementObjectivesValues],
-                             text_font: FreeTypeFont,
-                             text_colour: str,
-                             guild: discord.Guild,
-                             client: CustomClient | None,
-                             historical_stats_definition: dict[str, DestinyHistoricalStatsDefinition] = None,
-                             need_id: bool = True):
+                               guild: discord.Guild,
+                               client: CustomClient | None,
+                               historical_stats_definition: dict[str, DestinyHistoricalStatsDefinition] = None,
+                               need_id: bool = True,
+                               result: RequirementResult | None = None) -> (str, str):
     if historical_stats_definition is None:
         historical_stats_definition = {}
-    background_x = []
-    background_y = 0
 
     if need_id:
         requirement_text = f'ID: {requirement.requirement_id} '
@@ -320,8 +290,8 @@ async def render_requirement(requirement: Union[
             requirement_text += f'Иметь роль {role.name}\n'
         elif isinstance(requirement, RequirementMetricScore):
             if client:
-                metric_definition = await client.manifest.fetch(DestinyMetricDefinition, requirement.metric_hash)
-                await metric_definition.fetch_manifest_information()
+                metric_definition = await definitions_cache.fetch(client, DestinyMetricDefinition,
+                                                                  requirement.metric_hash)
                 metric_definition: DestinyMetricDefinition
                 metric_description = f"{metric_definition.display_properties.description}"
             else:
@@ -330,8 +300,8 @@ async def render_requirement(requirement: Union[
                                 f'«{metric_description}» {requirement.statement.value} {requirement.value}\n'
         elif isinstance(requirement, RequirementTriumphCompleted):
             if client:
-                record_definition = await client.manifest.fetch(DestinyRecordDefinition, requirement.record_hash)
-                await record_definition.fetch_manifest_information()
+                record_definition = await definitions_cache.fetch(client, DestinyRecordDefinition,
+                                                                  requirement.record_hash)
                 record_definition: DestinyRecordDefinition
                 record_description = f"{record_definition.display_properties.description}"
             else:
@@ -348,9 +318,8 @@ async def render_requirement(requirement: Union[
                                 f'{requirement.statement.value} {requirement.value}\n'
         elif isinstance(requirement, RequirementObjectivesCompleted):
             if client:
-                objective_definition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                   requirement.objective_hash)
-                await objective_definition.fetch_manifest_information()
+                objective_definition = await definitions_cache.fetch(client, DestinyObjectiveDefinition,
+                                                                     requirement.objective_hash)
                 objective_definition: DestinyObjectiveDefinition
                 objective_description = f"{objective_definition.progress_description}"
             else:
@@ -359,9 +328,8 @@ async def render_requirement(requirement: Union[
 
         elif isinstance(requirement, RequirementObjectivesValues):
             if client:
-                objective_definition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                   requirement.objective_hash)
-                await objective_definition.fetch_manifest_information()
+                objective_definition = await definitions_cache.fetch(client, DestinyObjectiveDefinition,
+                                                                     requirement.objective_hash)
                 objective_definition: DestinyObjectiveDefinition
                 objective_description = f"{objective_definition.progress_description}"
             else:
@@ -375,9 +343,9 @@ async def render_requirement(requirement: Union[
         if need_id:
             requirement_text = f'ID: {requirement.requirement_id} {requirement.custom_text}'
 
-    completed = getattr(requirement, 'fact_completed', None)
-    current = getattr(requirement, 'current', None)
-    require = getattr(requirement, 'require', None)
+    completed = getattr(result, 'completed', None)
+    current = getattr(result, 'current', None)
+    require = getattr(result, 'require', None)
     if require is None:
         require = getattr(requirement, 'value', None)
     current_text = ''
@@ -387,26 +355,7 @@ async def render_requirement(requirement: Union[
         current_text = f'Текущее значение: {current}'
         if require is not None:
             current_text += f' (Нужно {require})'
-
-        box = text_font.getbbox(current_text)
-        background_x.append(box[2] - box[0])
-        background_y += (box[3] - box[1]) * 1.5
-
-    requirement_text_box = text_font.getbbox(requirement_text)
-    background_x.append(requirement_text_box[2] - requirement_text_box[0])
-    background_y += (requirement_text_box[3] - requirement_text_box[1]) * 1.5
-
-    background = Image.new('RGBA', (max(background_x), int(background_y)))
-    draw = ImageDraw.Draw(background)
-    x, y = 0, 0
-
-    draw.text((x, y), requirement_text, font=text_font, fill=text_colour)
-    y += requirement_text_box[3] - requirement_text_box[1]
-
-    if current_text:
-        draw.text((x, y), current_text, font=text_font, fill=text_colour)
-
-    return background
+    return requirement_text, current_text
 
 
 async def get_roles_requirements(db_engine):
@@ -427,237 +376,33 @@ async def get_roles_requirements(db_engine):
     return {req.group_id: req for req in all_roles_requirements}
 
 
-async def validate_triumph_score(records: SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                 requirement: RequirementTriumphScore):
-    triump_score = records.data.active_score
-    if requirement.statement == RequirementStatement.LESS:
-        return triump_score < requirement.value, triump_score
-    elif requirement.statement == RequirementStatement.LESS_OR_EQUAL:
-        return triump_score <= requirement.value, triump_score
-    elif requirement.statement == RequirementStatement.MORE:
-        return triump_score > requirement.value, triump_score
-    elif requirement.statement == RequirementStatement.MORE_OR_EQUAL:
-        return triump_score >= requirement.value, triump_score
-    elif requirement.statement == RequirementStatement.EQUAL:
-        return triump_score == requirement.value, triump_score
-    elif requirement.statement == RequirementStatement.NOT_EQUAL:
-        return triump_score != requirement.value, triump_score
-    return False, triump_score
-
-
-async def validate_metric_score(metrics: SingleComponentResponseOfDestinyMetricsComponent,
-                                requirement: RequirementMetricScore):
-    metric = metrics.data.metrics.get(requirement.metric_hash, None)
-    if not isinstance(metric, DestinyMetricComponent):
-        return False, None
-    metric_value = metric.objective_progress.progress
-    if requirement.statement == RequirementStatement.LESS:
-        return metric_value < requirement.value, metric_value
-    elif requirement.statement == RequirementStatement.LESS_OR_EQUAL:
-        return metric_value <= requirement.value, metric_value
-    elif requirement.statement == RequirementStatement.MORE:
-        return metric_value > requirement.value, metric_value
-    elif requirement.statement == RequirementStatement.MORE_OR_EQUAL:
-        return metric_value >= requirement.value, metric_value
-    elif requirement.statement == RequirementStatement.EQUAL:
-        return metric_value == requirement.value, metric_value
-    elif requirement.statement == RequirementStatement.NOT_EQUAL:
-        return metric_value != requirement.value, metric_value
-    return False, metric_value
-
-
-async def validate_historical_stat(stats: dict[str, DestinyHistoricalStatsByPeriod],
-                                   requirement: RequirementHistoricalStat):
-    value = stats[requirement.historical_stat_group.value].all_time[requirement.historical_stat_name].basic.value
-    if requirement.statement == RequirementStatement.LESS:
-        return value < requirement.value, value
-    elif requirement.statement == RequirementStatement.LESS_OR_EQUAL:
-        return value <= requirement.value, value
-    elif requirement.statement == RequirementStatement.MORE:
-        return value > requirement.value, value
-    elif requirement.statement == RequirementStatement.MORE_OR_EQUAL:
-        return value >= requirement.value, value
-    elif requirement.statement == RequirementStatement.EQUAL:
-        return value == requirement.value, value
-    elif requirement.statement == RequirementStatement.NOT_EQUAL:
-        return value != requirement.value, value
-    return False, value
-
-
-async def validate_triump_completed(records: SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                    requirement: RequirementTriumphCompleted):
-    triump = records.data.records.get(requirement.record_hash, None)
-    if not isinstance(triump, DestinyRecordComponent):
-        return False, None
-    triump: DestinyRecordComponent
-    objectives_completed = True
-    interval_objectives_completed = True
-    if triump.objectives:
-        objectives_completed = all([obj.complete for obj in triump.objectives])
-    if triump.interval_objectives:
-        interval_objectives_completed = all([obj.complete for obj in triump.interval_objectives])
-    triump_completed = objectives_completed and interval_objectives_completed
-    return triump_completed == requirement.completed, triump_completed
-
-
-async def validate_role(member: discord.Member, requirement: RequirementRole):
-    role = member.get_role(requirement.role_id)
-    return bool(role)
-
-
-async def validate_objective_complete(records: SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                      metrics: SingleComponentResponseOfDestinyMetricsComponent,
-                                      requirement: RequirementObjectivesCompleted,
-                                      client):
-    for metric in metrics.data.metrics:
-        if metrics.data.metrics[metric].objective_progress.objective_hash == requirement.objective_hash:
-            completed = requirement.completed == metrics.data.metrics[metric].objective_progress.complete
-            value = metrics.data.metrics[metric].objective_progress.progress
-            completion_value = metrics.data.metrics[metric].objective_progress.completion_value
-
-            obj: DestinyObjectiveDefinition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                          requirement.objective_hash)
-            await obj.fetch_manifest_information()
-            if obj.value_style == DestinyUnlockValueUIStyle.RAW_FLOAT:
-                value = value / 100
-                completion_value = completion_value / 100
-
-            return completed, value, completion_value
-    for record in records.data.records:
-        if records.data.records[record].objectives:
-            for obj in records.data.records[record].objectives:
-                if obj.objective_hash == requirement.objective_hash:
-                    completed = requirement.completed == obj.complete
-                    value = obj.progress
-                    completion_value = obj.completion_value
-
-                    obj: DestinyObjectiveDefinition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                                  requirement.objective_hash)
-                    await obj.fetch_manifest_information()
-                    if obj.value_style == DestinyUnlockValueUIStyle.RAW_FLOAT:
-                        value = value / 100
-                        completion_value = completion_value / 100
-
-                    return completed, value, completion_value
-        if records.data.records[record].interval_objectives:
-            for obj in records.data.records[record].interval_objectives:
-                if obj.objective_hash == requirement.objective_hash:
-                    completed = requirement.completed == obj.complete
-                    value = obj.progress
-                    completion_value = obj.completion_value
-                    obj: DestinyObjectiveDefinition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                                  requirement.objective_hash)
-                    await obj.fetch_manifest_information()
-                    if obj.value_style == DestinyUnlockValueUIStyle.RAW_FLOAT:
-                        value = value / 100
-                        completion_value = completion_value / 100
-
-                    return completed, value, completion_value
-
-    obj: DestinyObjectiveDefinition = await client.manifest.fetch(DestinyObjectiveDefinition,
-                                                                  requirement.objective_hash)
-    await obj.fetch_manifest_information()
-    completed, value, completion_value = False, 0, obj.completion_value
-    if obj.value_style == DestinyUnlockValueUIStyle.RAW_FLOAT:
-        value = value / 100
-        completion_value = completion_value / 100
-
-    return completed, value, completion_value
-
-
-async def validate_objective_values(records: SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                    metrics: SingleComponentResponseOfDestinyMetricsComponent,
-                                    requirement: RequirementObjectivesValues):
-    value = 0
-    for metric in metrics.data.metrics:
-        if metrics.data.metrics[metric].objective_progress.objective_hash == requirement.objective_hash:
-            value = metrics.data.metrics[metric].objective_progress.progress
-
-    for record in records.data.records:
-        if records.data.records[record].objectives:
-            for obj in records.data.records[record].objectives:
-                if obj.objective_hash == requirement.objective_hash:
-                    value = obj.progress
-
-        if records.data.records[record].interval_objectives:
-            for obj in records.data.records[record].interval_objectives:
-                if obj.objective_hash == requirement.objective_hash:
-                    value = obj.progress
-
-    if requirement.statement == RequirementStatement.LESS:
-        return value < requirement.value, value
-    elif requirement.statement == RequirementStatement.LESS_OR_EQUAL:
-        return value <= requirement.value, value
-    elif requirement.statement == RequirementStatement.MORE:
-        return value > requirement.value, value
-    elif requirement.statement == RequirementStatement.MORE_OR_EQUAL:
-        return value >= requirement.value, value
-    elif requirement.statement == RequirementStatement.EQUAL:
-        return value == requirement.value, value
-    elif requirement.statement == RequirementStatement.NOT_EQUAL:
-        return value != requirement.value, value
-    return False, value
-
-
-async def validate_role_by_roles_list(roles_ids_list: List[int], requirement: RequirementRole):
-    return requirement.role_id in roles_ids_list
-
-
-async def validate_requirements(requirement_group: RoleRequirementGroup,
-                                metrics: SingleComponentResponseOfDestinyMetricsComponent,
-                                records: SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                stats: dict[str, DestinyHistoricalStatsByPeriod],
-                                user_roles_list: List[int],
-                                client
-                                ) -> (bool, RoleRequirementGroup):
-    for requirement in requirement_group.requirements_TriumphScore:
-        completed, current = await validate_triumph_score(records=records, requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-
-    for requirement in requirement_group.requirements_MetricScore:
-        completed, current = await validate_metric_score(metrics=metrics, requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-
-    for requirement in requirement_group.requirements_HistoricalStat:
-        completed, current = await validate_historical_stat(stats=stats, requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-
-    for requirement in requirement_group.requirements_TriumphCompleted:
-        completed, current = await validate_triump_completed(records=records, requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-
-    for requirement in requirement_group.requirements_ObjectivesCompleted:
-        completed, current, require = await validate_objective_complete(records=records,
-                                                                        metrics=metrics,
-                                                                        requirement=requirement,
-                                                                        client=client)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-        setattr(requirement, 'require', require)
-
-    for requirement in requirement_group.requirements_ObjectivesValues:
-        completed, current = await validate_objective_values(records=records,
-                                                             metrics=metrics,
-                                                             requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', current)
-
-    for requirement in requirement_group.requirements_Role:
-        completed = await validate_role_by_roles_list(roles_ids_list=user_roles_list,
-                                                      requirement=requirement)
-        setattr(requirement, 'fact_completed', completed)
-        setattr(requirement, 'current', completed)
-
-    completed = all(r.fact_completed for r in requirement_group.requirements_TriumphScore +
-                    requirement_group.requirements_TriumphCompleted +
-                    requirement_group.requirements_HistoricalStat +
-                    requirement_group.requirements_MetricScore +
-                    requirement_group.requirements_ObjectivesCompleted +
-                    requirement_group.requirements_ObjectivesValues +
-                    requirement_group.requirements_Role)
-    setattr(requirement_group, 'completed', completed)
-    return completed, requirement_group
+def get_requirements_definitions_keys(roles_requirements: dict[int, RoleRequirementGroup]):
+    keys = []
+    for group in roles_requirements.values():
+        keys += [(DestinyMetricDefinition, req.metric_hash) for req in group.requirements_MetricScore]
+        keys += [(DestinyRecordDefinition, req.record_hash) for req in group.requirements_TriumphCompleted]
+        keys += [(DestinyObjectiveDefinition, req.objective_hash) for req in group.requirements_ObjectivesCompleted]
+        keys += [(DestinyObjectiveDefinition, req.objective_hash) for req in group.requirements_ObjectivesValues]
+    return keys
+
+
+async def warm_requirements_definitions(roles_requirements: dict[int, RoleRequirementGroup], client):
+    await definitions_cache.get_historical_stats_definition(client)
+    await definitions_cache.prefetch(client, get_requirements_definitions_keys(roles_requirements))
+
+
+def get_result_roles(roles_ids: List[int], roles_trees: dict) -> (List[int], List[int]):
+    """Заменяет роли из дерева ролей на старшие, если пользователь подходит и под них"""
+    result_roles_list = []
+    upgrade_roles = []
+    for role_id in roles_ids:
+        if role_id in roles_trees:
+            current_role_id = role_id
+            while roles_trees[current_role_id].parent and \
+                    roles_trees[current_role_id].parent.role_id in roles_ids:
+                upgrade_roles.append(current_role_id)
+                current_role_id = roles_trees[current_role_id].parent.role_id
+            result_roles_list.append(current_role_id)
+        else:
+            result_roles_list.append(role_id)
+    return result_roles_list, upgrade_roles
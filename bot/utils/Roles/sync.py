@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import time
+from typing import List, Tuple
+
+import discord
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ORM.schemes.Roles import RolesSyncCheckpoint
+from ORM.schemes.User import User
+from utils.Roles.plan import RequirementsPlan
+from utils.Roles.roles import get_result_roles
+from utils.bungie_scheduler import background_requests
+from utils.logger import create_logger
+from utils.users_utils import get_user_stats
+
+logger = create_logger(__name__)
+
+ROLES_SYNC_JOB = 'roles_sync'
+
+
+class RolesSyncStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.changed = 0
+
+    @property
+    def profiles_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed * 60 if elapsed else 0.0
+
+    def __str__(self):
+        return f'проверено {self.processed}, пропущено {self.skipped}, ошибок {self.errors}, ' \
+               f'изменено ролей у {self.changed} ({self.profiles_per_minute:.1f} профилей/мин)'
+
+
+class RolesDiff:
+    __slots__ = ('member', 'add', 'remove')
+
+    def __init__(self, member: discord.Member, add: List[discord.Role], remove: List[discord.Role]):
+        self.member = member
+        self.add = add
+        self.remove = remove
+
+
+async def load_checkpoint(db_engine, job_name=ROLES_SYNC_JOB) -> RolesSyncCheckpoint:
+    async with AsyncSession(db_engine, expire_on_commit=False) as session:
+        checkpoint = await session.get(RolesSyncCheckpoint, job_name)
+    if checkpoint and not checkpoint.finished_at:
+        logger.info(f'Продолжение проверки ролей после discord_id {checkpoint.last_discord_id} '
+                    f'(уже проверено {checkpoint.processed})')
+        return checkpoint
+    timestamp = datetime.datetime.now()
+    return RolesSyncCheckpoint(job_name=job_name, last_discord_id=None, processed=0,
+                               started_at=timestamp, updated_at=timestamp, finished_at=None)
+
+
+async def get_last_finished_at(db_engine, job_name=ROLES_SYNC_JOB) -> datetime.datetime | None:
+    async with AsyncSession(db_engine) as session:
+        checkpoint = await session.get(RolesSyncCheckpoint, job_name)
+        return checkpoint.finished_at if checkpoint else None
+
+
+async def save_checkpoint(db_engine, checkpoint: RolesSyncCheckpoint):
+    checkpoint.updated_at = datetime.datetime.now()
+    async with AsyncSession(db_engine, expire_on_commit=False) as session:
+        await session.merge(checkpoint)
+        await session.commit()
+
+
+async def get_users_page(db_engine, after_discord_id, limit) -> List[Tuple[int, int]]:
+    query = select(User.discord_id, User.bungie_id) \
+        .where(User.bungie_id.isnot(None), User.leave_server_date.is_(None)) \
+        .order_by(User.discord_id) \
+        .limit(limit)
+    if after_discord_id is not None:
+        query = query.where(User.discord_id > after_discord_id)
+    async with AsyncSession(db_engine) as session:
+        return [(discord_id, bungie_id) for discord_id, bungie_id in await session.execute(query)]
+
+
+def get_roles_diff(plan: RequirementsPlan, roles_trees: dict, member: discord.Member, groups_results,
+                   grant=False) -> RolesDiff | None:
+    completed_roles = list({result.group.role_id for result in groups_results if result.completed})
+    member_roles = {role.id for role in member.roles} & plan.managed_roles
+    remove = member_roles - set(completed_roles)
+    add = set()
+    if grant:
+        result_roles, upgrade_roles = get_result_roles(completed_roles, roles_trees)
+        add = set(result_roles) - member_roles
+        # Младшие роли дерева заменяются старшими
+        remove |= member_roles & set(upgrade_roles)
+    if not add and not remove:
+        return None
+    guild = member.guild
+    return RolesDiff(member,
+                     add=[role for role in map(guild.get_role, add) if role],
+                     remove=[role for role in map(guild.get_role, remove) if role])
+
+
+async def apply_roles_diffs(diffs: List[RolesDiff]):
+    for diff in diffs:
+        try:
+            if diff.remove:
+                await diff.member.remove_roles(*diff.remove, reason='Автоматическая проверка требований')
+            if diff.add:
+                await diff.member.add_roles(*diff.add, reason='Автоматическая проверка требований')
+        except discord.HTTPException as e:
+            logger.warning(f'Не удалось изменить роли {diff.member}: {e}')
+
+
+async def sync_roles(db_engine, client, guild: discord.Guild, plan: RequirementsPlan, roles_trees: dict,
+                     workers=5, page_size=100, grant=False, job_name=ROLES_SYNC_JOB) -> RolesSyncStats:
+    """
+    Проверяет требования к ролям у всех зарегистрированных пользователей.
+    Пользователи обходятся страницами по возрастанию discord_id, после каждой страницы
+    сохраняется контрольная точка - прерванная проверка продолжается с нее
+    """
+    stats = RolesSyncStats()
+    checkpoint = await load_checkpoint(db_engine, job_name)
+    with background_requests():
+        while True:
+            users = await get_users_page(db_engine, checkpoint.last_discord_id, page_size)
+            if not users:
+                break
+            queue = asyncio.Queue()
+            for user in users:
+                queue.put_nowait(user)
+            diffs = []
+
+            async def worker():
+                while not queue.empty():
+                    discord_id, bungie_id = queue.get_nowait()
+                    member = guild.get_member(discord_id)
+                    if not member:
+                        stats.skipped += 1
+                        continue
+                    try:
+                        metrics, records, historical_stats = await get_user_stats(bungie_id, client=client,
+                                                                                    components=plan.components,
+                                                                                    stat_groups=plan.stat_groups,
+                                                                                    use_cache=False)
+                        groups_results = plan.evaluate(metrics=metrics,
+                                                       records=records,
+                                                       stats=historical_stats,
+                                                       user_roles=[role.id for role in member.roles])
+                    except Exception as e:
+                        stats.errors += 1
+                        logger.warning(f'Не удалось проверить роли {member} ({bungie_id}): {e}')
+                        continue
+                    stats.processed += 1
+                    diff = get_roles_diff(plan, roles_trees, member, groups_results, grant=grant)
+                    if diff:
+                        diffs.append(diff)
+
+            await asyncio.gather(*[worker() for _ in range(workers)])
+            await apply_roles_diffs(diffs)
+            stats.changed += len(diffs)
+
+            checkpoint.last_discord_id = users[-1][0]
+            checkpoint.processed += len(users)
+            await save_checkpoint(db_engine, checkpoint)
+            logger.debug(f'Проверка ролей: {stats}')
+
+    checkpoint.finished_at = datetime.datetime.now()
+    await save_checkpoint(db_engine, checkpoint)
+    logger.info(f'Проверка ролей завершена: {stats}')
+    return stats
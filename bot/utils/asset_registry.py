@@ -0,0 +1,70 @@
+import os
+
+from PIL import Image, ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+assets_path = os.path.abspath(f'{os.path.dirname(__file__)}/assets')
+
+
+class AssetRegistry:
+    """
+    Шрифты и статические изображения (фоны, маски), загруженные один раз на процесс.
+    Шрифты не изменяются при отрисовке и выдаются как есть, изображения - копиями
+    """
+
+    def __init__(self, root: str = assets_path):
+        self.root = root
+        self.fonts: dict[tuple, FreeTypeFont] = {}
+        self.images: dict[tuple, Image.Image] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, name: str) -> str:
+        # Относительные пути считаются от utils/assets
+        return os.path.abspath(name if os.path.isabs(name) else os.path.join(self.root, name))
+
+    def font(self, name: str, size: int) -> FreeTypeFont:
+        key = (self.get_path(name), size)
+        font = self.fonts.get(key)
+        if font is None:
+            self.misses += 1
+            font = ImageFont.truetype(key[0], size=size)
+            self.fonts[key] = font
+        else:
+            self.hits += 1
+        return font
+
+    def image(self, name: str, mode: str | None = None) -> Image.Image:
+        key = (self.get_path(name), mode)
+        image = self.images.get(key)
+        if image is None:
+            self.misses += 1
+            with Image.open(key[0]) as file:
+                image = file.convert(mode) if mode else file.copy()
+            self.images[key] = image
+        else:
+            self.hits += 1
+        return image.copy()
+
+    def get_stats(self) -> dict:
+        return {
+            'fonts': len(self.fonts),
+            'images': len(self.images),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def clear(self):
+        self.fonts.clear()
+        self.images.clear()
+
+
+asset_registry = AssetRegistry()
+
+
+def get_font(name: str, size: int) -> FreeTypeFont:
+    return asset_registry.font(name, size)
+
+
+def get_asset(name: str, mode: str | None = None) -> Image.Image:
+    return asset_registry.image(name, mode)
@@ -0,0 +1,226 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Dict, List
+from urllib.parse import urlparse
+
+from aiohttp import ClientResponse
+from bungio.http import HttpClient
+from bungio.http.route import Route
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+
+class RequestPriority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+# Приоритет запросов текущей задачи (наследуется дочерними задачами и gather)
+request_priority: ContextVar[RequestPriority] = ContextVar('request_priority', default=RequestPriority.INTERACTIVE)
+
+
+def set_background_priority():
+    request_priority.set(RequestPriority.BACKGROUND)
+
+
+@contextlib.contextmanager
+def background_requests():
+    token = request_priority.set(RequestPriority.BACKGROUND)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class ResponsesStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.bytes = 0
+
+    def add(self, size: int):
+        self.requests += 1
+        self.bytes += size
+
+    def __str__(self):
+        return f'{self.requests} запросов, {self.bytes / 1024:.1f} КБ, {time.monotonic() - self.started_at:.2f} сек.'
+
+
+# Если установлен - размеры ответов Bungie в текущей задаче суммируются (для замеров отдельных команд)
+responses_stats: ContextVar[ResponsesStats | None] = ContextVar('responses_stats', default=None)
+
+
+@contextlib.contextmanager
+def measure_responses():
+    stats = ResponsesStats()
+    token = responses_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        responses_stats.reset(token)
+
+
+def get_endpoint_family(path: str) -> str:
+    parts = [part for part in urlparse(path).path.split('/') if part and part != 'Platform']
+    if not parts:
+        return 'other'
+    if parts[0] == 'common':
+        return 'manifest'
+    if parts[0] == 'Destiny2' and len(parts) > 1 and parts[1] in ('Stats', 'Manifest', 'Milestones'):
+        return f'Destiny2/{parts[1]}'
+    return parts[0]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _fill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        while True:
+            self._fill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PriorityStats:
+    def __init__(self):
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def add(self, wait: float):
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'avg_wait': self.total_wait / self.requests if self.requests else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+class RequestScheduler:
+    """Ограничивает число одновременных запросов к Bungie и частоту запросов к каждой группе эндпоинтов"""
+
+    # Запросов в секунду и размер пачки для групп эндпоинтов
+    DEFAULT_LIMITS = {
+        'GroupV2': (8, 16),
+        'Destiny2': (12, 24),
+        'Destiny2/Stats': (4, 8),
+        'Destiny2/Milestones': (4, 8),
+        'User': (6, 12),
+        'manifest': (20, 40),
+        'other': (6, 12),
+    }
+    STATS_INTERVAL = 300
+
+    def __init__(self, max_concurrency: int = 20, limits: Dict[str, tuple] | None = None):
+        self.max_concurrency = max_concurrency
+        self.limits = limits or self.DEFAULT_LIMITS
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.active = 0
+        self._waiters: List[tuple] = []
+        self._counter = itertools.count()
+        self.stats: Dict[RequestPriority, PriorityStats] = {priority: PriorityStats() for priority in RequestPriority}
+        self._last_report = time.monotonic()
+
+    @property
+    def queue_depth(self) -> Dict[str, int]:
+        depth = {priority.name: 0 for priority in RequestPriority}
+        for priority, _, waiter in self._waiters:
+            if not waiter.done():
+                depth[RequestPriority(priority).name] += 1
+        return depth
+
+    def get_stats(self) -> dict:
+        return {
+            'active': self.active,
+            'queue_depth': self.queue_depth,
+            'wait': {priority.name: stats.as_dict() for priority, stats in self.stats.items()},
+        }
+
+    def get_bucket(self, family: str) -> TokenBucket:
+        if family not in self.buckets:
+            rate, capacity = self.limits.get(family, self.limits['other'])
+            self.buckets[family] = TokenBucket(rate=rate, capacity=capacity)
+        return self.buckets[family]
+
+    async def _acquire_slot(self, priority: RequestPriority):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже был выдан этой задаче - возвращаем его
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _report(self):
+        if time.monotonic() - self._last_report < self.STATS_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+        logger.info(f'Планировщик запросов Bungie: {self.get_stats()}')
+
+    @contextlib.asynccontextmanager
+    async def slot(self, route: Route):
+        priority = request_priority.get()
+        started_at = time.monotonic()
+        # Сначала лимит группы эндпоинтов, чтобы ожидающие токена запросы не занимали общие слоты
+        await self.get_bucket(get_endpoint_family(route.path)).acquire()
+        await self._acquire_slot(priority)
+        try:
+            wait = time.monotonic() - started_at
+            self.stats[priority].add(wait)
+            if wait > 5:
+                logger.debug(f'Запрос {route.path} ожидал в очереди {wait:.2f} сек. ({priority.name})')
+            yield
+        finally:
+            self._release_slot()
+            self._report()
+
+
+bungie_scheduler = RequestScheduler()
+
+
+class ScheduledHttpClient(HttpClient):
+    async def request(self, route: Route) -> dict:
+        async with bungie_scheduler.slot(route):
+            return await super().request(route)
+
+    async def _handle_response(self, route_with_params: str, response: ClientResponse, content: dict) -> bool:
+        stats = responses_stats.get()
+        if stats is not None:
+            # Тело ответа уже прочитано клиентом - read() отдает его без повторной загрузки и разбора
+            stats.add(len(await response.read()))
+        return await super()._handle_response(route_with_params=route_with_params, response=response, content=content)
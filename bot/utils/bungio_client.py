@@ -4,10 +4,15 @@ from bungio import Client
 from bungio.models import BungieLanguage
 from dotenv import load_dotenv
 
+from utils.bungie_scheduler import ScheduledHttpClient
 from utils.logger import create_logger
+from utils.manifest_cache import definitions_cache
+from utils.manifest_mirror import MirrorManifest
 
 load_dotenv(override=True)
 
+logger = create_logger(__name__)
+
 
 class CustomClient(Client):
     def __init__(self, *args, **kwargs):
@@ -16,4 +21,14 @@ class CustomClient(Client):
                          bungie_token=os.getenv("X_API_KEY_ADMIN"),
                          language=BungieLanguage.RUSSIAN,
                          logger=create_logger('bungio'),
+                         http_client_class=ScheduledHttpClient,
+                         manifest_client_class=MirrorManifest,
                          *args, **kwargs)
+        # Увеличивается при каждом обновлении манифеста - по нему сбрасываются кеши определений
+        self.manifest_generation = getattr(self, 'manifest_generation', 0)
+
+    async def on_manifest_update(self) -> None:
+        await super().on_manifest_update()
+        self.manifest_generation += 1
+        definitions_cache.clear()
+        logger.info(f'Манифест обновлен (поколение {self.manifest_generation}), кеши определений сброшены')
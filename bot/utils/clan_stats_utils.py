@@ -2,13 +2,15 @@ import asyncio
 import datetime
 import logging
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Tuple
 
 import discord
+import numpy as np
 import pygsheets
 from bungio.models import DestinyClan, GroupMember, RuntimeGroupMemberType
 from discord import NotFound
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ORM.schemes.Clan import Clan
@@ -16,55 +18,65 @@ from ORM.schemes.Token import Token
 from ORM.schemes.User import User
 from utils.db_utils import get_visible_clans_ids
 from utils.logger import create_logger
+from utils.roster_cache import ROSTER_TTL, get_cached_clan_members, get_cached_clans_members
 
 logger = create_logger(__name__)
 
 
-async def get_clan_members(clan_id) -> List[GroupMember]:
-    clan_members = []
-    has_more = True
-    page = 0
-    while has_more:
-        members = await DestinyClan(group_id=clan_id).get_members_of_group(currentpage=page,
-                                                                           member_type=None,
-                                                                           name_search=None)
-        has_more = members.has_more
-        page += 1
-        clan_members += members.results
-    return clan_members
+async def get_clan_members(clan_id, db_engine=None, max_age: datetime.timedelta = ROSTER_TTL,
+                           force=False) -> List[GroupMember]:
+    return await get_cached_clan_members(clan_id, db_engine=db_engine, max_age=max_age, force=force)
 
 
 async def get_all_members_of_all_clans(db_engine) -> dict[int:List[GroupMember]]:
     clan_ids = await get_visible_clans_ids(db_engine)
-    members_tasks = [get_clan_members(clan_id) for clan_id in clan_ids]
     logger.debug('Начало сбора статистики участников кланов')
-    members_result = await asyncio.gather(*members_tasks)
+    result = await get_cached_clans_members(db_engine, clan_ids)
     logger.debug('Статистика участников кланов собрана')
-    result = {}
-    for i, members in enumerate(members_result):
-        result[clan_ids[i]] = members_result[i]
     return result
 
 
-async def get_registered_members_discord_ids(db_engine, members_list: List[GroupMember]) -> List[int]:
-    async with AsyncSession(db_engine) as session:
-        not_null_bungie_ids = [member.bungie_net_user_info.membership_id
-                               for member in members_list
-                               if member.bungie_net_user_info]
-        query = select(User.discord_id).where(User.bungie_id.in_(not_null_bungie_ids))
-        members_ids = list(await session.scalars(query))
-    return members_ids
+def get_members_bungie_ids(members_list: List[GroupMember]) -> List[int]:
+    return [member.bungie_net_user_info.membership_id for member in members_list if member.bungie_net_user_info]
 
 
-async def get_tokens_for_clan_members(db_engine, members_list: List[GroupMember]) -> Dict[int, Token]:
+async def get_registrations_by_bungie_ids(db_engine, bungie_ids: List[int]) -> Tuple[Dict[int, int], Dict[int, Token]]:
+    """Возвращает (bungie_id -> discord_id из users, bungie_id -> Token) одним запросом"""
+    users, tokens = {}, {}
+    if not bungie_ids:
+        return users, tokens
     async with AsyncSession(db_engine) as session:
-        not_null_bungie_ids = [member.bungie_net_user_info.membership_id
-                               for member in members_list
-                               if member.bungie_net_user_info]
-        query = select(Token).where(Token.bungie_id.in_(not_null_bungie_ids))
-        tokens = list(await session.scalars(query))
-    members = {token.discord_id: token for token in tokens}
-    return members
+        query = select(User.bungie_id, User.discord_id, Token). \
+            join_from(User, Token, User.bungie_id == Token.bungie_id, full=True). \
+            where(func.coalesce(User.bungie_id, Token.bungie_id).in_(set(bungie_ids)))
+        for user_bungie_id, user_discord_id, token in await session.execute(query):
+            if user_bungie_id:
+                users[user_bungie_id] = user_discord_id
+            if token:
+                tokens[token.bungie_id] = token
+    return users, tokens
+
+
+class ClanRegistrations:
+    def __init__(self, discord_ids: List[int], tokens: Dict[int, Token]):
+        # discord_id зарегистрированных участников клана
+        self.discord_ids = discord_ids
+        # discord_id -> Token участников клана
+        self.tokens = tokens
+
+
+async def get_registrations_for_clans(db_engine,
+                                      members_by_clan: Dict[int, List[GroupMember]]) -> Dict[int, ClanRegistrations]:
+    bungie_ids_by_clan = {clan_id: get_members_bungie_ids(members_by_clan[clan_id]) for clan_id in members_by_clan}
+    all_bungie_ids = [bungie_id for bungie_ids in bungie_ids_by_clan.values() for bungie_id in bungie_ids]
+    users, tokens = await get_registrations_by_bungie_ids(db_engine, all_bungie_ids)
+    result = {}
+    for clan_id, bungie_ids in bungie_ids_by_clan.items():
+        result[clan_id] = ClanRegistrations(
+            discord_ids=[users[bungie_id] for bungie_id in bungie_ids if bungie_id in users],
+            tokens={tokens[bungie_id].discord_id: tokens[bungie_id] for bungie_id in bungie_ids if bungie_id in tokens}
+        )
+    return result
 
 
 async def get_discord_members(guild, members_ids) -> List[discord.Member]:
@@ -80,35 +92,43 @@ async def get_discord_members(guild, members_ids) -> List[discord.Member]:
 
 
 class ClanTableStats:
-    def __init__(self, members_list: List[GroupMember], timestamp: datetime.datetime):
+    # Пороги неактивности в секундах: имя атрибута -> порог
+    INACTIVE_THRESHOLDS: Dict[str, int] = {
+        'inactive_10d': 864000,
+        'inactive_14d': 1209600,
+        'inactive_21d': 1814400,
+        'inactive_31d': 2678400,
+    }
+
+    def __init__(self, members_list: List[GroupMember], timestamp: datetime.datetime,
+                 thresholds: Dict[str, int] | None = None):
+        self.thresholds = thresholds or self.INACTIVE_THRESHOLDS
         self.total_members: int = len(members_list)
-        self.inactive_10d: int = 0
-        self.inactive_14d: int = 0
-        self.inactive_21d: int = 0
-        self.inactive_31d: int = 0
         self.leader_bungie_id: GroupMember | None = None
         self.admins: List[GroupMember] = []
-        timestamp = int(timestamp.timestamp())
-        for member in members_list:
 
-            if abs(timestamp - int(member.last_online_status_change)) > 864000:
-                self.inactive_10d += 1
-            if abs(timestamp - int(member.last_online_status_change)) > 1209600:
-                self.inactive_14d += 1
-            if abs(timestamp - int(member.last_online_status_change)) > 1814400:
-                self.inactive_21d += 1
-            if abs(timestamp - int(member.last_online_status_change)) > 2678400:
-                self.inactive_31d += 1
-
-            if member.member_type == RuntimeGroupMemberType.ADMIN:
-                self.admins.append(member)
-
-            if member.member_type == RuntimeGroupMemberType.FOUNDER:
-                self.leader_bungie_id = member
+        last_online = np.fromiter((int(member.last_online_status_change) for member in members_list),
+                                  dtype=np.int64, count=self.total_members)
+        member_types = np.fromiter((int(getattr(member.member_type, 'value', member.member_type))
+                                    for member in members_list),
+                                   dtype=np.int64, count=self.total_members)
+
+        # Все пороги считаются за один проход: число участников с неактивом строго больше порога
+        inactive_seconds = np.sort(np.abs(int(timestamp.timestamp()) - last_online))
+        bounds = np.fromiter(self.thresholds.values(), dtype=np.int64, count=len(self.thresholds))
+        counts = self.total_members - np.searchsorted(inactive_seconds, bounds, side='right')
+        self.inactive: Dict[str, int] = dict(zip(self.thresholds.keys(), counts.tolist()))
+        for name, count in self.inactive.items():
+            setattr(self, name, count)
+
+        self.admins = [members_list[i] for i in np.flatnonzero(member_types == RuntimeGroupMemberType.ADMIN.value)]
+        founders = np.flatnonzero(member_types == RuntimeGroupMemberType.FOUNDER.value)
+        if founders.size:
+            self.leader_bungie_id = members_list[founders[-1]]
 
     def __repr__(self):
         return f"Leader: {self.leader_bungie_id}, Admins: {self.admins}, total: {self.total_members}, " \
-               f"10-14-21-31: {self.inactive_10d}-{self.inactive_14d}-{self.inactive_21d}-{self.inactive_31d}"
+               f"inactive: {self.inactive}"
 
 
 class ClanTableSalaryStats(ClanTableStats):
@@ -175,10 +195,10 @@ async def create_stats_table(db_engine, guild):
     all_groups_table_stats = {}
     all_groups_discord_stats = {}
 
-    for clan in all_members_in_clans:
-        registered_users = await get_registered_members_discord_ids(db_engine, all_members_in_clans[clan])
+    all_registrations = await get_registrations_for_clans(db_engine, all_members_in_clans)
 
-        discord_guild_members = await get_discord_members(guild, registered_users)
+    for clan in all_members_in_clans:
+        discord_guild_members = await get_discord_members(guild, all_registrations[clan].discord_ids)
         all_groups_discord_stats[clan] = discord_guild_members
 
         clan_table_stats = ClanTableStats(all_members_in_clans[clan], timestamp)
@@ -200,41 +220,89 @@ async def create_stats_table(db_engine, guild):
     return result
 
 
+STATS_SHEET_HEADER = ['Название клана', 'Основатель', 'Администраторы', 'Всего участников', 'Discord',
+                      'Инактив 10 дней+',
+                      'Инактив 14 дней+',
+                      'Инактив 21 день+',
+                      'Инактив 31 день+']
+
+
+class StatsSheetWriter:
+    """Хранит последнюю отправленную таблицу и отправляет в Google Sheets только изменившиеся строки"""
+
+    def __init__(self):
+        self.worksheet = None
+        self.last_table: List[List[str]] | None = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        try:
+            gc = pygsheets.authorize(service_account_env_var='google_credentials')
+        except KeyError:
+            gc = pygsheets.authorize(service_account_file='config/google_credentials.json')
+        sh = gc.open_by_key(os.getenv('GOOGLE_SHEET_ID'))
+        self.worksheet = sh.worksheet('index', 0)
+        self.last_table = None
+
+    @staticmethod
+    def build_full_table(new_table) -> List[List[str]]:
+        # Заголовок, строки кланов, пустая строка и строка итогов
+        last_row = len(new_table) + 2
+        current_date = str(datetime.datetime.now().strftime('%H:%M %d.%m.%Y'))
+        total_row = ['Итог', 'на', current_date] + [f'=sum({column}2:{column}{last_row})' for column in 'DEFGHI']
+        return [STATS_SHEET_HEADER] + new_table + [[''] * len(STATS_SHEET_HEADER), total_row]
+
+    def get_changed_ranges(self, full_table) -> Tuple[List[str], List[List[List[str]]]]:
+        changed_rows = [i for i, row in enumerate(full_table)
+                        if not self.last_table or i >= len(self.last_table) or self.last_table[i] != row]
+        ranges, values = [], []
+        # Соседние измененные строки объединяются в один диапазон
+        for row_index in changed_rows:
+            if ranges and row_index == last_index + 1:
+                values[-1].append(full_table[row_index])
+                ranges[-1] = (ranges[-1][0], row_index)
+            else:
+                ranges.append((row_index, row_index))
+                values.append([full_table[row_index]])
+            last_index = row_index
+        ranges = [f'A{first + 1}:I{last + 1}' for first, last in ranges]
+        return ranges, values
+
+    def push(self, new_table):
+        with self.lock:
+            try:
+                if not self.worksheet:
+                    self.connect()
+                full_table = self.build_full_table(new_table)
+                resized = self.worksheet.rows != len(full_table)
+                if resized:
+                    self.worksheet.resize(rows=len(full_table))
+                ranges, values = self.get_changed_ranges(full_table)
+                if ranges:
+                    self.worksheet.update_values_batch(ranges, values, parse=True)
+                if resized or not self.last_table:
+                    pygsheets.datarange.DataRange(start='A1', end=f'I{len(full_table)}',
+                                                  worksheet=self.worksheet).update_borders(top=True,
+                                                                                           right=True,
+                                                                                           bottom=True,
+                                                                                           left=True,
+                                                                                           inner_horizontal=True,
+                                                                                           inner_vertical=True,
+                                                                                           style='SOLID')
+                self.last_table = full_table
+                logger.debug(f'Google Sheets: обновлено строк {sum(len(value) for value in values)} '
+                             f'из {len(full_table)}')
+            except Exception:
+                # При следующем обновлении таблица будет переписана целиком
+                self.worksheet = None
+                self.last_table = None
+                raise
+
+
+stats_sheet_writer = StatsSheetWriter()
+
+
 async def update_stats_in_google_sheets(new_table):
-    try:
-        gc = pygsheets.authorize(service_account_env_var='google_credentials')
-    except KeyError:
-        gc = pygsheets.authorize(service_account_file='config/google_credentials.json')
-
-    sh = gc.open_by_key(os.getenv('GOOGLE_SHEET_ID'))
-    wks = sh.worksheet('index', 0)
-    if wks.rows != 2:
-        wks.delete_rows(3, wks.rows - 1)
-    first_row = [['Название клана', 'Основатель', 'Администраторы', 'Всего участников', 'Discord',
-                  'Инактив 10 дней+',
-                  'Инактив 14 дней+',
-                  'Инактив 21 день+',
-                  'Инактив 31 день+']]
-    wks.update_values('A1', first_row)
-    wks.add_rows(len(new_table) - 1)
-    wks.update_values('A2', new_table)
-    wks.add_rows(2)
-    current_date = str(datetime.datetime.now().strftime('%H:%M %d.%m.%Y'))
-
-    wks.update_values(f'A{wks.rows}', [['Итог',
-                                        'на',
-                                        current_date,
-                                        f'=sum(D2:D{wks.rows - 1})',
-                                        f'=sum(E2:E{wks.rows - 1})',
-                                        f'=sum(F2:F{wks.rows - 1})',
-                                        f'=sum(G2:G{wks.rows - 1})',
-                                        f'=sum(H2:H{wks.rows - 1})',
-                                        f'=sum(I2:I{wks.rows - 1})']])
-    pygsheets.datarange.DataRange(start='A1', end=f'I{wks.rows}', worksheet=wks).update_borders(top=True,
-                                                                                                right=True,
-                                                                                                bottom=True,
-                                                                                                left=True,
-                                                                                                inner_horizontal=True,
-                                                                                                inner_vertical=True,
-                                                                                                style='SOLID')
-    return sh
+    # pygsheets работает синхронно - выполняется вне цикла событий
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, stats_sheet_writer.push, new_table)
@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+
+class DeadlineScheduler:
+    """
+    Одна задача на все отложенные действия: ключи хранятся в куче по времени срабатывания,
+    задача спит до ближайшего и передает в callback все наступившие ключи одной пачкой.
+    Отмена и перенос не трогают кучу - устаревшие записи пропускаются при извлечении
+    """
+
+    def __init__(self, callback: Callable[[List[Hashable]], Awaitable], name: str):
+        self.callback = callback
+        self.name = name
+        self.deadlines: Dict[Hashable, datetime.datetime] = {}
+        self._heap: List[Tuple[datetime.datetime, int, Hashable]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.fired = 0
+        self.batches = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.deadlines
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def schedule(self, key: Hashable, deadline: datetime.datetime):
+        self.deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> bool:
+        return self.deadlines.pop(key, None) is not None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _pop_due(self, now: datetime.datetime) -> List[Hashable]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self.deadlines.get(key) != deadline:
+                continue
+            self.deadlines.pop(key)
+            due.append(key)
+            self.last_lag = (now - deadline).total_seconds()
+            self.max_lag = max(self.max_lag, self.last_lag)
+        # Куча не растет бесконечно из-за отмененных записей
+        if len(self._heap) > 2 * len(self.deadlines) + 64:
+            self._heap = [(deadline, next(self._counter), key) for key, deadline in self.deadlines.items()]
+            heapq.heapify(self._heap)
+        return due
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.datetime.now()
+            due = self._pop_due(now)
+            if due:
+                self.fired += len(due)
+                self.batches += 1
+                try:
+                    await self.callback(due)
+                except Exception as e:
+                    logger.exception(f'Ошибка обработки отложенных задач {self.name}: {e}')
+                continue
+            timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': len(self.deadlines),
+            'heap': len(self._heap),
+            'fired': self.fired,
+            'batches': self.batches,
+            'last_lag': round(self.last_lag, 3),
+            'max_lag': round(self.max_lag, 3),
+        }
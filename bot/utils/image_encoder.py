@@ -0,0 +1,140 @@
+"""
+Кодирование готовых изображений перед отправкой в Discord.
+Перебирает разрешенные для функции форматы и выбирает самый маленький файл, который укладывается в лимит вложения
+"""
+import io
+import os
+import time
+from typing import Iterable, List, Tuple
+
+import discord
+from PIL import Image
+
+from utils.logger import create_logger
+from utils.rendering import run_in_render_pool
+
+logger = create_logger(__name__)
+
+DISCORD_ATTACHMENT_LIMIT = int(os.getenv('DISCORD_ATTACHMENT_LIMIT', 10 * 1024 * 1024))
+DISCORD_ATTACHMENTS_PER_MESSAGE = 10
+TILE_HEIGHT = 4000
+# Pillow не кодирует WebP со стороной больше 16383 px
+WEBP_MAX_SIZE = 16383
+
+# Форматы одного файла: расширение и параметры сохранения
+FORMATS = {
+    'png': ('png', {'format': 'PNG'}),
+    'png_palette': ('png', {'format': 'PNG', 'optimize': True}),
+    'webp': ('webp', {'format': 'WEBP', 'lossless': True, 'method': 4}),
+    'webp_lossy': ('webp', {'format': 'WEBP', 'quality': 90, 'method': 4}),
+}
+
+
+class EncodedImage:
+    __slots__ = ('files', 'format')
+
+    def __init__(self, files: List[Tuple[str, bytes]], format: str):
+        # (имя файла, данные) - несколько файлов, если изображение разрезано на части
+        self.files = files
+        self.format = format
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for _, data in self.files)
+
+    def to_discord_files(self) -> List[discord.File]:
+        return [discord.File(fp=io.BytesIO(data), filename=filename) for filename, data in self.files]
+
+
+def prepare(image: Image.Image, format_name: str) -> Image.Image:
+    # Полностью непрозрачному изображению альфа-канал не нужен
+    if image.mode == 'RGBA' and image.getextrema()[3][0] == 255:
+        image = image.convert('RGB')
+    if format_name == 'png_palette':
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    return image
+
+
+def encode(image: Image.Image, format_name: str) -> bytes:
+    _, params = FORMATS[format_name]
+    with io.BytesIO() as output:
+        prepare(image, format_name).save(output, **params)
+        return output.getvalue()
+
+
+def encode_smallest(image: Image.Image, formats: List[str], limit: int) -> Tuple[str, bytes | None, dict]:
+    """Лучший формат одного файла: (формат, данные или None, если ни один не уложился в лимит, статистика)"""
+    best_format, best, stats = None, None, {}
+    for format_name in formats:
+        if FORMATS[format_name][0] == 'webp' and max(image.size) > WEBP_MAX_SIZE:
+            continue
+        started_at = time.monotonic()
+        try:
+            data = encode(image, format_name)
+        except Exception as e:
+            # Неудачный формат не мешает остальным и разрезанию на части
+            logger.warning(f'Не удалось закодировать {image.size} в {format_name}: {e}')
+            stats[format_name] = (None, time.monotonic() - started_at)
+            continue
+        stats[format_name] = (len(data), time.monotonic() - started_at)
+        if len(data) <= limit and (best is None or len(data) < len(best)):
+            best_format, best = format_name, data
+    return best_format, best, stats
+
+
+def _encode_image(png: bytes, name: str, formats: List[str], limit: int) -> Tuple[EncodedImage | None, dict]:
+    # Выполняется в процессе отрисовки
+    image = Image.open(io.BytesIO(png))
+    image.load()
+    single_formats = [format_name for format_name in formats if format_name in FORMATS]
+    stats = {'original': (len(png), 0.0)}
+    if len(png) <= limit:
+        best_format, best = 'original', png
+    else:
+        best_format, best = None, None
+    format_name, data, formats_stats = encode_smallest(image, single_formats, limit)
+    stats.update(formats_stats)
+    if data is not None and (best is None or len(data) < len(best)):
+        best_format, best = format_name, data
+    if best is not None:
+        extension = 'png' if best_format == 'original' else FORMATS[best_format][0]
+        return EncodedImage([(f'{name}.{extension}', best)], best_format), stats
+
+    if 'tiles' in formats:
+        started_at = time.monotonic()
+        tiles = []
+        for i, top in enumerate(range(0, image.height, TILE_HEIGHT)):
+            tile = image.crop((0, top, image.width, min(top + TILE_HEIGHT, image.height)))
+            format_name, data, _ = encode_smallest(tile, single_formats or ['png'], limit)
+            if data is None:
+                break
+            tiles.append((f'{name}_{i + 1}.{FORMATS[format_name][0]}', data))
+        else:
+            if len(tiles) <= DISCORD_ATTACHMENTS_PER_MESSAGE:
+                stats['tiles'] = (sum(len(data) for _, data in tiles), time.monotonic() - started_at)
+                return EncodedImage(tiles, 'tiles'), stats
+    return None, stats
+
+
+async def encode_image(png: bytes, name: str, formats: Iterable[str] = ('png',),
+                       limit: int = DISCORD_ATTACHMENT_LIMIT) -> EncodedImage:
+    """
+    Кодирует PNG для отправки: форматы - png, png_palette, webp, webp_lossy и tiles
+    (разрезание на части, только если целиком ни один формат не укладывается в лимит).
+    Если ничего не подошло - возвращается исходный PNG
+    """
+    started_at = time.monotonic()
+    formats = list(formats)
+    try:
+        encoded, stats = await run_in_render_pool(_encode_image, png, name, formats, limit)
+    except Exception as e:
+        logger.warning(f'Не удалось перекодировать {name}: {e}')
+        encoded, stats = None, {}
+    if encoded is None:
+        encoded = EncodedImage([(f'{name}.png', png)], 'original')
+    sizes = ', '.join(f'{format_name} {f"{size / 1024:.0f} КБ" if size is not None else "ошибка"} '
+                      f'({elapsed:.2f} сек.)'
+                      for format_name, (size, elapsed) in stats.items())
+    logger.info(f'{name}: {sizes}; выбран {encoded.format} - {encoded.size / 1024:.0f} КБ, '
+                f'файлов {len(encoded.files)}, всего {time.monotonic() - started_at:.2f} сек.')
+    return encoded
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import io
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+from PIL import Image
+from cachetools import LRUCache
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+BUNGIE_URL = 'https://www.bungie.net'
+IMAGES_CACHE_PATH = os.getenv('IMAGES_CACHE_PATH', 'cache/images')
+IMAGES_MEMORY_LIMIT = int(os.getenv('IMAGES_MEMORY_LIMIT_MB', 128)) * 1024 * 1024
+
+
+def get_image_size(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class ImageFetcher:
+    """
+    Загрузка изображений (иконки, PGCR) через общий aiohttp сеанс.
+    Пути изображений Bungie неизменяемы, поэтому файлы хранятся на диске по хешу пути,
+    а в памяти - LRU исходных байтов и декодированных изображений, ограниченные по размеру
+    """
+
+    def __init__(self, cache_path: str = IMAGES_CACHE_PATH, memory_limit: int = IMAGES_MEMORY_LIMIT,
+                 connections: int = 20, timeout: int = 30):
+        self.cache_path = cache_path
+        self.connections = connections
+        self.timeout = timeout
+        self.data = LRUCache(maxsize=memory_limit // 4, getsizeof=len)
+        self.images = LRUCache(maxsize=memory_limit, getsizeof=get_image_size)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._session: aiohttp.ClientSession | None = None
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def get_url(link: str) -> str:
+        if link.startswith('/'):
+            return f'{BUNGIE_URL}{link}'
+        return link
+
+    def get_cache_file(self, url: str) -> str | None:
+        # На диске хранятся только изображения Bungie - адрес по пути не меняется при обновлении контента
+        parts = urlsplit(url)
+        if not parts.hostname or not parts.hostname.endswith('bungie.net'):
+            return None
+        key = hashlib.sha256(parts.path.encode()).hexdigest()
+        return os.path.join(self.cache_path, key[:2], key)
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    @staticmethod
+    def read_file(path: str) -> bytes | None:
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def write_file(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл - при падении не остается обрезанных изображений
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    async def _load(self, url: str) -> bytes:
+        cache_file = self.get_cache_file(url)
+        if cache_file:
+            data = await asyncio.to_thread(self.read_file, cache_file)
+            if data is not None:
+                self.disk_hits += 1
+                return data
+        self.misses += 1
+        async with self.get_session().get(url) as response:
+            response.raise_for_status()
+            data = await response.read()
+        if cache_file:
+            try:
+                await asyncio.to_thread(self.write_file, cache_file, data)
+            except OSError as e:
+                logger.warning(f'Не удалось сохранить {url} в кеш изображений: {e}')
+        return data
+
+    async def fetch(self, link: str) -> bytes:
+        url = self.get_url(link)
+        data = self.data.get(url)
+        if data is not None:
+            self.hits += 1
+            return data
+        # Одновременные запросы одного изображения ждут одну загрузку
+        if url not in self._pending:
+            self._pending[url] = asyncio.ensure_future(self._load(url))
+        future = self._pending[url]
+        try:
+            data = await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._pending.pop(url, None)
+        try:
+            self.data[url] = data
+        except ValueError:
+            # Изображение больше всего кеша
+            pass
+        return data
+
+    async def open(self, link: str) -> Image.Image:
+        url = self.get_url(link)
+        image = self.images.get(url)
+        if image is not None:
+            self.hits += 1
+        else:
+            image = Image.open(io.BytesIO(await self.fetch(url)))
+            image.load()
+            try:
+                self.images[url] = image
+            except ValueError:
+                return image
+        return image.copy()
+
+    def get_stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'data_size': self.data.currsize,
+            'images_size': self.images.currsize,
+        }
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+image_fetcher = ImageFetcher()
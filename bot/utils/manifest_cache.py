@@ -0,0 +1,84 @@
+import asyncio
+from typing import Iterable, Tuple, Type, Dict
+
+from bungio.models import DestinyHistoricalStatsDefinition
+from cachetools import LRUCache
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+
+class DefinitionsCache:
+    """LRU кеш определений манифеста по ключу (тип определения, хеш)"""
+
+    def __init__(self, maxsize: int = 4096, prefetch_concurrency: int = 10):
+        self.definitions = LRUCache(maxsize=maxsize)
+        self.prefetch_concurrency = prefetch_concurrency
+        self.historical_stats_definition: Dict[str, DestinyHistoricalStatsDefinition] | None = None
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[tuple, asyncio.Future] = {}
+
+    @staticmethod
+    def make_key(definition_class: Type, definition_hash: int) -> tuple:
+        return definition_class.__name__, int(definition_hash)
+
+    async def _load(self, client, definition_class, definition_hash):
+        definition = await client.manifest.fetch(definition_class, definition_hash)
+        if definition:
+            await definition.fetch_manifest_information()
+        return definition
+
+    async def fetch(self, client, definition_class: Type, definition_hash: int):
+        key = self.make_key(definition_class, definition_hash)
+        if key in self.definitions:
+            self.hits += 1
+            return self.definitions[key]
+        self.misses += 1
+        # Одновременные запросы одного определения ждут один и тот же запрос к манифесту
+        if key not in self._pending:
+            self._pending[key] = asyncio.ensure_future(self._load(client, definition_class, definition_hash))
+        future = self._pending[key]
+        try:
+            definition = await asyncio.shield(future)
+        finally:
+            if future.done():
+                self._pending.pop(key, None)
+        if definition:
+            self.definitions[key] = definition
+        return definition
+
+    async def get_historical_stats_definition(self, client) -> Dict[str, DestinyHistoricalStatsDefinition]:
+        if self.historical_stats_definition is None:
+            self.misses += 1
+            self.historical_stats_definition = await client.api.get_historical_stats_definition()
+        else:
+            self.hits += 1
+        return self.historical_stats_definition
+
+    async def prefetch(self, client, keys: Iterable[Tuple[Type, int]]):
+        keys = {(definition_class, int(definition_hash)) for definition_class, definition_hash in keys
+                if self.make_key(definition_class, definition_hash) not in self.definitions}
+        if not keys:
+            return
+        semaphore = asyncio.Semaphore(self.prefetch_concurrency)
+
+        async def prefetch_one(definition_class, definition_hash):
+            async with semaphore:
+                try:
+                    await self.fetch(client, definition_class, definition_hash)
+                except Exception as e:
+                    logger.warning(f'Не удалось загрузить {definition_class.__name__} {definition_hash}: {e}')
+
+        await asyncio.gather(*[prefetch_one(definition_class, definition_hash)
+                               for definition_class, definition_hash in keys])
+        logger.info(f'Предзагружено определений манифеста: {len(keys)} '
+                    f'(в кеше {len(self.definitions)}, попаданий {self.hits}, промахов {self.misses})')
+
+    def clear(self):
+        self.definitions.clear()
+        self.historical_stats_definition = None
+
+
+definitions_cache = DefinitionsCache()
@@ -0,0 +1,164 @@
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+import time
+import zipfile
+from typing import Type
+
+import aiohttp
+from bungio.manifest import Manifest
+from cachetools import LRUCache
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+BUNGIE_URL = 'https://www.bungie.net'
+MANIFEST_PATH = os.getenv('MANIFEST_PATH', 'cache/manifest')
+MANIFEST_MMAP_SIZE = 512 * 1024 * 1024
+
+
+class ManifestMirror:
+    """
+    Локальная копия манифеста (SQLite база мобильного манифеста на русском языке), по файлу на версию.
+    База открывается только для чтения с mmap, разобранные определения хранятся в LRU.
+    Версия проверяется в фоне, до загрузки новой версии используется последняя скачанная
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH, hot_size: int = 8192):
+        self.path = path
+        self.version: str | None = None
+        self.connection: sqlite3.Connection | None = None
+        self.tables: set[str] = set()
+        self.local_checked = False
+        self.hot = LRUCache(maxsize=hot_size)
+        self.hits = 0
+        self.misses = 0
+        self._update_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.connection is not None
+
+    def get_file(self, version: str) -> str:
+        return os.path.join(self.path, f'{version}.sqlite3')
+
+    def open(self, version: str) -> bool:
+        file = self.get_file(version)
+        if not os.path.exists(file):
+            return False
+        connection = sqlite3.connect(f'file:{os.path.abspath(file)}?mode=ro&immutable=1', uri=True)
+        connection.execute(f'PRAGMA mmap_size = {MANIFEST_MMAP_SIZE}')
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = connection
+        self.tables = tables
+        self.version = version
+        self.hot.clear()
+        logger.info(f'Открыта локальная копия манифеста {version}')
+        return True
+
+    def open_latest(self) -> bool:
+        # Последняя скачанная версия - бот может работать с манифестом, даже если Bungie недоступен
+        self.local_checked = True
+        files = sorted(glob.glob(os.path.join(self.path, '*.sqlite3')), key=os.path.getmtime, reverse=True)
+        return bool(files) and self.open(os.path.basename(files[0]).removesuffix('.sqlite3'))
+
+    @staticmethod
+    def to_signed(definition_hash: int) -> int:
+        # В мобильном манифесте id - хеш, приведенный к знаковому 32-битному числу
+        definition_hash = int(definition_hash)
+        return definition_hash - (1 << 32) if definition_hash >= (1 << 31) else definition_hash
+
+    def get(self, table: str, definition_hash) -> dict | None:
+        key = (table, int(definition_hash))
+        data = self.hot.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        if table not in self.tables:
+            return None
+        row = self.connection.execute(f'SELECT json FROM {table} WHERE id = ?',
+                                      (self.to_signed(definition_hash),)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self.hot[key] = data
+        return data
+
+    async def download(self, url: str, version: str):
+        os.makedirs(self.path, exist_ok=True)
+        archive = os.path.join(self.path, f'{version}.zip')
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as session:
+            async with session.get(f'{BUNGIE_URL}{url}') as response:
+                response.raise_for_status()
+                with open(archive, 'wb') as file:
+                    async for chunk in response.content.iter_chunked(1024 * 1024):
+                        file.write(chunk)
+        await asyncio.to_thread(self.extract, archive, self.get_file(version))
+
+    @staticmethod
+    def extract(archive: str, file: str):
+        try:
+            with zipfile.ZipFile(archive) as zip_file:
+                temp_file = f'{file}.tmp'
+                with zip_file.open(zip_file.namelist()[0]) as source, open(temp_file, 'wb') as target:
+                    while chunk := source.read(1024 * 1024):
+                        target.write(chunk)
+            os.replace(temp_file, file)
+        finally:
+            os.remove(archive)
+
+    def remove_old_versions(self):
+        for file in glob.glob(os.path.join(self.path, '*.sqlite3')):
+            if file != self.get_file(self.version):
+                try:
+                    os.remove(file)
+                except OSError as e:
+                    logger.warning(f'Не удалось удалить старую копию манифеста {file}: {e}')
+
+    async def check_version(self, client) -> bool:
+        """Проверяет версию манифеста и скачивает новую. Возвращает True, если версия сменилась"""
+        async with self._update_lock:
+            if not self.ready:
+                self.open_latest()
+            manifest = await client.api.get_destiny_manifest()
+            if manifest.version == self.version:
+                return False
+            if not self.open(manifest.version):
+                started_at = time.monotonic()
+                logger.info(f'Загружается манифест {manifest.version}')
+                await self.download(manifest.mobile_world_content_paths[client.language.value], manifest.version)
+                self.open(manifest.version)
+                logger.info(f'Манифест {manifest.version} загружен за {time.monotonic() - started_at:.2f} сек.')
+            self.remove_old_versions()
+            return True
+
+    def get_stats(self) -> dict:
+        return {
+            'version': self.version,
+            'hot': len(self.hot),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+manifest_mirror = ManifestMirror()
+
+
+class MirrorManifest(Manifest):
+    """Манифест bungio, читающий определения из локальной копии; пока копии нет - обычная загрузка bungio"""
+
+    async def fetch(self, manifest_class: Type, value: str):
+        if not manifest_mirror.ready and not manifest_mirror.local_checked:
+            manifest_mirror.open_latest()
+        if not manifest_mirror.ready:
+            return await super().fetch(manifest_class, value)
+        data = manifest_mirror.get(manifest_class.__name__, value)
+        if data is None:
+            return None
+        return await manifest_class.from_dict(data=data, client=self._client, recursive=True)
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Iterable
+
+from bungio.models import DestinyUser, DestinyComponentType, DestinyStatsGroupType, DestinyProfileResponse, \
+    DestinyHistoricalStatsAccountResult, GroupUserInfoCard, UserMembershipData
+from cachetools import TTLCache
+
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+# (время жизни, сколько еще после него отдавать устаревшее значение, обновляя его в фоне), в секундах
+PROFILE_CACHE_TTL = {
+    'membership': (3600, 86400),
+    'bungie_name': (3600, 86400),
+    'profile': (120, 600),
+    'historical_stats': (300, 1800),
+}
+# Сколько значений каждого вида хранится; профили и статистика занимают мегабайты, поэтому их немного
+PROFILE_CACHE_MAXSIZE = {
+    'membership': 4096,
+    'bungie_name': 4096,
+    'profile': 256,
+    'historical_stats': 256,
+}
+
+
+class CachedValue:
+    __slots__ = ('value', 'fetched_at')
+
+    def __init__(self, value):
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+
+def select_main_profile(member_profiles: UserMembershipData) -> GroupUserInfoCard | None:
+    member_main_profile = None
+    if member_profiles.primary_membership_id:
+        for profile in member_profiles.destiny_memberships:
+            if member_profiles.primary_membership_id == profile.membership_id:
+                member_main_profile = profile
+    elif len(member_profiles.destiny_memberships) == 1:
+        member_main_profile = member_profiles.destiny_memberships[0]
+    elif len(member_profiles.destiny_memberships) > 1:
+        for profile in member_profiles.destiny_memberships:
+            if profile.membership_type == 3:
+                member_main_profile = profile
+    return member_main_profile
+
+
+class ProfileCache:
+    """
+    Публичные данные игроков Bungie по ключу (вид данных, id, параметры запроса).
+    У каждого вида свое время жизни; после него значение еще какое-то время отдается сразу,
+    а обновляется в фоне, и удаляется, когда устареет совсем. Одновременные запросы одних данных
+    ждут один запрос к Bungie
+    """
+
+    def __init__(self, maxsize: Dict[str, int] = None, ttl: Dict[str, tuple] = None):
+        self.ttl = ttl or PROFILE_CACHE_TTL
+        maxsize = maxsize or PROFILE_CACHE_MAXSIZE
+        self.entries: Dict[str, TTLCache] = {kind: TTLCache(maxsize=maxsize[kind], ttl=sum(self.ttl[kind]))
+                                             for kind in self.ttl}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._pending: Dict[tuple, asyncio.Future] = {}
+
+    def _start(self, key: tuple, loader: Callable[[], Awaitable]) -> asyncio.Future:
+        if key not in self._pending:
+            future = asyncio.ensure_future(loader())
+            future.add_done_callback(lambda f: self._on_loaded(key, f))
+            self._pending[key] = future
+        return self._pending[key]
+
+    def _on_loaded(self, key: tuple, future: asyncio.Future):
+        self._pending.pop(key, None)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.debug(f'Не удалось загрузить {key}: {future.exception()}')
+            return
+        self.entries[key[0]][key] = CachedValue(future.result())
+
+    async def get(self, key: tuple, loader: Callable[[], Awaitable], use_cache: bool = True):
+        """use_cache=False - загрузить в обход кеша, не сохраняя результат (массовые проверки)"""
+        if not use_cache:
+            return await loader()
+        ttl, stale = self.ttl[key[0]]
+        entry: CachedValue | None = self.entries[key[0]].get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < ttl:
+                self.hits += 1
+                return entry.value
+            if age < ttl + stale:
+                self.stale_hits += 1
+                self._start(key, loader)
+                return entry.value
+        self.misses += 1
+        return await asyncio.shield(self._start(key, loader))
+
+    async def get_membership_data(self, bungie_id, membership_type=254) -> UserMembershipData:
+        return await self.get(('membership', int(bungie_id), int(membership_type)),
+                              DestinyUser(membership_id=bungie_id,
+                                          membership_type=membership_type).get_membership_data_by_id)
+
+    async def get_main_profile(self, bungie_id, membership_type=254) -> GroupUserInfoCard | None:
+        return select_main_profile(await self.get_membership_data(bungie_id, membership_type))
+
+    async def get_bungie_name(self, bungie_id, membership_type=254) -> str | None:
+        async def load():
+            bungie_name = (await DestinyUser(membership_id=bungie_id,
+                                             membership_type=membership_type).get_linked_profiles(
+                get_all_memberships=False)).bnet_membership
+            return bungie_name.full_bungie_name if bungie_name.bungie_global_display_name else None
+
+        return await self.get(('bungie_name', int(bungie_id), int(membership_type)), load)
+
+    async def get_profile(self, main_profile: GroupUserInfoCard,
+                          components: Iterable[DestinyComponentType],
+                          use_cache: bool = True) -> DestinyProfileResponse:
+        components = sorted(set(components), key=lambda component: component.value)
+        key = ('profile', int(main_profile.membership_id), tuple(component.value for component in components))
+        return await self.get(key, lambda: main_profile.get_profile(components=components), use_cache)
+
+    async def get_historical_stats(self, client, main_profile: GroupUserInfoCard,
+                                   groups: Iterable[DestinyStatsGroupType],
+                                   use_cache: bool = True) -> DestinyHistoricalStatsAccountResult:
+        groups = sorted(set(groups), key=lambda group: group.value)
+        key = ('historical_stats', int(main_profile.membership_id), tuple(group.value for group in groups))
+        return await self.get(key, lambda: client.api.get_historical_stats(
+            character_id=0,
+            destiny_membership_id=main_profile.membership_id,
+            membership_type=main_profile.membership_type,
+            groups=groups), use_cache)
+
+    def invalidate(self, *ids: int):
+        """Удаляет данные по bungie_id или id профилей Destiny, вместе с профилями из закешированных привязок"""
+        ids = {int(i) for i in ids}
+        memberships = self.entries['membership']
+        for key in [key for key in list(memberships.keys()) if key[1] in ids]:
+            entry: CachedValue | None = memberships.get(key)
+            if entry is not None:
+                ids.update(int(profile.membership_id) for profile in entry.value.destiny_memberships or [])
+        for entries in self.entries.values():
+            for key in [key for key in list(entries.keys()) if key[1] in ids]:
+                entries.pop(key, None)
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': {kind: len(entries) for kind, entries in self.entries.items()},
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'pending': len(self._pending),
+        }
+
+
+profile_cache = ProfileCache()
@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from utils.asset_registry import asset_registry
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', 2))
+
+_render_pool: ProcessPoolExecutor | None = None
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        # spawn - дочерние процессы не наследуют цикл событий и потоки бота
+        _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                           mp_context=multiprocessing.get_context('spawn'))
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+async def run_in_render_pool(function, *args):
+    loop = asyncio.get_running_loop()
+    task = functools.partial(function, *args)
+    try:
+        return await loop.run_in_executor(get_render_pool(), task)
+    except BrokenProcessPool:
+        logger.warning('Пул отрисовки завершился с ошибкой, пересоздаю')
+        shutdown_render_pool()
+        return await loop.run_in_executor(get_render_pool(), task)
+
+
+def image_to_png(image: Image.Image) -> bytes:
+    with io.BytesIO() as image_binary:
+        image.save(image_binary, 'PNG')
+        return image_binary.getvalue()
+
+
+def _render_png(draw_function, args, kwargs) -> tuple[bytes | None, dict]:
+    # Выполняется в процессе отрисовки, счетчики реестра ресурсов - свои у каждого процесса
+    image = draw_function(*args, **kwargs)
+    png = image_to_png(image) if image is not None else None
+    return png, {'pid': os.getpid(), **asset_registry.get_stats()}
+
+
+async def render_png(draw_function, *args, **kwargs) -> bytes | None:
+    """
+    Выполняет функцию отрисовки в пуле процессов и возвращает PNG.
+    draw_function должна быть функцией уровня модуля, а аргументы - сериализуемыми (pickle)
+    """
+    started_at = time.monotonic()
+    png, assets_stats = await run_in_render_pool(_render_png, draw_function, args, kwargs)
+    logger.debug(f'{draw_function.__name__} отрисовано за {time.monotonic() - started_at:.2f} сек. '
+                 f'(процесс {assets_stats["pid"]}: шрифтов {assets_stats["fonts"]}, '
+                 f'изображений {assets_stats["images"]}, попаданий {assets_stats["hits"]}, '
+                 f'промахов {assets_stats["misses"]})')
+    return png
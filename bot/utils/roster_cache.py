@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import hashlib
+import json
+from typing import List, Dict
+
+from bungio import singleton
+from bungio.models import GroupMember
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ORM.schemes.ClanRoster import ClanRoster
+from utils.logger import create_logger
+
+logger = create_logger(__name__)
+
+ROSTER_TTL = datetime.timedelta(minutes=15)
+
+# Кеш составов кланов в памяти процесса: clan_id -> ClanRoster (не привязан к сессии)
+_rosters: Dict[int, ClanRoster] = {}
+_locks: Dict[int, asyncio.Lock] = {}
+
+
+def roster_fingerprint(raw_members: List[dict]) -> str:
+    dump = json.dumps(raw_members, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+def _member_key(raw_member: dict):
+    return raw_member.get('destinyUserInfo', {}).get('membershipId')
+
+
+def is_roster_fresh(roster: ClanRoster | None, max_age: datetime.timedelta = ROSTER_TTL) -> bool:
+    if not roster or not roster.fetched_at:
+        return False
+    return datetime.datetime.now() - roster.fetched_at <= max_age
+
+
+async def fetch_raw_clan_members(clan_id) -> List[dict]:
+    client = singleton.client
+    raw_members = []
+    has_more = True
+    page = 0
+    while has_more:
+        response = await client.http.get_members_of_group(currentpage=page,
+                                                          group_id=clan_id,
+                                                          member_type=None,
+                                                          name_search=None)
+        response = response.get('Response', response)
+        has_more = response.get('hasMore', False)
+        page += 1
+        raw_members += response.get('results', [])
+    return raw_members
+
+
+async def build_members(raw_members: List[dict]) -> List[GroupMember]:
+    # Каждый вызов получает новые объекты - вызывающий код может изменять их без влияния на кеш
+    client = singleton.client
+    return list(await asyncio.gather(*[GroupMember.from_dict(data=raw_member, client=client)
+                                       for raw_member in raw_members]))
+
+
+async def load_rosters(db_engine, clan_ids: List[int]) -> Dict[int, ClanRoster]:
+    missing = [clan_id for clan_id in clan_ids if clan_id not in _rosters]
+    if missing and db_engine:
+        async with AsyncSession(db_engine, expire_on_commit=False) as session:
+            rosters = await session.scalars(select(ClanRoster).where(ClanRoster.clan_id.in_(missing)))
+            for roster in rosters:
+                _rosters[roster.clan_id] = roster
+    return {clan_id: _rosters[clan_id] for clan_id in clan_ids if clan_id in _rosters}
+
+
+async def refresh_roster(db_engine, clan_id) -> ClanRoster:
+    raw_members = await fetch_raw_clan_members(clan_id)
+    timestamp = datetime.datetime.now()
+    fingerprint = roster_fingerprint(raw_members)
+    old_roster = _rosters.get(clan_id)
+
+    if old_roster and old_roster.fingerprint == fingerprint:
+        changed_at = old_roster.changed_at
+    else:
+        changed_at = timestamp
+        if old_roster:
+            old_ids = {_member_key(raw_member) for raw_member in old_roster.members}
+            new_ids = {_member_key(raw_member) for raw_member in raw_members}
+            joined, left = new_ids - old_ids, old_ids - new_ids
+            if joined or left:
+                logger.info(f'Состав клана {clan_id} изменился: вступило {len(joined)}, покинуло {len(left)}')
+
+    roster = ClanRoster(clan_id=clan_id,
+                        members=raw_members,
+                        members_count=len(raw_members),
+                        fingerprint=fingerprint,
+                        fetched_at=timestamp,
+                        changed_at=changed_at)
+    if db_engine:
+        async with AsyncSession(db_engine, expire_on_commit=False) as session:
+            await session.merge(roster)
+            await session.commit()
+    _rosters[clan_id] = roster
+    return roster
+
+
+async def get_roster(db_engine, clan_id, max_age: datetime.timedelta = ROSTER_TTL, force=False) -> ClanRoster:
+    lock = _locks.setdefault(clan_id, asyncio.Lock())
+    async with lock:
+        roster = (await load_rosters(db_engine, [clan_id])).get(clan_id)
+        if force or not is_roster_fresh(roster, max_age):
+            roster = await refresh_roster(db_engine, clan_id)
+    return roster
+
+
+async def get_cached_clan_members(clan_id, db_engine=None,
+                                  max_age: datetime.timedelta = ROSTER_TTL, force=False) -> List[GroupMember]:
+    roster = await get_roster(db_engine, clan_id, max_age=max_age, force=force)
+    return await build_members(roster.members)
+
+
+async def get_cached_clans_members(db_engine, clan_ids: List[int],
+                                   max_age: datetime.timedelta = ROSTER_TTL) -> Dict[int, List[GroupMember]]:
+    rosters = await load_rosters(db_engine, clan_ids)
+    stale = [clan_id for clan_id in clan_ids if not is_roster_fresh(rosters.get(clan_id), max_age)]
+    logger.debug(f'Составы кланов: {len(clan_ids) - len(stale)} из кеша, {len(stale)} требуют обновления')
+    refreshed = await asyncio.gather(*[get_roster(db_engine, clan_id, max_age=max_age) for clan_id in stale])
+    rosters.update({roster.clan_id: roster for roster in refreshed})
+    members = await asyncio.gather(*[build_members(rosters[clan_id].members) for clan_id in clan_ids])
+    return dict(zip(clan_ids, members))
+
+
+async def invalidate_clan_members(clan_id, db_engine=None):
+    _rosters.pop(clan_id, None)
+    if db_engine:
+        async with AsyncSession(db_engine) as session:
+            await session.execute(delete(ClanRoster).where(ClanRoster.clan_id == clan_id))
+            await session.commit()
@@ -0,0 +1,216 @@
+import asyncio
+import datetime
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+import bungio
+from bungio.error import InvalidAuthentication, BadRequest
+from bungio.models import AuthData
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ORM.schemes.Token import Token
+from utils.logger import create_logger
+from utils.tokens import get_derived_key, sym_decrypt, sym_encrypt
+
+logger = create_logger(__name__)
+
+# Пока установлен, on_token_update не сохраняет токен - пакетное обновление сохраняет все токены одним запросом
+defer_token_save: ContextVar[bool] = ContextVar('defer_token_save', default=False)
+
+
+class TokensRefreshStats:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.total = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def __str__(self):
+        return f'обновлено {self.refreshed} из {self.total}, ошибок {self.failed}, повторов {self.retries} ' \
+               f'({time.monotonic() - self.started_at:.1f} сек.)'
+
+
+class TokenManager:
+    """
+    Расшифрованные AuthData по bungie_id.
+    Токены доступа обновляются в фоне до истечения (refresh_expiring), одновременные обновления
+    одного аккаунта объединяются. Аккаунты, которые долго не использовались, вытесняются вместо обновления
+    """
+
+    def __init__(self, db_engine, refresh_before: datetime.timedelta = datetime.timedelta(minutes=10),
+                 keep_unused: datetime.timedelta = datetime.timedelta(hours=2), concurrency: int = 5):
+        self.db_engine = db_engine
+        self.refresh_before = refresh_before
+        self.keep_unused = keep_unused
+        self.concurrency = concurrency
+        self.auth_data: Dict[int, AuthData] = {}
+        self.last_used: Dict[int, datetime.datetime] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    async def load(self, bungie_id: int) -> AuthData | None:
+        async with AsyncSession(self.db_engine) as session:
+            token = (await session.scalars(select(Token).where(Token.bungie_id == bungie_id))).first()
+        if token is None:
+            return None
+        return await self.make_auth(token)
+
+    @staticmethod
+    async def make_auth(token: Token) -> AuthData:
+        refresh_token = sym_decrypt(token.token, await get_derived_key(token.bungie_id))
+        return AuthData(refresh_token=refresh_token,
+                        refresh_token_expiry=bungio.utils.get_now_with_tz(),
+                        membership_type=254,
+                        membership_id=token.bungie_id,
+                        token='',
+                        token_expiry=bungio.utils.get_now_with_tz() - datetime.timedelta(minutes=10),
+                        bungie_name=None
+                        )
+
+    async def _refresh(self, bungie_id: int) -> AuthData | None:
+        auth = self.auth_data.get(bungie_id)
+        if auth is None:
+            auth = await self.load(bungie_id)
+            if auth is None:
+                return None
+        else:
+            # bungio обновляет токен только после истечения - помечаем его истекшим заранее
+            auth.token_expiry = bungio.utils.get_now_with_tz() - datetime.timedelta(minutes=10)
+        await auth.refresh()
+        return auth
+
+    def _on_refreshed(self, bungie_id: int, future: asyncio.Future):
+        # Токен, сброшенный через invalidate во время обновления, не сохраняется
+        if self._pending.get(bungie_id) is not future:
+            return
+        self._pending.pop(bungie_id)
+        if future.cancelled() or future.exception() is not None:
+            return
+        if future.result() is not None:
+            self.auth_data[bungie_id] = future.result()
+
+    async def refresh(self, bungie_id: int) -> AuthData | None:
+        # Одновременные запросы одного аккаунта ждут одно обновление
+        if bungie_id not in self._pending:
+            future = asyncio.ensure_future(self._refresh(bungie_id))
+            future.add_done_callback(lambda f: self._on_refreshed(bungie_id, f))
+            self._pending[bungie_id] = future
+        return await asyncio.shield(self._pending[bungie_id])
+
+    def invalidate(self, bungie_id: int):
+        """Забывает токен аккаунта (например, после повторной регистрации) - следующий запрос загрузит его из базы"""
+        bungie_id = int(bungie_id)
+        self.auth_data.pop(bungie_id, None)
+        self.last_used.pop(bungie_id, None)
+        self._pending.pop(bungie_id, None)
+
+    def is_valid(self, auth: AuthData) -> bool:
+        return auth.token_expiry > bungio.utils.get_now_with_tz()
+
+    async def get_valid_auth(self, bungie_id: int) -> AuthData | None:
+        bungie_id = int(bungie_id)
+        self.last_used[bungie_id] = datetime.datetime.now()
+        auth = self.auth_data.get(bungie_id)
+        if auth is not None and self.is_valid(auth):
+            return auth
+        return await self.refresh(bungie_id)
+
+    def evict_unused(self):
+        unused_since = datetime.datetime.now() - self.keep_unused
+        for bungie_id in [bungie_id for bungie_id in self.auth_data
+                          if self.last_used.get(bungie_id, unused_since) <= unused_since]:
+            self.auth_data.pop(bungie_id, None)
+            self.last_used.pop(bungie_id, None)
+
+    async def refresh_expiring(self) -> int:
+        """Обновляет токены, истекающие в ближайшие refresh_before. Возвращает число обновленных"""
+        self.evict_unused()
+        expire_date = bungio.utils.get_now_with_tz() + self.refresh_before
+        expiring = [bungie_id for bungie_id, auth in self.auth_data.items() if auth.token_expiry <= expire_date]
+        if not expiring:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(bungie_id):
+            async with semaphore:
+                try:
+                    return await self.refresh(bungie_id) is not None
+                except Exception as e:
+                    logger.warning(f'Не удалось обновить токен {bungie_id}: {e}')
+                    self.auth_data.pop(bungie_id, None)
+                    return False
+
+        refreshed = sum(await asyncio.gather(*[refresh_one(bungie_id) for bungie_id in expiring]))
+        logger.info(f'Заранее обновлено токенов доступа: {refreshed} из {len(expiring)}')
+        return refreshed
+
+    async def refresh_stored_token(self, token: Token) -> AuthData:
+        if token.bungie_id in self.auth_data:
+            auth = await self.refresh(token.bungie_id)
+        else:
+            auth = await self.make_auth(token)
+            await auth.refresh()
+        return auth
+
+    async def save_tokens(self, refreshed: List[Tuple[Token, AuthData]]):
+        values = [{'bungie_id': token.bungie_id,
+                   'discord_id': token.discord_id,
+                   'token': sym_encrypt(auth.refresh_token, await get_derived_key(token.bungie_id)),
+                   'token_expire': auth.refresh_token_expiry.replace(tzinfo=None),
+                   'token_type': token.token_type}
+                  for token, auth in refreshed]
+        query = insert(Token).values(values)
+        query = query.on_conflict_do_update(index_elements=[Token.bungie_id],
+                                            set_={'token': query.excluded.token,
+                                                  'token_expire': query.excluded.token_expire})
+        async with AsyncSession(self.db_engine) as session:
+            await session.execute(query)
+            await session.commit()
+
+    async def refresh_stored_tokens(self, expire_in: datetime.timedelta = datetime.timedelta(weeks=1),
+                                    concurrency: int = 10, retries: int = 3, backoff: float = 2.0) \
+            -> TokensRefreshStats:
+        """
+        Обновляет сохраненные токены обновления, истекающие в течение expire_in.
+        Не более concurrency одновременно, временные ошибки повторяются с экспоненциальной задержкой,
+        результаты сохраняются одним запросом
+        """
+        stats = TokensRefreshStats()
+        expire_date = datetime.datetime.now() + expire_in
+        async with AsyncSession(self.db_engine) as session:
+            tokens = list(await session.scalars(select(Token).where(Token.token_expire <= expire_date)))
+        stats.total = len(tokens)
+        semaphore = asyncio.Semaphore(concurrency)
+        refreshed: List[Tuple[Token, AuthData]] = []
+
+        async def refresh_one(token: Token):
+            async with semaphore:
+                for attempt in range(retries):
+                    try:
+                        refreshed.append((token, await self.refresh_stored_token(token)))
+                        stats.refreshed += 1
+                        return
+                    except (InvalidAuthentication, BadRequest) as e:
+                        # Токен отозван или истек - повтор не поможет
+                        logger.warning(f'Токен {token.bungie_id} недействителен: {e}')
+                        break
+                    except Exception as e:
+                        if attempt + 1 < retries:
+                            stats.retries += 1
+                            await asyncio.sleep(backoff ** attempt)
+                        else:
+                            logger.warning(f'Не удалось обновить токен {token.bungie_id}: {e}')
+                stats.failed += 1
+
+        context_token = defer_token_save.set(True)
+        try:
+            await asyncio.gather(*[refresh_one(token) for token in tokens])
+        finally:
+            defer_token_save.reset(context_token)
+        if refreshed:
+            await self.save_tokens(refreshed)
+        logger.info(f'Обновление токенов: {stats}')
+        return stats
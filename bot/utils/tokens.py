@@ -24,6 +24,17 @@ def encode_key(key_value=None):
     return key.hexdigest().encode()
 
 
+# Ключи шифрования токенов по bungie_id - не зависят от токена, запрос к Bungie выполняется один раз
+derived_keys: dict[int, bytes] = {}
+
+
+async def get_derived_key(membership_id) -> bytes:
+    membership_id = int(membership_id)
+    if membership_id not in derived_keys:
+        derived_keys[membership_id] = encode_key(key_value=await get_encode_key(membership_id))
+    return derived_keys[membership_id]
+
+
 def sym_encrypt(token, key_value):
     token_hash = SHA256.new(token.encode())
     token_with_hash = token.encode() + token_hash.hexdigest().encode()
@@ -1,7 +1,7 @@
 import datetime
 from typing import List
 
-from bungio.models import DestinyUser, GroupType, DestinyClan, GroupMember, DestinyHistoricalStatsAccountResult, \
+from bungio.models import GroupType, DestinyClan, GroupMember, DestinyHistoricalStatsAccountResult, \
     DestinyRecordComponent, DestinyMetricComponent, DestinyComponentType, DestinyProfileResponse, DestinyStatsGroupType, \
     SingleComponentResponseOfDestinyMetricsComponent, SingleComponentResponseOfDestinyProfileRecordsComponent, GroupV2, \
     GroupUserInfoCard, GroupMembership
@@ -14,12 +14,12 @@ from utils.ResourseConverters import get_raid_report_link, get_dungeon_report_li
     get_trials_report_link, get_nightfall_report_link, get_destiny_tracker_link, get_triump_report_link
 from utils.bungio_client import CustomClient
 from utils.db_utils import get_full_clans_ids
+from utils.profile_cache import profile_cache
 
 
 async def get_group_list_by_bungie_id(membership_id, membership_type=254, auth=None) -> List[GroupMembership]:
     user_group_list = []
-    user = DestinyUser(membership_id=membership_id, membership_type=membership_type)
-    memberships = (await user.get_membership_data_by_id()).destiny_memberships
+    memberships = (await profile_cache.get_membership_data(membership_id, membership_type)).destiny_memberships
     for membership in memberships:
         groups = await membership.get_groups_for_member(filter=0, group_type=1, auth=auth)
         for group in groups.results:
@@ -30,8 +30,7 @@ async def get_group_list_by_bungie_id(membership_id, membership_type=254, auth=N
 
 async def get_clan_list_by_bungie_id(membership_id, membership_type=254, auth=None) -> List[GroupV2]:
     user_group_list = []
-    user = DestinyUser(membership_id=membership_id, membership_type=membership_type)
-    memberships = (await user.get_membership_data_by_id()).destiny_memberships
+    memberships = (await profile_cache.get_membership_data(membership_id, membership_type)).destiny_memberships
     for membership in memberships:
         groups = await membership.get_groups_for_member(filter=0, group_type=1, auth=auth)
         for group in groups.results:
@@ -73,10 +72,7 @@ async def get_all_tokens_bungie_id_by_discord_id(db_engine, discord_id):
 
 
 async def get_bungie_name_by_bungie_id(membership_id, membership_type):
-    bungie_name = (await DestinyUser(membership_id=membership_id,
-                                     membership_type=membership_type).get_linked_profiles(
-        get_all_memberships=False)).bnet_membership
-    return bungie_name.full_bungie_name if bungie_name.bungie_global_display_name else None
+    return await profile_cache.get_bungie_name(membership_id, membership_type)
 
 
 async def get_bungie_name_by_discord_id(db_engine, discord_id):
@@ -87,43 +83,47 @@ async def get_bungie_name_by_discord_id(db_engine, discord_id):
     return bungie_name
 
 
-async def get_main_destiny_profile(bungie_id, membership_type=254):
-    member_main_profile = None
-    member_profiles = await \
-        DestinyUser(membership_id=bungie_id, membership_type=membership_type).get_membership_data_by_id()
-    if member_profiles.primary_membership_id:
-        for profile in member_profiles.destiny_memberships:
-            if member_profiles.primary_membership_id == profile.membership_id:
-                member_main_profile = profile
-    elif len(member_profiles.destiny_memberships) == 1:
-        member_main_profile = member_profiles.destiny_memberships[0]
-    elif len(member_profiles.destiny_memberships) > 1:
-        for profile in member_profiles.destiny_memberships:
-            if profile.membership_type == 3:
-                member_main_profile = profile
-    return member_main_profile
-
-
-async def get_user_stats(bungie_id, client: CustomClient) -> (SingleComponentResponseOfDestinyMetricsComponent,
-                                                              SingleComponentResponseOfDestinyProfileRecordsComponent,
-                                                              DestinyHistoricalStatsAccountResult):
+async def get_main_destiny_profile(bungie_id, membership_type=254) -> GroupUserInfoCard | None:
+    return await profile_cache.get_main_profile(bungie_id, membership_type)
+
+
+USER_STATS_COMPONENTS = [DestinyComponentType.METRICS,
+                         DestinyComponentType.RECORDS]
+USER_STATS_GROUPS = [DestinyStatsGroupType.NONE,
+                     DestinyStatsGroupType.GENERAL,
+                     DestinyStatsGroupType.WEAPONS,
+                     DestinyStatsGroupType.MEDALS,
+                     DestinyStatsGroupType.RESERVED_GROUPS,
+                     DestinyStatsGroupType.LEADERBOARD,
+                     DestinyStatsGroupType.ACTIVITY,
+                     DestinyStatsGroupType.UNIQUE_WEAPON,
+                     DestinyStatsGroupType.INTERNAL]
+
+
+async def get_user_stats(bungie_id, client: CustomClient,
+                         components: List[DestinyComponentType] | None = None,
+                         stat_groups: List[DestinyStatsGroupType] | None = None,
+                         use_cache: bool = True) -> \
+        (SingleComponentResponseOfDestinyMetricsComponent,
+         SingleComponentResponseOfDestinyProfileRecordsComponent,
+         DestinyHistoricalStatsAccountResult):
+    """
+    components и stat_groups - какие компоненты профиля и группы статистики загружать (None - все).
+    Для незагруженных компонентов возвращается None, для пустого списка групп - пустая статистика.
+    use_cache=False - профиль и статистика загружаются в обход кеша
+    """
+    components = USER_STATS_COMPONENTS if components is None else components
+    stat_groups = USER_STATS_GROUPS if stat_groups is None else stat_groups
     main_profile = await get_main_destiny_profile(bungie_id)
-    metrics_and_records: DestinyProfileResponse = await main_profile.get_profile(components=
-                                                                                 [DestinyComponentType.METRICS,
-                                                                                  DestinyComponentType.RECORDS])
-    historical_stats = await client.api.get_historical_stats(character_id=0,
-                                                             destiny_membership_id=main_profile.membership_id,
-                                                             membership_type=main_profile.membership_type,
-                                                             groups=[DestinyStatsGroupType.NONE,
-                                                                     DestinyStatsGroupType.GENERAL,
-                                                                     DestinyStatsGroupType.WEAPONS,
-                                                                     DestinyStatsGroupType.MEDALS,
-                                                                     DestinyStatsGroupType.RESERVED_GROUPS,
-                                                                     DestinyStatsGroupType.LEADERBOARD,
-                                                                     DestinyStatsGroupType.ACTIVITY,
-                                                                     DestinyStatsGroupType.UNIQUE_WEAPON,
-                                                                     DestinyStatsGroupType.INTERNAL],
-                                                             )
+    metrics, records, historical_stats = None, None, {}
+    if components:
+        metrics_and_records: DestinyProfileResponse = await profile_cache.get_profile(main_profile, components,
+                                                                                      use_cache)
+        metrics = metrics_and_records.metrics
+        records = metrics_and_records.profile_records
+    if stat_groups:
+        historical_stats = await profile_cache.get_historical_stats(client, main_profile, stat_groups,
+                                                                       use_cache)
     # historical_stats = await main_profile.get_historical_stats_for_account(
     #     groups=[DestinyStatsGroupType.NONE,
     #             DestinyStatsGroupType.GENERAL,
@@ -134,8 +134,6 @@ async def get_user_stats(bungie_id, client: CustomClient) -> (SingleComponentRes
     #             DestinyStatsGroupType.ACTIVITY,
     #             DestinyStatsGroupType.UNIQUE_WEAPON,
     #             DestinyStatsGroupType.INTERNAL])
-    metrics = metrics_and_records.metrics
-    records = metrics_and_records.profile_records
     return metrics, records, historical_stats
 
 